@@ -0,0 +1,62 @@
+'''
+Compression ratio against encode/decode throughput of every block format and compression codec.
+Scales datasets/demographic.csv up by repeating it, splits it into blocks the way put does and measures each combination.
+No database is needed, but the codecs are imported from combined_flask, so run it from the project directory with the .env.
+Usage: python benchmarks/compression.py [--scale 20] [--block-size 1048576]
+'''
+import argparse
+import sys
+import time
+import numpy as np
+import pandas as pd
+from math import ceil
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+from combined_flask import BLOCK_CODECS, COMPRESSION_CODECS, BlockInfo, decode_block
+
+DATASET = Path(__file__).parent.parent / "datasets" / "demographic.csv"
+
+def make_blocks(scale: int, block_size: int) -> tuple[list, int]:
+    df = pd.read_csv(DATASET)
+    df = pd.concat([df]*scale, ignore_index=True).reset_index()
+    csv_size = len(df.to_csv(index=False).encode())
+    rows_per_block = ceil(df.shape[0]*block_size/csv_size)
+    return [df.iloc[start:start+rows_per_block] for start in range(0, df.shape[0], rows_per_block)], csv_size
+
+def measure(chunks: list, csv_size: int, block_format: str, compression: str) -> dict:
+    codec = BLOCK_CODECS[block_format]
+    start = time.perf_counter()
+    stored = []
+    for chunk in chunks:
+        raw = codec.encode(chunk)
+        stored.append((COMPRESSION_CODECS[compression].compress(raw), len(raw)))
+    encode_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    for content, raw_bytes in stored:
+        decode_block(BlockInfo("", "", len(content), 0, "", 1, "", 2, block_format, compression, raw_bytes), content)
+    decode_seconds = time.perf_counter() - start
+    stored_size = sum(len(content) for content, _ in stored)
+    return {
+        "stored MB": stored_size/2**20,
+        "ratio": csv_size/stored_size,
+        "encode MB/s": csv_size/2**20/encode_seconds,
+        "decode MB/s": csv_size/2**20/decode_seconds
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=int, default=20)
+    parser.add_argument("--block-size", type=int, default=1048576)
+    args = parser.parse_args()
+    chunks, csv_size = make_blocks(args.scale, args.block_size)
+    print(f"{csv_size/2**20:.1f} MB of CSV in {len(chunks)} blocks")
+    print(f"{'format':<8} {'compression':<12} {'stored MB':>10} {'ratio':>7} {'encode MB/s':>12} {'decode MB/s':>12}")
+    for block_format in BLOCK_CODECS:
+        for compression in COMPRESSION_CODECS:
+            result = measure(chunks, csv_size, block_format, compression)
+            print(f"{block_format:<8} {compression:<12} {result['stored MB']:>10.2f} {result['ratio']:>7.2f} " + \
+                f"{result['encode MB/s']:>12.1f} {result['decode MB/s']:>12.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+'''
+Block write throughput of put, one INSERT per replica and block against the batched writes of BlockWriter, in turn and
+uploaded to the datanodes in parallel.
+Builds a scratch database from init.sql, scales datasets/demographic.csv up by repeating it, splits it into blocks
+the way put does and stores them both ways on the registered datanode tables, reporting MB/s of CSV ingested.
+Usage: python benchmarks/ingest.py [--scale 20] [--block-size 32768]
+'''
+import argparse
+import os
+import pymysql
+import sys
+import time
+from dotenv import load_dotenv
+from pathlib import Path
+
+load_dotenv()
+BENCH_DATABASE = os.environ.get('BENCH_DATABASE', 'edfs_bench')
+# combined_flask connects to DATABASE, so point it at the scratch database before importing it
+os.environ['DATABASE'] = BENCH_DATABASE
+
+sys.path.append(str(Path(__file__).parent.parent))
+import combined_flask
+from combined_flask import BLOCK_INSERT, BlockWriter, block_replicas, datanodes, mysql_connection, store_block
+from compression import make_blocks
+from migrate import split_statements
+
+HOST_NAME = os.environ.get('HOST')
+DB_USERNAME = os.environ.get('USERNAME')
+DB_PASSWORD = os.environ.get('PASSWORD')
+INIT_SQL = Path(__file__).parent.parent / "init.sql"
+
+class RowWriter(BlockWriter):
+    '''
+    BlockWriter writing every replica and Block_info_table row with its own INSERT, the way put used to
+    '''
+    def __init__(self, cursor) -> None:
+        super().__init__()
+        self.cursor = cursor
+
+    def add(self, block, content) -> None:
+        self.added.append(block)
+        for datanode_num, data_blk_id in block_replicas(block):
+            self.cursor.execute(f"INSERT INTO {datanodes.table(datanode_num)} VALUES (%s, %s)", (data_blk_id, content))
+
+    def insert_blocks(self, cursor, inode_num: str) -> None:
+        for block in self.added:
+            cursor.execute(BLOCK_INSERT, (block.blk_id, inode_num, *block[1:]))
+
+def create_database() -> None:
+    conn = pymysql.connect(host=HOST_NAME, user=DB_USERNAME, password=DB_PASSWORD)
+    cursor = conn.cursor()
+    cursor.execute(f"DROP DATABASE IF EXISTS {BENCH_DATABASE}")
+    cursor.execute(f"CREATE DATABASE {BENCH_DATABASE}")
+    cursor.execute(f"USE {BENCH_DATABASE}")
+    for statement in split_statements(INIT_SQL.read_text()):
+        if not statement.upper().startswith(("DROP DATABASE", "CREATE DATABASE", "USE ")):
+            cursor.execute(statement)
+    cursor.execute("INSERT INTO Namenode (inode_num, node_type, name, replication, ctime, permission) VALUES ('bench', '-', '/bench.csv', 2, NOW(), 644)")
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+def measure(row_writes: bool, chunks: list, csv_size: int, parallel: bool = False) -> float:
+    combined_flask.PUT_PARALLEL = parallel
+    start = time.perf_counter()
+    with mysql_connection() as conn:
+        cursor = conn.cursor()
+        with RowWriter(cursor) if row_writes else BlockWriter() as writer:
+            for offset, chunk in enumerate(chunks):
+                store_block(writer, chunk, "0", offset, "csv", "none")
+        conn.begin()
+        writer.insert_blocks(cursor, "bench")
+        conn.commit()
+        cursor.execute("DELETE FROM Block_info_table")
+        for datanode_num in datanodes.datanodes:
+            cursor.execute(f"DELETE FROM {datanodes.table(datanode_num)}")
+        cursor.close()
+    return csv_size/2**20/(time.perf_counter() - start)
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=int, default=20)
+    parser.add_argument("--block-size", type=int, default=32768)
+    args = parser.parse_args()
+    create_database()
+    chunks, csv_size = make_blocks(args.scale, args.block_size)
+    print(f"{csv_size/2**20:.1f} MB of CSV in {len(chunks)} blocks")
+    print(f"one INSERT per row: {measure(True, chunks, csv_size):.1f} MB/s")
+    print(f"batched:            {measure(False, chunks, csv_size):.1f} MB/s")
+    print(f"batched, parallel:  {measure(False, chunks, csv_size, True):.1f} MB/s")
+    conn = pymysql.connect(host=HOST_NAME, user=DB_USERNAME, password=DB_PASSWORD)
+    conn.cursor().execute(f"DROP DATABASE {BENCH_DATABASE}")
+    conn.close()
+
+if __name__ == "__main__":
+    main()
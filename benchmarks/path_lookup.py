@@ -0,0 +1,113 @@
+'''
+Before/after benchmark for migration 002 (path digest index and composite Block_info_table indexes).
+Builds a scratch database with the pre-migration schema, fills it with synthetic inodes, prints the EXPLAIN plan
+and the latency of the path lookup and partition read queries, applies the migration and measures again.
+Usage: python benchmarks/path_lookup.py [--inodes 1000000] [--lookups 200]
+'''
+import argparse
+import os
+import pymysql
+import sys
+import time
+from dotenv import load_dotenv
+from pathlib import Path
+from random import randrange
+
+sys.path.append(str(Path(__file__).parent.parent))
+from migrate import split_statements
+
+load_dotenv()
+
+HOST_NAME = os.environ.get('HOST')
+DB_USERNAME = os.environ.get('USERNAME')
+DB_PASSWORD = os.environ.get('PASSWORD')
+BENCH_DATABASE = os.environ.get('BENCH_DATABASE', 'edfs_bench')
+MIGRATION = Path(__file__).parent.parent / "migrations" / "002_path_digest_index.sql"
+BATCH_SIZE = 10000
+
+SCHEMA = [
+    "CREATE TABLE Namenode (inode_num VARCHAR(36), node_type CHAR(1) NOT NULL, name VARCHAR(1000) NOT NULL, " + \
+        "replication INT, mtime TIMESTAMP NULL, atime TIMESTAMP NULL, ctime TIMESTAMP NOT NULL, permission SMALLINT NOT NULL, " + \
+        "PRIMARY KEY (inode_num))",
+    "CREATE TABLE Block_info_table (blk_id VARCHAR(32), file_inode VARCHAR(36) NOT NULL, hash_attribute VARCHAR(32), " + \
+        "num_bytes INT NOT NULL, offset SMALLINT NOT NULL, replica1_data_blk_id VARCHAR(32) NOT NULL, " + \
+        "replica1_datanode_num SMALLINT NOT NULL, replica2_data_blk_id VARCHAR(32) NOT NULL, replica2_datanode_num SMALLINT NOT NULL, " + \
+        "PRIMARY KEY (blk_id), FOREIGN KEY (file_inode) REFERENCES Namenode(inode_num) ON DELETE CASCADE)"
+]
+
+def file_name(i: int) -> str:
+    return f"/bench/dir_{i // 1000}/file_{i}.csv"
+
+def populate(cursor, conn, inodes: int) -> None:
+    for start in range(0, inodes, BATCH_SIZE):
+        end = min(start + BATCH_SIZE, inodes)
+        cursor.executemany(
+            "INSERT INTO Namenode (inode_num, node_type, name, replication, mtime, atime, ctime, permission) " + \
+                "VALUES (%s, '-', %s, 2, NULL, NULL, NOW(), 644)",
+            [(f"inode_{i}", file_name(i)) for i in range(start, end)]
+        )
+        cursor.executemany(
+            "INSERT INTO Block_info_table VALUES (%s, %s, %s, 100, %s, %s, 1, %s, 2)",
+            [(f"blk_{i}_{o}", f"inode_{i}", str(o), o, f"r1_{i}_{o}", f"r2_{i}_{o}") for i in range(start, end) for o in range(2)]
+        )
+        conn.commit()
+
+def queries(path: str, digest: bool) -> dict:
+    condition = f"nn.name_digest = UNHEX(MD5('{path}')) AND nn.name = '{path}'" if digest else f"nn.name = '{path}'"
+    return {
+        "path lookup": f"SELECT nn.inode_num FROM Namenode nn WHERE {condition}",
+        "partition ids": "SELECT bi.offset, bi.replica1_data_blk_id FROM Block_info_table bi " + \
+            f"INNER JOIN Namenode nn ON nn.inode_num = bi.file_inode WHERE {condition} ORDER BY bi.offset",
+        "partition by offset": "SELECT bi.replica1_data_blk_id FROM Block_info_table bi " + \
+            f"INNER JOIN Namenode nn ON nn.inode_num = bi.file_inode WHERE {condition} AND bi.offset = 1",
+        "partition by hash": "SELECT bi.offset FROM Block_info_table bi " + \
+            f"INNER JOIN Namenode nn ON nn.inode_num = bi.file_inode WHERE {condition} AND bi.hash_attribute = '1'"
+    }
+
+def measure(cursor, inodes: int, lookups: int, digest: bool) -> None:
+    for label, query in queries(file_name(inodes // 2), digest).items():
+        cursor.execute("EXPLAIN " + query)
+        print(f"EXPLAIN {label}:")
+        for row in cursor.fetchall():
+            print("   ", row)
+    paths = [file_name(randrange(inodes)) for _ in range(lookups)]
+    for label in queries("", digest):
+        latencies = []
+        for path in paths:
+            start = time.perf_counter()
+            cursor.execute(queries(path, digest)[label])
+            cursor.fetchall()
+            latencies.append(time.perf_counter() - start)
+        latencies.sort()
+        print(f"{label}: p50 {latencies[len(latencies)//2]*1000:.3f} ms, " + \
+            f"p99 {latencies[int(len(latencies)*0.99)]*1000:.3f} ms, mean {sum(latencies)/len(latencies)*1000:.3f} ms")
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--inodes", type=int, default=1000000)
+    parser.add_argument("--lookups", type=int, default=200)
+    args = parser.parse_args()
+    conn = pymysql.connect(host=HOST_NAME, user=DB_USERNAME, password=DB_PASSWORD)
+    cursor = conn.cursor()
+    cursor.execute(f"DROP DATABASE IF EXISTS {BENCH_DATABASE}")
+    cursor.execute(f"CREATE DATABASE {BENCH_DATABASE}")
+    cursor.execute(f"USE {BENCH_DATABASE}")
+    for statement in SCHEMA:
+        cursor.execute(statement)
+    start = time.perf_counter()
+    populate(cursor, conn, args.inodes)
+    print(f"Loaded {args.inodes} inodes in {time.perf_counter() - start:.1f} s")
+    print("== Before migration 002 ==")
+    measure(cursor, args.inodes, args.lookups, False)
+    start = time.perf_counter()
+    for statement in split_statements(MIGRATION.read_text()):
+        cursor.execute(statement)
+    print(f"Applied migration 002 in {time.perf_counter() - start:.1f} s")
+    print("== After migration 002 ==")
+    measure(cursor, args.inodes, args.lookups, True)
+    cursor.execute(f"DROP DATABASE {BENCH_DATABASE}")
+    cursor.close()
+    conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,58 @@
+import csv
+import heapq
 import json
+import lzma
+import mmap
 import numpy as np
 import os
 import pandas as pd
 import pymysql
+import queue
+import re
 import requests
 import string
+import threading
 import time
+import zlib
 from ast import literal_eval
+from base64 import b64decode, b64encode
+from bisect import bisect
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from contextlib import contextmanager
 from datetime import datetime
-from io import StringIO
+from io import BytesIO, RawIOBase, StringIO
 from dotenv import load_dotenv
-from flask import Flask, request
+from flask import Flask, Response, request, send_file, stream_with_context
 from flask_cors import CORS
+from fnmatch import fnmatchcase
+from hashlib import md5
+from itertools import chain
 from math import ceil, inf
-from multiprocessing import Pool
+from multiprocessing import Pool, parent_process
+from operator import itemgetter
 from pathlib import Path
+from pymysql.constants import SERVER_STATUS
 from random import choices, sample
-from sys import getsizeof
 from typing import Callable, Union
+from uuid import uuid4
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import Data, Epilogue, File, MultipartDecoder, NeedData
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
 
 load_dotenv()
 
@@ -33,6 +68,39 @@ DEFAULT_DIR_PERMISSION = os.environ.get('DEFAULT_DIR_PERMISSION')
 DEFAULT_FILE_PERMISSION = os.environ.get('DEFAULT_FILE_PERMISSION')
 REPLICATION_FACTOR = 2
 MAX_THREADS = int(os.environ.get('MAX_THREADS'))
+NAMESPACE_SYNC_INTERVAL = float(os.environ.get('NAMESPACE_SYNC_INTERVAL', 5))
+MYSQL_POOL_SIZE = int(os.environ.get('MYSQL_POOL_SIZE', 10))
+MYSQL_WORKER_POOL_SIZE = int(os.environ.get('MYSQL_WORKER_POOL_SIZE', 2))
+MYSQL_POOL_TIMEOUT = float(os.environ.get('MYSQL_POOL_TIMEOUT', 30))
+MYSQL_POOL_RECYCLE = float(os.environ.get('MYSQL_POOL_RECYCLE', 3600))
+MYSQL_POOL_PING_INTERVAL = float(os.environ.get('MYSQL_POOL_PING_INTERVAL', 30))
+RM_BATCH_SIZE = int(os.environ.get('RM_BATCH_SIZE', 1000))
+READ_BATCH_SIZE = int(os.environ.get('READ_BATCH_SIZE', 64))
+BLOCK_FORMAT = os.environ.get('BLOCK_FORMAT', 'csv')
+BLOCK_COMPRESSION = os.environ.get('BLOCK_COMPRESSION', 'none')
+PARTITION_CACHE_BYTES = int(os.environ.get('PARTITION_CACHE_BYTES', 268435456))
+HEDGE_READS = os.environ.get('HEDGE_READS', 'true').lower() in ('1', 'true', 'yes')
+HEDGE_PERCENTILE = float(os.environ.get('HEDGE_PERCENTILE', 95))
+HEDGE_DELAY = float(os.environ.get('HEDGE_DELAY', 0.05))
+HEDGE_MIN_SAMPLES = int(os.environ.get('HEDGE_MIN_SAMPLES', 20))
+HEDGE_WINDOW = int(os.environ.get('HEDGE_WINDOW', 1000))
+HEDGE_THREADS = int(os.environ.get('HEDGE_THREADS', 8))
+DATANODE_VNODES = int(os.environ.get('DATANODE_VNODES', 128))
+DATANODE_REFRESH_INTERVAL = float(os.environ.get('DATANODE_REFRESH_INTERVAL', 30))
+DATANODE_FSYNC = os.environ.get('DATANODE_FSYNC', 'true').lower() in ('1', 'true', 'yes')
+PUT_CHUNK_ROWS = int(os.environ.get('PUT_CHUNK_ROWS', 100000))
+PUT_MAX_OPEN_PARTITIONS = int(os.environ.get('PUT_MAX_OPEN_PARTITIONS', 64))
+PUT_BATCH_BYTES = int(os.environ.get('PUT_BATCH_BYTES', 8388608))
+PUT_RANGE_SAMPLE_ROWS = int(os.environ.get('PUT_RANGE_SAMPLE_ROWS', 100000))
+PUT_BLOCK_TOLERANCE = float(os.environ.get('PUT_BLOCK_TOLERANCE', 0.1))
+UPLOAD_READ_BYTES = int(os.environ.get('UPLOAD_READ_BYTES', 1048576))
+UPLOAD_READ_AHEAD = int(os.environ.get('UPLOAD_READ_AHEAD', 8))
+PUT_PARALLEL = os.environ.get('PUT_PARALLEL', 'true').lower() in ('1', 'true', 'yes')
+PUT_MAX_PENDING_BATCHES = int(os.environ.get('PUT_MAX_PENDING_BATCHES', 8))
+METADATA_MODE = os.environ.get('METADATA_MODE', 'mysql')
+FSIMAGE_DIR = os.environ.get('FSIMAGE_DIR', 'fsimage')
+CHECKPOINT_INTERVAL = float(os.environ.get('CHECKPOINT_INTERVAL', 300))
+CHECKPOINT_EDITS = int(os.environ.get('CHECKPOINT_EDITS', 10000))
 
 FIREBASE_URL = os.environ.get('FIREBASE_URL')
 FIREBASE_DEFAULT_DIR_PERMISSION = os.environ.get('FIREBASE_DEFAULT_DIR_PERMISSION')
@@ -47,6 +115,1589 @@ INODE_DIRECTORY_SECTION = "inode_directory_section/"
 INODE = "inodes/"
 
 # MySQL APIS
+class PoolTimeout(Exception):
+    pass
+
+class ConnectionPool:
+    '''
+    Bounded, thread-safe pool of MySQL connections.
+    Connections are opened lazily up to max_size. Idle connections are pinged before reuse if they have
+    been idle for more than ping_interval seconds and are replaced once they are older than recycle seconds.
+    Pooled connections run in autocommit mode, so writers have to call conn.begin() and conn.commit().
+    Connections go to HOST/DATABASE unless the pool is for a datanode registered on another MySQL instance.
+    '''
+    def __init__(self, max_size: int, timeout: float, recycle: float, ping_interval: float, location: tuple = None) -> None:
+        self.max_size = max_size
+        self.location = location
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_interval = ping_interval
+        self.cond = threading.Condition()
+        self.idle = []
+        self.created_at = {}
+        self.size = 0
+        self.stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_seconds": 0.0,
+            "max_wait_seconds": 0.0,
+            "timeouts": 0,
+            "connections_created": 0,
+            "connections_recycled": 0,
+            "failed_health_checks": 0,
+            "discarded": 0
+        }
+
+    def _connect(self) -> pymysql.connections.Connection:
+        host, port, database = self.location or (HOST_NAME, None, DATABASE)
+        conn = pymysql.connect(
+            host=host,
+            port=port or 3306,
+            user=DB_USERNAME, 
+            password = DB_PASSWORD,
+            database=database,
+            autocommit=True
+        )
+        self.created_at[id(conn)] = time.monotonic()
+        with self.cond:
+            self.stats["connections_created"] += 1
+        return conn
+
+    def _close(self, conn: pymysql.connections.Connection) -> None:
+        self.created_at.pop(id(conn), None)
+        try:
+            conn.close()
+        except pymysql.err.Error:
+            pass
+
+    def acquire(self) -> pymysql.connections.Connection:
+        '''
+        Checks out a healthy connection, waiting up to timeout seconds for one to be released
+        '''
+        start = time.monotonic()
+        with self.cond:
+            waited = False
+            while not self.idle and self.size >= self.max_size:
+                waited = True
+                remaining = self.timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    self.stats["timeouts"] += 1
+                    raise PoolTimeout(f"No MySQL connection available after {self.timeout} seconds")
+                self.cond.wait(remaining)
+            entry = self.idle.pop() if self.idle else None
+            if entry is None:
+                self.size += 1
+            wait = time.monotonic() - start
+            self.stats["checkouts"] += 1
+            if waited:
+                self.stats["waits"] += 1
+                self.stats["wait_seconds"] += wait
+                self.stats["max_wait_seconds"] = max(self.stats["max_wait_seconds"], wait)
+        try:
+            if entry is None:
+                return self._connect()
+            conn, last_used = entry
+            now = time.monotonic()
+            if now - self.created_at.get(id(conn), now) > self.recycle:
+                self._close(conn)
+                with self.cond:
+                    self.stats["connections_recycled"] += 1
+                return self._connect()
+            if now - last_used > self.ping_interval:
+                try:
+                    conn.ping(reconnect=False)
+                except pymysql.err.Error:
+                    self._close(conn)
+                    with self.cond:
+                        self.stats["failed_health_checks"] += 1
+                    return self._connect()
+            return conn
+        except BaseException:
+            with self.cond:
+                self.size -= 1
+                self.cond.notify()
+            raise
+
+    def release(self, conn: pymysql.connections.Connection, discard: bool = False) -> None:
+        '''
+        Returns a connection to the pool. Open transactions are rolled back and broken connections are discarded
+        '''
+        if not discard and conn.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS:
+            try:
+                conn.rollback()
+            except pymysql.err.Error:
+                discard = True
+        if discard:
+            self._close(conn)
+        with self.cond:
+            if discard:
+                self.size -= 1
+                self.stats["discarded"] += 1
+            else:
+                self.idle.append((conn, time.monotonic()))
+            self.cond.notify()
+
+    def get_stats(self) -> dict:
+        with self.cond:
+            stats = dict(self.stats)
+            stats["size"] = self.size
+            stats["idle"] = len(self.idle)
+            stats["in_use"] = self.size - len(self.idle)
+            stats["max_size"] = self.max_size
+        return stats
+
+mysql_pools = {}
+mysql_pools_lock = threading.Lock()
+# Number of metadata connections checked out by each thread
+held_connections = threading.local()
+
+def reset_mysql_pools() -> None:
+    # Forked PMR workers must not reuse the sockets of the parent, so they start with an empty pool
+    global mysql_pools_lock, held_connections
+    mysql_pools.clear()
+    mysql_pools_lock = threading.Lock()
+    held_connections = threading.local()
+
+os.register_at_fork(after_in_child=reset_mysql_pools)
+
+def mysql_pool(location: tuple = None) -> ConnectionPool:
+    '''
+    Returns the connection pool of the current process. The server process uses MYSQL_POOL_SIZE connections
+    and every PMR worker process gets its own pool of MYSQL_WORKER_POOL_SIZE connections.
+    Datanodes on other MySQL instances get a pool of the same size per (host, port, database) location
+    '''
+    key = (os.getpid(), location)
+    with mysql_pools_lock:
+        if key not in mysql_pools:
+            max_size = MYSQL_POOL_SIZE if parent_process() is None else MYSQL_WORKER_POOL_SIZE
+            mysql_pools[key] = ConnectionPool(max_size, MYSQL_POOL_TIMEOUT, MYSQL_POOL_RECYCLE, MYSQL_POOL_PING_INTERVAL, location)
+        return mysql_pools[key]
+
+@contextmanager
+def mysql_connection(location: tuple = None):
+    '''
+    Checks out a connection from the pool of the current process for the duration of a with block.
+    The first checkout of the metadata database by a thread refreshes the datanode registry beforehand if it is
+    stale, so code holding the connection never needs a second one for it (see DatanodeRegistry.refresh)
+    Arguments:
+        location - (host, port, database) of another MySQL instance, None for the metadata database
+    '''
+    if location is None and not getattr(held_connections, "count", 0):
+        datanodes.refresh()
+    pool = mysql_pool(location)
+    conn = pool.acquire()
+    if location is None:
+        held_connections.count = getattr(held_connections, "count", 0) + 1
+    try:
+        yield conn
+    except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+        pool.release(conn, discard=True)
+        raise
+    except BaseException:
+        pool.release(conn)
+        raise
+    else:
+        pool.release(conn)
+    finally:
+        if location is None:
+            held_connections.count -= 1
+
+@app.route('/poolStats', methods=['GET'])
+def poolStats() -> tuple[object, int]:
+    '''
+    This function returns the checkout and wait statistics of the MySQL connection pool of the server
+    '''
+    return {
+        "response": mysql_pool().get_stats(),
+        "status": "EDFS200"
+    }, 200
+
+GLOB_MAGIC = re.compile(r"[*?\[]")
+REGEX_MAGIC = re.compile(r"[.^$*+?{}\[\]\\|()]")
+
+BlockInfo = namedtuple("BlockInfo", [
+    "blk_id",
+    "hash_attribute",
+    "num_bytes",
+    "offset",
+    "replica1_data_blk_id",
+    "replica1_datanode_num",
+    "replica2_data_blk_id",
+    "replica2_datanode_num",
+    "format",
+    "compression",
+    "raw_bytes",
+    "bucket",
+    "bucket_function",
+    "range_low",
+    "range_high"
+], defaults=(None, None, None, None))
+BLOCK_INFO_COLUMNS = ", ".join(BlockInfo._fields)
+
+BlockCodec = namedtuple("BlockCodec", ["encode", "decode"])
+
+def encode_csv(df: pd.DataFrame) -> bytes:
+    return df.to_csv(index=False).encode()
+
+def decode_csv(content: Union[bytes, str], columns: list = None) -> pd.DataFrame:
+    data = BytesIO(content) if isinstance(content, bytes) else StringIO(content)
+    return pd.read_csv(data, sep=",", usecols=(lambda column: column in columns) if columns is not None else None)
+
+def encode_arrow(df: pd.DataFrame) -> bytes:
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+def decode_arrow(content: bytes, columns: list = None) -> pd.DataFrame:
+    # The record batches point into content, only the columns that are kept get converted
+    table = pa.ipc.open_stream(pa.py_buffer(content)).read_all()
+    if columns is not None:
+        table = table.select([column for column in columns if column in table.column_names])
+    return table.to_pandas(split_blocks=True)
+
+def encode_parquet(df: pd.DataFrame) -> bytes:
+    sink = pa.BufferOutputStream()
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), sink)
+    return sink.getvalue().to_pybytes()
+
+def decode_parquet(content: bytes, columns: list = None) -> pd.DataFrame:
+    # Parquet stores every column separately, so the other columns aren't even decompressed
+    parquet_file = pq.ParquetFile(pa.BufferReader(content))
+    if columns is not None:
+        columns = [column for column in columns if column in parquet_file.schema_arrow.names]
+    return parquet_file.read(columns=columns).to_pandas(split_blocks=True)
+
+BLOCK_CODECS = {
+    "csv": BlockCodec(encode_csv, decode_csv)
+}
+if pa is not None:
+    BLOCK_CODECS["arrow"] = BlockCodec(encode_arrow, decode_arrow)
+    BLOCK_CODECS["parquet"] = BlockCodec(encode_parquet, decode_parquet)
+
+Compression = namedtuple("Compression", ["compress", "decompress"])
+
+COMPRESSION_CODECS = {
+    "none": Compression(lambda data: data, lambda data, size: data),
+    # raw_bytes lets zlib allocate the whole output buffer up front
+    "zlib": Compression(lambda data: zlib.compress(data, 6), lambda data, size: zlib.decompress(data, bufsize=size or zlib.DEF_BUF_SIZE)),
+    "lzma": Compression(lambda data: lzma.compress(data), lambda data, size: lzma.decompress(data))
+}
+if zstandard is not None:
+    COMPRESSION_CODECS["zstd"] = Compression(
+        lambda data: zstandard.ZstdCompressor(level=3).compress(data),
+        lambda data, size: zstandard.ZstdDecompressor().decompress(data, max_output_size=size or 0)
+    )
+if lz4 is not None:
+    COMPRESSION_CODECS["lz4"] = Compression(lambda data: lz4.frame.compress(data), lambda data, size: lz4.frame.decompress(data))
+
+def block_payload(block: "BlockInfo", content: Union[bytes, str]) -> Union[bytes, str]:
+    '''
+    Decompresses the content of a block
+    '''
+    if block.compression == 'none':
+        return content
+    if block.compression not in COMPRESSION_CODECS:
+        raise ValueError(f"Block {block.blk_id} is compressed with {block.compression}, which is not installed")
+    return COMPRESSION_CODECS[block.compression].decompress(content, block.raw_bytes)
+
+def decode_block(block: "BlockInfo", content: Union[bytes, str], columns: list = None) -> pd.DataFrame:
+    '''
+    Decompresses and decodes the content of a block according to its compression and format
+    Arguments:
+        block - BlockInfo of the block
+        content - Content of the block as read from its datanode
+        columns - Only decode these columns if given
+    Returns:
+        df - The rows of the block, including the index column put added
+    '''
+    if block.format not in BLOCK_CODECS:
+        raise ValueError(f"Block {block.blk_id} is stored as {block.format}, which needs pyarrow")
+    return BLOCK_CODECS[block.format].decode(block_payload(block, content), columns)
+
+class NamespaceNode:
+    '''
+    A single inode of the in-memory namespace tree
+    Attributes:
+        inode - The inode number of the node in the Namenode table
+        node_type - 'd' for directories and '-' for files
+        name - The full path of the node in the EDFS
+        permission - Permission of the node, e.g. 755
+        mtime - Modification time of the node or None
+        children - Mapping from the name of a child (last path component) to its node
+        blocks - List of BlockInfo of a file ordered by offset, only kept when METADATA_MODE is fsimage
+        num_rows - Number of rows of a file or None if unknown
+    '''
+    __slots__ = ("inode", "node_type", "name", "permission", "mtime", "children", "blocks", "num_rows")
+
+    def __init__(self, inode: str, node_type: str, name: str, permission: int = None, mtime: datetime = None, blocks: list = None, num_rows: int = None) -> None:
+        self.inode = inode
+        self.node_type = node_type
+        self.name = name
+        self.permission = permission
+        self.mtime = mtime
+        self.children = {}
+        self.blocks = blocks
+        self.num_rows = num_rows
+
+class NamespaceTree:
+    '''
+    In-memory copy of the Namenode/Parent_Child tables used to resolve paths without a SQL round trip.
+    The tree is built once from MySQL and kept up to date by the endpoints that change the namespace.
+    Changes made to the tables by anyone else bump Namespace_generation (see init.sql), which is polled
+    at most once every NAMESPACE_SYNC_INTERVAL seconds and triggers a full reload when it moves.
+    When METADATA_MODE is fsimage the tree also holds the block map, is loaded from the fsimage instead of
+    MySQL and is never polled: metadata reads are served from memory only.
+    '''
+    def __init__(self, fsimage: Union["FsImage", None] = None) -> None:
+        self.lock = threading.RLock()
+        self.mutation_lock = threading.Lock()
+        self.reload_lock = threading.Lock()
+        self.local = threading.local()
+        self.fsimage = fsimage
+        self.root = None
+        self.generation = None
+        self.last_sync = 0.0
+
+    def reset_locks(self) -> None:
+        # A forked PMR worker may inherit the locks in a held state
+        self.lock = threading.RLock()
+        self.mutation_lock = threading.Lock()
+        self.reload_lock = threading.Lock()
+
+    def load(self, cursor) -> None:
+        '''
+        Rebuilds the whole tree from the Namenode and Parent_Child tables (and Block_info_table in fsimage mode)
+        Arguments:
+            cursor - An open MySQL cursor
+        '''
+        self.install(*self.read(cursor))
+
+    def read(self, cursor) -> tuple[NamespaceNode, int]:
+        '''
+        Builds a tree from the Namenode and Parent_Child tables (and Block_info_table in fsimage mode) without installing it
+        Arguments:
+            cursor - An open MySQL cursor
+        Returns:
+            root - Root node of the tree
+            generation - Generation of the namespace the tree was read at, or an older one
+        '''
+        # Read the generation first so that a concurrent change makes the tree look stale, never fresh
+        cursor.execute("SELECT generation FROM Namespace_generation WHERE id = 1")
+        generation = cursor.fetchone()[0]
+        query = "SELECT nn.inode_num, nn.node_type, nn.name, nn.permission, nn.mtime, nn.num_rows, pc.parent_inode FROM Namenode nn " + \
+            "LEFT JOIN Parent_Child pc ON pc.child_inode = nn.inode_num"
+        cursor.execute(query)
+        res = cursor.fetchall()
+        nodes = {inode: NamespaceNode(inode, node_type, name, permission, mtime, None, num_rows) for inode, node_type, name, permission, mtime, num_rows, _ in res}
+        root = None
+        for inode, _, name, _, _, _, parent_inode in res:
+            if parent_inode is None:
+                if name == "/":
+                    root = nodes[inode]
+                continue
+            nodes[parent_inode].children[name.split("/")[-1]] = nodes[inode]
+        if self.fsimage is not None:
+            for node in nodes.values():
+                if node.node_type != 'd':
+                    node.blocks = []
+            cursor.execute(f"SELECT file_inode, {BLOCK_INFO_COLUMNS} FROM Block_info_table ORDER BY file_inode, offset")
+            for row in cursor.fetchall():
+                nodes[row[0]].blocks.append(BlockInfo(*row[1:]))
+        return root, generation
+
+    def install(self, root: NamespaceNode, generation: int) -> None:
+        with self.lock:
+            self.root = root
+            self.generation = generation
+            self.last_sync = time.monotonic()
+
+    def sync(self) -> None:
+        '''
+        Loads the tree on first use and reloads it if the namespace was changed outside of this process.
+        Inside a mutation the tree is already up to date and the generation row is locked, so nothing is checked.
+        The tree lock is never held while waiting for a pooled connection, lookups keep going meanwhile.
+        Mutations aren't held up while the tables are read, the tree read is only installed under the mutation lock
+        and dropped if a mutation committed a newer generation in the meantime
+        '''
+        if getattr(self.local, "edits", None) is not None:
+            return
+        with self.lock:
+            if self.root is not None and (self.fsimage is not None or time.monotonic() - self.last_sync < NAMESPACE_SYNC_INTERVAL):
+                return
+        with mysql_connection() as conn, self.reload_lock:
+            cursor = conn.cursor()
+            cursor.execute("SELECT generation FROM Namespace_generation WHERE id = 1")
+            generation = cursor.fetchone()[0]
+            with self.lock:
+                if self.root is not None and generation == self.generation:
+                    self.last_sync = time.monotonic()
+                    cursor.close()
+                    return
+            if self.root is None and self.fsimage is not None:
+                self.fsimage.start(self)
+                with self.mutation_lock:
+                    if self.root is None and self.fsimage.load(self) and self.generation == generation:
+                        cursor.close()
+                        return
+            root, generation = self.read(cursor)
+            cursor.close()
+            with self.mutation_lock, self.lock:
+                if self.generation is not None and self.root is not None and generation < self.generation:
+                    # Read before a mutation of this process committed, the tree in place is newer
+                    return
+                self.install(root, generation)
+        if self.fsimage is not None:
+            self.fsimage.request_checkpoint()
+
+    def invalidate(self) -> None:
+        '''
+        Forces a full reload on the next lookup
+        '''
+        with self.lock:
+            self.root = None
+            self.generation = None
+
+    def resolve(self, nodes: list) -> tuple[str, int]:
+        '''
+        Walks the tree along the given path in O(depth)
+        Arguments:
+            nodes - List of nodes in the path split on /
+        Returns:
+            curParent - The node after which the path doesn't exists or empty string
+            missingChildDepth - The depth of the missing child in the path or -1
+        '''
+        self.sync()
+        with self.lock:
+            node = self.root
+            depth = 0
+            for component in nodes:
+                child = node.children.get(component)
+                if child is None:
+                    return node.name, depth
+                node = child
+                depth += 1
+            return "", -1
+
+    def lookup(self, path: str) -> Union[NamespaceNode, None]:
+        '''
+        Returns the node at the given path or None if the path doesn't exist
+        '''
+        self.sync()
+        return self._lookup(path)
+
+    def _lookup(self, path: str) -> Union[NamespaceNode, None]:
+        with self.lock:
+            node = self.root
+            for component in filter(None, path.split("/")):
+                node = node.children.get(component)
+                if node is None:
+                    return None
+            return node
+
+    def walk(self, node: NamespaceNode) -> list:
+        '''
+        Returns the nodes below node (not node itself) depth first, in the order of their names.
+        The list is built under the tree lock, which is released before the caller goes through it
+        '''
+        nodes = []
+        with self.lock:
+            stack = sorted(node.children.values(), key=lambda child: child.name, reverse=True)
+            while stack:
+                current = stack.pop()
+                nodes.append(current)
+                stack.extend(sorted(current.children.values(), key=lambda child: child.name, reverse=True))
+        return nodes
+
+    def match(self, pattern: str, regex: bool = False) -> list:
+        '''
+        Expands a pattern in one pass over the tree. Glob patterns match each path component with *, ? and [...],
+        and ** matches any number of directories. Regular expressions are matched against the full path
+        Arguments:
+            pattern - The glob or regular expression
+            regex - True if pattern is a regular expression
+        Returns:
+            nodes - List of the matching nodes ordered by name
+        '''
+        self.sync()
+        with self.lock:
+            if regex:
+                compiled = re.compile(pattern)
+                # Only the directory named by the literal prefix of the expression can contain matches
+                prefix = REGEX_MAGIC.split(pattern, maxsplit=1)[0]
+                if "|" in pattern:
+                    # An alternative can start anywhere, e.g. /a/x\.csv|/b/y\.csv
+                    prefix = ""
+                elif pattern[len(prefix):len(prefix)+1] in ("*", "+", "?", "{"):
+                    # The quantifier makes the last character of the prefix optional or repeated, e.g. /a/?b
+                    prefix = prefix[:-1]
+                start = self._lookup(prefix[:prefix.rfind("/")] or "/")
+                if start is None:
+                    return []
+                return sorted((node for node in [start, *self.walk(start)] if compiled.fullmatch(node.name)), key=lambda node: node.name)
+            nodes = [self.root]
+            for component in filter(None, pattern.split("/")):
+                if component == "**":
+                    nodes = [descendant for node in nodes for descendant in [node, *self.walk(node)]]
+                elif GLOB_MAGIC.search(component) is None:
+                    nodes = [node.children[component] for node in nodes if component in node.children]
+                else:
+                    nodes = [child for node in nodes for name, child in node.children.items() if fnmatchcase(name, component)]
+            return sorted(dict.fromkeys(nodes), key=lambda node: node.name)
+
+    @contextmanager
+    def mutation(self, conn: pymysql.connections.Connection):
+        '''
+        Runs a transaction that changes the Namenode/Parent_Child tables for the duration of a with block.
+        The generation row stays locked until commit, so namespace mutations are serialized and the tree is
+        brought up to date first. Changes made with add/remove inside the block are therefore applied in commit
+        order; if the transaction fails the tree is dropped and reloaded on the next lookup.
+        In fsimage mode the changes are appended to the edit log once the transaction is committed.
+        Callbacks registered with after_commit run once the transaction is committed, outside the mutation lock
+        Arguments:
+            conn - A pooled connection
+        Returns:
+            cursor - Cursor of the transaction
+        '''
+        with self.mutation_lock:
+            conn.begin()
+            cursor = conn.cursor()
+            self.local.edits = []
+            self.local.callbacks = []
+            try:
+                cursor.execute("SELECT generation FROM Namespace_generation WHERE id = 1 FOR UPDATE")
+                generation = cursor.fetchone()[0]
+                if self.root is None or generation != self.generation:
+                    if self.fsimage is not None:
+                        # The first request of the process may be a mutation, sync then never starts the edit log
+                        self.fsimage.start(self)
+                    self.load(cursor)
+                    if self.fsimage is not None:
+                        self.fsimage.request_checkpoint()
+                yield cursor
+                cursor.execute("SELECT generation FROM Namespace_generation WHERE id = 1")
+                generation = cursor.fetchone()[0]
+                conn.commit()
+            except BaseException:
+                self.invalidate()
+                raise
+            finally:
+                cursor.close()
+                edits = self.local.edits
+                callbacks = self.local.callbacks
+                self.local.edits = None
+                self.local.callbacks = None
+            with self.lock:
+                self.generation = generation
+                if self.fsimage is not None and edits:
+                    self.fsimage.log(generation, edits)
+        for callback in callbacks:
+            callback()
+
+    def after_commit(self, callback: Callable) -> None:
+        '''
+        Runs callback once the current mutation is committed, for changes outside the metadata database
+        that must not happen if the transaction rolls back. Only called inside mutation
+        '''
+        self.local.callbacks.append(callback)
+
+    def add(self, path: str, inode: str, node_type: str, permission: int = None, mtime: datetime = None, blocks: list = None, num_rows: int = None) -> NamespaceNode:
+        '''
+        Adds an inode to the tree. Only called inside mutation
+        Arguments:
+            path - Full path of the new inode
+            inode - Inode number of the new inode
+            node_type - 'd' for directories and '-' for files
+            permission - Permission of the new inode
+            mtime - Modification time of the new inode
+            blocks - List of BlockInfo of a new file
+            num_rows - Number of rows of a new file
+        Returns:
+            node - The new node
+        '''
+        with self.lock:
+            parent = self._parent_of(path)
+            node = NamespaceNode(inode, node_type, path, permission, mtime, blocks if self.fsimage is not None else None, num_rows)
+            if parent is not None:
+                parent.children[path.split("/")[-1]] = node
+            self._record(["add", path, inode, node_type, permission, mtime.isoformat() if mtime else None, blocks, num_rows])
+            return node
+
+    def remove(self, path: str) -> None:
+        '''
+        Removes an inode and everything below it from the tree. Only called inside mutation
+        Arguments:
+            path - Full path of the deleted inode
+        '''
+        with self.lock:
+            parent = self._parent_of(path)
+            if parent is not None:
+                parent.children.pop(path.split("/")[-1], None)
+            self._record(["remove", path])
+
+    def _record(self, edit: list) -> None:
+        edits = getattr(self.local, "edits", None)
+        if edits is not None:
+            edits.append(edit)
+
+    def _parent_of(self, path: str) -> Union[NamespaceNode, None]:
+        # Returns the parent node a mutation applies to, or invalidates the tree if it can't be applied
+        parent = self.root
+        for component in list(filter(None, path.split("/")))[:-1]:
+            if parent is None:
+                break
+            parent = parent.children.get(component)
+        if parent is None:
+            self.invalidate()
+        return parent
+
+class FsImage:
+    '''
+    HDFS-like persistent copy of the namespace tree and block map (METADATA_MODE=fsimage).
+    The fsimage file is a snapshot of the tree at some generation. Every committed mutation is appended to
+    edits_inprogress.jsonl and fsynced. A background thread checkpoints every CHECKPOINT_INTERVAL seconds,
+    or after CHECKPOINT_EDITS edits: it rolls the in-progress log to edits_<generation>.jsonl, writes a new
+    fsimage and deletes the logs it covers. Startup reads the fsimage and replays the newer edits.
+    '''
+    def __init__(self, directory: str) -> None:
+        self.directory = Path(directory)
+        self.image_path = self.directory / "fsimage.json"
+        self.inprogress_path = self.directory / "edits_inprogress.jsonl"
+        self.edits_file = None
+        self.edit_count = 0
+        self.wake = threading.Event()
+        self.checkpoint_lock = threading.Lock()
+        self.thread = None
+        self.start_lock = threading.Lock()
+
+    def start(self, tree: NamespaceTree) -> None:
+        '''
+        Opens the edit log and starts the checkpointer of the current process
+        '''
+        with self.start_lock:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.directory.mkdir(parents=True, exist_ok=True)
+            if self.edits_file is None:
+                self.edits_file = open(self.inprogress_path, "a")
+            self.thread = threading.Thread(target=self._checkpointer, args=(tree,), daemon=True)
+            self.thread.start()
+
+    def load(self, tree: NamespaceTree) -> bool:
+        '''
+        Installs the fsimage and the edits newer than it into the tree
+        Returns:
+            bool - False if there is no fsimage yet or it can't be read
+        '''
+        if not self.image_path.exists():
+            return False
+        try:
+            return self._read(tree)
+        except (ValueError, TypeError, KeyError) as e:
+            # e.g. written by an older version of the server, the tree is then loaded from MySQL and checkpointed again
+            print(f"fsimage unreadable: {e}")
+            tree.invalidate()
+            return False
+
+    def _read(self, tree: NamespaceTree) -> bool:
+        with open(self.image_path) as image_file:
+            image = json.load(image_file)
+        nodes = {}
+        root = None
+        for inode, parent_inode, node_type, name, permission, mtime, blocks, num_rows in image["inodes"]:
+            node = NamespaceNode(inode, node_type, name, permission, datetime.fromisoformat(mtime) if mtime else None,
+                [BlockInfo(*block) for block in blocks] if blocks is not None else None, num_rows)
+            nodes[inode] = node
+            if parent_inode is None:
+                root = node
+            else:
+                nodes[parent_inode].children[name.split("/")[-1]] = node
+        tree.install(root, image["generation"])
+        transactions = []
+        for edits_path in sorted(self.directory.glob("edits_*.jsonl")):
+            with open(edits_path) as edits_file:
+                for line in edits_file:
+                    try:
+                        transactions.append(json.loads(line))
+                    except ValueError:
+                        # Torn write at the end of the log of a crashed server, never committed to the log
+                        break
+        transactions.sort(key=lambda transaction: transaction["generation"])
+        with tree.lock:
+            for transaction in transactions:
+                if transaction["generation"] <= tree.generation:
+                    continue
+                for edit in transaction["edits"]:
+                    if edit[0] == "add":
+                        _, path, inode, node_type, permission, mtime, blocks, num_rows = edit
+                        tree.add(path, inode, node_type, permission, datetime.fromisoformat(mtime) if mtime else None,
+                            [BlockInfo(*block) for block in blocks] if blocks is not None else None, num_rows)
+                    else:
+                        tree.remove(edit[1])
+                tree.generation = transaction["generation"]
+        if transactions:
+            self.request_checkpoint()
+        return tree.root is not None
+
+    def log(self, generation: int, edits: list) -> None:
+        '''
+        Appends the edits of one committed transaction to the edit log. Called with the tree lock held
+        '''
+        self.edits_file.write(json.dumps({"generation": generation, "edits": edits}, default=str, separators=(",", ":")) + "\n")
+        self.edits_file.flush()
+        os.fsync(self.edits_file.fileno())
+        self.edit_count += len(edits)
+        if self.edit_count >= CHECKPOINT_EDITS:
+            self.wake.set()
+
+    def request_checkpoint(self) -> None:
+        self.edit_count = max(self.edit_count, 1)
+        self.wake.set()
+
+    def checkpoint(self, tree: NamespaceTree) -> None:
+        '''
+        Writes a new fsimage from the tree and deletes the edit logs it covers
+        '''
+        with self.checkpoint_lock:
+            # No mutation may be half applied to the tree while it is copied
+            with tree.mutation_lock, tree.lock:
+                if tree.root is None:
+                    return
+                generation = tree.generation
+                inodes = [[tree.root.inode, None, tree.root.node_type, tree.root.name, tree.root.permission, None, None, None]]
+                parents = {tree.root.name: tree.root.inode}
+                for node in tree.walk(tree.root):
+                    parent_name = node.name[:node.name.rfind("/")] or "/"
+                    inodes.append([node.inode, parents[parent_name], node.node_type, node.name, node.permission,
+                        node.mtime.isoformat() if node.mtime else None, node.blocks, node.num_rows])
+                    parents[node.name] = node.inode
+                self.edits_file.close()
+                os.replace(self.inprogress_path, self.directory / f"edits_{generation:020d}.jsonl")
+                self.edits_file = open(self.inprogress_path, "a")
+                self.edit_count = 0
+            tmp_path = self.directory / "fsimage.json.tmp"
+            with open(tmp_path, "w") as image_file:
+                json.dump({"generation": generation, "inodes": inodes}, image_file, default=str, separators=(",", ":"))
+                image_file.flush()
+                os.fsync(image_file.fileno())
+            os.replace(tmp_path, self.image_path)
+            for edits_path in self.directory.glob("edits_0*.jsonl"):
+                if int(edits_path.stem.split("_")[1]) <= generation:
+                    edits_path.unlink()
+
+    def _checkpointer(self, tree: NamespaceTree) -> None:
+        while True:
+            self.wake.wait(CHECKPOINT_INTERVAL)
+            self.wake.clear()
+            if self.edit_count > 0:
+                try:
+                    self.checkpoint(tree)
+                except OSError as e:
+                    print(f"fsimage checkpoint failed: {e}")
+
+namespace = NamespaceTree(FsImage(FSIMAGE_DIR) if METADATA_MODE == 'fsimage' else None)
+os.register_at_fork(after_in_child=namespace.reset_locks)
+
+def name_filter(alias: str, path: str) -> tuple[str, tuple]:
+    '''
+    Helper function to build the WHERE condition that looks up an inode by its path.
+    The digest comparison is served by the unique namenode_name_digest index, the name comparison guards against collisions
+    Arguments:
+        alias - Alias of the Namenode table in the query
+        path - Path of the inode in the EDFS
+    Returns:
+        condition - The SQL condition, with %s placeholders for the path
+        args - Parameters of the condition
+    '''
+    return f"{alias}.name_digest = UNHEX(MD5(%s)) AND {alias}.name = %s", (path, path)
+
+def get_bool_arg(args: dict, name: str) -> bool:
+    '''
+    Helper function to read a boolean flag from the request arguments (recursive=true, recursive=1, ...)
+    '''
+    return str(args.get(name, "")).lower() in ("1", "true", "yes")
+
+def subtree_query(path: str) -> tuple[str, tuple]:
+    '''
+    Helper function to build the recursive CTE that lists the inode at path and everything below it
+    Arguments:
+        path - Path of the root of the subtree in the EDFS
+    Returns:
+        query - The CTE, exposing (inode_num, depth) as subtree
+        args - Parameters of the CTE
+    '''
+    condition, args = name_filter('nn', path)
+    return "WITH RECURSIVE subtree (inode_num, depth) AS (" + \
+        f"SELECT nn.inode_num, 0 FROM Namenode nn WHERE {condition}" + \
+        " UNION ALL " + \
+        "SELECT pc.child_inode, s.depth + 1 FROM Parent_Child pc JOIN subtree s ON pc.parent_inode = s.inode_num" + \
+        ") ", args
+
+def is_pattern(path: str, regex: bool = False) -> bool:
+    return regex or GLOB_MAGIC.search(path) is not None
+
+def expand_paths(path: str, regex: bool = False) -> list:
+    '''
+    Helper function to expand a glob or regular expression into the files of the EDFS it matches.
+    Plain paths are returned as they are, so that callers keep reporting their own errors for them
+    Arguments:
+        path - Path, glob pattern or regular expression
+        regex - True if path is a regular expression
+    Returns:
+        paths - List of the matching file paths ordered by name
+    '''
+    if not is_pattern(path, regex):
+        return [path]
+    return [node.name for node in namespace.match(path, regex) if node.node_type == '-']
+
+def subtree_totals(node: NamespaceNode) -> dict:
+    '''
+    Helper function to count the directories, files, partitions and bytes of a subtree from the in-memory block map.
+    Only used when METADATA_MODE is fsimage
+    Arguments:
+        node - Root of the subtree, counted as well
+    Returns:
+        totals - Mapping with the directories, files, partitions and bytes of the subtree
+    '''
+    totals = {"directories": 0, "files": 0, "partitions": 0, "bytes": 0}
+    for current in [node, *namespace.walk(node)]:
+        if current.node_type == 'd':
+            totals["directories"] += 1
+        else:
+            totals["files"] += 1
+        for block in current.blocks or []:
+            totals["partitions"] += 1
+            totals["bytes"] += block.num_bytes
+    return totals
+
+Datanode = namedtuple("Datanode", ["datanode_num", "table_name", "host", "port", "database_name", "weight", "state", "directory"])
+DATANODE_STATES = ("active", "readonly")
+TABLE_NAME = re.compile(r"^\w{1,64}$")
+
+def ring_hash(key: str) -> int:
+    return int.from_bytes(md5(key.encode()).digest()[:8], "big")
+
+class DatanodeRegistry:
+    '''
+    In-memory copy of Datanode_registry, reloaded every DATANODE_REFRESH_INTERVAL seconds.
+    Active datanodes get DATANODE_VNODES*weight points on a consistent hash ring and the replicas of a block go to the
+    first REPLICATION_FACTOR distinct datanodes clockwise from the hash of its blk_id, so registering a datanode moves
+    only its share of the new blocks to it. Readonly datanodes are left off the ring but are still read from.
+    Datanodes with a directory keep one file per replica there instead of the rows of a MySQL table
+    '''
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.datanodes = {}
+        self.ring = []
+        self.points = []
+        self.loaded_at = None
+
+    def load(self, cursor) -> None:
+        '''
+        Replaces the registry and the ring with the content of Datanode_registry
+        Arguments:
+            cursor - An open MySQL cursor
+        '''
+        cursor.execute("SELECT datanode_num, table_name, host, port, database_name, weight, state, directory FROM Datanode_registry")
+        datanodes = {}
+        for row in cursor.fetchall():
+            datanode = Datanode(int(row[0]), *row[1:])
+            if datanode.directory is None and not TABLE_NAME.match(datanode.table_name or ""):
+                raise ValueError(f"Invalid table name for datanode {datanode.datanode_num}: {datanode.table_name}")
+            datanodes[datanode.datanode_num] = datanode
+        ring = sorted(
+            (ring_hash(f"{datanode.datanode_num}#{vnode}"), datanode.datanode_num)
+            for datanode in datanodes.values() if datanode.state == "active"
+            for vnode in range(DATANODE_VNODES*datanode.weight)
+        )
+        with self.lock:
+            self.datanodes = datanodes
+            self.ring = [datanode_num for _, datanode_num in ring]
+            self.points = [point for point, _ in ring]
+            self.loaded_at = time.monotonic()
+
+    def refresh(self, force: bool = False) -> None:
+        '''
+        Reloads the registry if it is older than DATANODE_REFRESH_INTERVAL, or if force. It never waits for a second
+        pooled connection of a thread that holds one, since callers like store_block or read_block run inside
+        transactions and streams: a stale registry is then kept until the next checkout, and a forced reload uses a
+        connection of its own outside the pool
+        '''
+        with self.lock:
+            fresh = self.loaded_at is not None and time.monotonic() - self.loaded_at < DATANODE_REFRESH_INTERVAL
+        if not force and (fresh or (self.loaded_at is not None and getattr(held_connections, "count", 0))):
+            return
+        pool = mysql_pool()
+        if getattr(held_connections, "count", 0):
+            conn = pool._connect()
+            try:
+                cursor = conn.cursor()
+                self.load(cursor)
+                cursor.close()
+            finally:
+                pool._close(conn)
+            return
+        conn = pool.acquire()
+        try:
+            cursor = conn.cursor()
+            self.load(cursor)
+            cursor.close()
+        except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+            pool.release(conn, discard=True)
+            raise
+        except BaseException:
+            pool.release(conn)
+            raise
+        else:
+            pool.release(conn)
+
+    def get(self, datanode_num: int) -> Datanode:
+        '''
+        Returns the registry entry of a datanode, reloading the registry once for datanodes registered since
+        '''
+        self.refresh()
+        datanode_num = int(datanode_num)
+        if datanode_num not in self.datanodes:
+            self.refresh(force=True)
+        if datanode_num not in self.datanodes:
+            raise KeyError(f"Datanode {datanode_num} is not registered")
+        return self.datanodes[datanode_num]
+
+    def table(self, datanode_num: int) -> str:
+        return self.get(datanode_num).table_name
+
+    def directory(self, datanode_num: int) -> Union[str, None]:
+        return self.get(datanode_num).directory
+
+    def transactional(self, datanode_num: int) -> bool:
+        '''
+        Returns True if the replicas of a datanode are rows of the metadata database, written in its transactions
+        '''
+        datanode = self.get(datanode_num)
+        return datanode.directory is None and datanode.host is None
+
+    def location(self, datanode_num: int) -> Union[tuple, None]:
+        '''
+        Returns the (host, port, database) of the MySQL instance of a datanode, None if it is in the metadata database
+        '''
+        datanode = self.get(datanode_num)
+        if datanode.host is None:
+            return None
+        return (datanode.host, datanode.port, datanode.database_name or DATABASE)
+
+    def place(self, key: str, count: int = REPLICATION_FACTOR) -> list:
+        '''
+        Picks the datanodes of the replicas of a block
+        Arguments:
+            key - blk_id of the block
+            count - Number of distinct datanodes
+        Returns:
+            datanode_nums - List of count datanode numbers in ring order
+        '''
+        self.refresh()
+        with self.lock:
+            ring, points = self.ring, self.points
+        if len(set(ring)) < count:
+            raise ValueError(f"Need {count} active datanodes to place {count} replicas, found {len(set(ring))}")
+        datanode_nums = []
+        start = bisect(points, ring_hash(key))
+        for i in range(len(ring)):
+            datanode_num = ring[(start + i) % len(ring)]
+            if datanode_num not in datanode_nums:
+                datanode_nums.append(datanode_num)
+                if len(datanode_nums) == count:
+                    break
+        return datanode_nums
+
+    def reset_lock(self) -> None:
+        self.lock = threading.Lock()
+
+datanodes = DatanodeRegistry()
+os.register_at_fork(after_in_child=datanodes.reset_lock)
+
+@contextmanager
+def datanode_cursor(datanode_num: int, cursor=None):
+    '''
+    Yields a cursor on the MySQL instance of a datanode for the duration of a with block. Datanodes in the metadata
+    database reuse cursor when one is given, so their writes join its transaction; the others get a pooled
+    autocommit connection of their own
+    Arguments:
+        datanode_num - Number of the datanode
+        cursor - Optional open cursor on the metadata database
+    '''
+    location = datanodes.location(datanode_num)
+    if cursor is not None and location is None:
+        yield cursor
+        return
+    with mysql_connection(location) as conn:
+        own = conn.cursor()
+        try:
+            yield own
+        finally:
+            own.close()
+
+def block_file(datanode_num: int, data_blk_id: str) -> str:
+    '''
+    Helper function returning the path of the file of a replica on a file datanode, fanned out over
+    subdirectories named after the first two characters of the data_blk_id
+    '''
+    return os.path.join(datanodes.directory(datanode_num), data_blk_id[:2], data_blk_id)
+
+def read_block_file(file: str) -> Union[bytes, None]:
+    '''
+    Helper function to read a replica file, None if the file is missing. Callers that decode the block go through
+    decode_block_file instead, which doesn't copy the file into a bytes object first
+    '''
+    try:
+        with open(file, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+def decode_block_file(block: "BlockInfo", file: str, columns: list = None) -> Union[pd.DataFrame, None]:
+    '''
+    Helper function to decode a replica file, None if the file is missing. Compressed blocks are decompressed straight
+    out of a read-only memory map and uncompressed CSV blocks are parsed from the file. Uncompressed arrow and parquet
+    blocks are read into memory as their frames can keep pointing into the buffer they were decoded from, which
+    would keep a map and its file descriptor open
+    Arguments:
+        block - BlockInfo of the block
+        file - Path of the replica file
+        columns - Only decode these columns if given
+    Returns:
+        df - The rows of the block, including the index column put added
+    '''
+    if block.format not in BLOCK_CODECS:
+        raise ValueError(f"Block {block.blk_id} is stored as {block.format}, which needs pyarrow")
+    try:
+        with open(file, "rb") as f:
+            if block.compression != 'none' and os.fstat(f.fileno()).st_size > 0:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    payload = block_payload(block, mapped)
+                return BLOCK_CODECS[block.format].decode(payload, columns)
+            if block.format == 'csv':
+                return pd.read_csv(f, sep=",", usecols=(lambda column: column in columns) if columns is not None else None)
+            return decode_block(block, f.read(), columns)
+    except FileNotFoundError:
+        return None
+
+def write_block_file(file: str, content: bytes = None, source: str = None) -> None:
+    '''
+    Helper function to write a replica file, from content or by copying the file of another replica with
+    os.sendfile so that the bytes stay in the kernel. The file is written under a temporary name and renamed,
+    so readers never see a partial replica
+    '''
+    os.makedirs(os.path.dirname(file), exist_ok=True)
+    temp = f"{file}.{uuid4().hex}.tmp"
+    try:
+        with open(temp, "wb") as f:
+            if source is None:
+                f.write(content)
+            else:
+                with open(source, "rb") as src:
+                    size = os.fstat(src.fileno()).st_size
+                    sent = 0
+                    while sent < size:
+                        sent += os.sendfile(f.fileno(), src.fileno(), sent, size - sent)
+            if DATANODE_FSYNC:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temp, file)
+    except BaseException:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+
+def read_replica(datanode_num: int, data_blk_id: str, cursor=None) -> Union[bytes, str, None]:
+    '''
+    Helper function to read one replica from its datanode with a primary key lookup or from its file
+    Arguments:
+        datanode_num - Number of the datanode
+        data_blk_id - Id of the replica on the datanode
+        cursor - Optional open cursor on the metadata database, used if the datanode is stored there
+    Returns:
+        content - Content of the replica or None if it is missing
+    '''
+    if datanodes.directory(datanode_num) is not None:
+        return read_block_file(block_file(datanode_num, data_blk_id))
+    with datanode_cursor(datanode_num, cursor) as dn_cursor:
+        dn_cursor.execute(f"SELECT content FROM {datanodes.table(datanode_num)} WHERE data_block_id = %s", (data_blk_id,))
+        row = dn_cursor.fetchone()
+    return row[0] if row is not None else None
+
+def read_replicas(datanode_num: int, data_blk_ids: list, cursor=None) -> dict:
+    '''
+    Helper function to read many replicas from one datanode, with one SELECT ... IN per READ_BATCH_SIZE replicas
+    for datanode tables
+    Returns:
+        contents - Mapping from data_blk_id to content, missing replicas are left out
+    '''
+    contents = {}
+    if datanodes.directory(datanode_num) is not None:
+        for data_blk_id in data_blk_ids:
+            content = read_block_file(block_file(datanode_num, data_blk_id))
+            if content is not None:
+                contents[data_blk_id] = content
+        return contents
+    table = datanodes.table(datanode_num)
+    with datanode_cursor(datanode_num, cursor) as dn_cursor:
+        for start in range(0, len(data_blk_ids), READ_BATCH_SIZE):
+            chunk = data_blk_ids[start:start+READ_BATCH_SIZE]
+            dn_cursor.execute(f"SELECT data_block_id, content FROM {table} WHERE data_block_id IN ({', '.join(['%s']*len(chunk))})", chunk)
+            contents.update(dn_cursor.fetchall())
+    return contents
+
+def write_replicas(datanode_nums: list, data_blk_ids: list, content: bytes, cursor=None) -> None:
+    '''
+    Helper function to store every replica of a block. Replicas on datanode tables of the metadata database are
+    written with cursor and join its transaction. On file datanodes the first replica is written from content
+    and the others are copied from its file
+    Arguments:
+        datanode_nums - Datanode of each replica
+        data_blk_ids - Id of each replica on its datanode
+        content - Stored content of the block
+        cursor - Optional open cursor on the metadata database
+    '''
+    first_file = None
+    for datanode_num, data_blk_id in zip(datanode_nums, data_blk_ids):
+        if datanodes.directory(datanode_num) is not None:
+            file = block_file(datanode_num, data_blk_id)
+            write_block_file(file, content, first_file)
+            first_file = first_file or file
+            continue
+        with datanode_cursor(datanode_num, cursor) as dn_cursor:
+            dn_cursor.execute(f"INSERT INTO {datanodes.table(datanode_num)} VALUES (%s, %s)", (data_blk_id, content))
+
+def delete_data_blocks(datanode_num: int, data_block_ids: list, cursor=None) -> None:
+    '''
+    Helper function to delete replicas from a datanode, RM_BATCH_SIZE at a time for datanode tables
+    Arguments:
+        datanode_num - Number of the datanode
+        data_block_ids - List of data_block_id to delete
+        cursor - Optional open cursor on the metadata database, used if the datanode is stored there
+    '''
+    if datanodes.directory(datanode_num) is not None:
+        for data_block_id in data_block_ids:
+            try:
+                os.remove(block_file(datanode_num, data_block_id))
+            except FileNotFoundError:
+                pass
+        return
+    table = datanodes.table(datanode_num)
+    with datanode_cursor(datanode_num, cursor) as dn_cursor:
+        for start in range(0, len(data_block_ids), RM_BATCH_SIZE):
+            chunk = data_block_ids[start:start+RM_BATCH_SIZE]
+            dn_cursor.execute(f"DELETE FROM {table} WHERE data_block_id IN ({', '.join(['%s']*len(chunk))})", chunk)
+
+def block_replicas(block: BlockInfo) -> list:
+    '''
+    Helper function returning the (datanode_num, data_blk_id) of each replica of a block in order of preference
+    '''
+    return [
+        (block.replica1_datanode_num, block.replica1_data_blk_id),
+        (block.replica2_datanode_num, block.replica2_data_blk_id)
+    ]
+
+def read_block(cursor, block: BlockInfo) -> Union[bytes, str, None]:
+    '''
+    Helper function to read the content of a block with one primary key lookup on the datanode holding it,
+    trying the second replica if the first one is missing
+    Arguments:
+        cursor - An open MySQL cursor, used for the datanodes in the metadata database
+        block - BlockInfo of the block
+    Returns:
+        content - Content of the block or None if no replica was found
+    '''
+    for datanode_num, data_blk_id in block_replicas(block):
+        content = read_replica(datanode_num, data_blk_id, cursor)
+        if content is not None:
+            return content
+    return None
+
+def read_blocks(cursor, blocks: list) -> dict:
+    '''
+    Helper function to read many blocks at once, with one SELECT ... IN per datanode table and READ_BATCH_SIZE blocks.
+    Blocks missing from their first replica are then read from their second replica the same way
+    Arguments:
+        cursor - An open MySQL cursor, used for the datanodes in the metadata database
+        blocks - List of BlockInfo
+    Returns:
+        contents - Mapping from blk_id to the content of the block, blocks without any replica are left out
+    '''
+    contents = {}
+    for replica in range(2):
+        wanted = {}
+        for block in blocks:
+            if block.blk_id not in contents:
+                datanode_num, data_blk_id = block_replicas(block)[replica]
+                wanted.setdefault(int(datanode_num), {})[data_blk_id] = block.blk_id
+        for datanode_num, blk_ids in wanted.items():
+            for data_blk_id, content in read_replicas(datanode_num, list(blk_ids), cursor).items():
+                contents[blk_ids[data_blk_id]] = content
+    return contents
+
+class ReplicaSelector:
+    '''
+    Replica selection for single block reads (readPartition and the PMR mappers). The replica whose datanode has the
+    fewest reads in flight from this process is read first. If it hasn't answered within the HEDGE_PERCENTILE latency
+    of its datanode, the other replica is read as well and whichever answers first with the block wins.
+    Missing replicas and failed reads fail over to the other replica immediately
+    '''
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.inflight = {}
+        self.latencies = {}
+        self.executor = ThreadPoolExecutor(max_workers=HEDGE_THREADS, thread_name_prefix="hedged-read")
+        self.stats = {
+            "reads": 0,
+            "hedged": 0,
+            "hedge_wins": 0,
+            "failovers": 0
+        }
+
+    def order(self, block: BlockInfo) -> list:
+        '''
+        Returns the replicas of block, least loaded datanode first (replica 1 first on ties)
+        '''
+        with self.lock:
+            return sorted(block_replicas(block), key=lambda replica: self.inflight.get(int(replica[0]), 0))
+
+    def threshold(self, datanode_num: int) -> float:
+        '''
+        Returns how long to wait for a datanode before hedging, HEDGE_DELAY until enough latencies were sampled
+        '''
+        with self.lock:
+            samples = sorted(self.latencies.get(int(datanode_num), ()))
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DELAY
+        return samples[min(int(len(samples)*HEDGE_PERCENTILE/100), len(samples)-1)]
+
+    def fetch(self, datanode_num: int, data_blk_id: str) -> Union[str, None]:
+        '''
+        Reads one replica on a connection of its own, or from its file, and records the latency of its datanode
+        '''
+        datanode_num = int(datanode_num)
+        with self.lock:
+            self.inflight[datanode_num] = self.inflight.get(datanode_num, 0) + 1
+        start = time.monotonic()
+        try:
+            content = read_replica(datanode_num, data_blk_id)
+        finally:
+            with self.lock:
+                self.inflight[datanode_num] -= 1
+                self.latencies.setdefault(datanode_num, deque(maxlen=HEDGE_WINDOW)).append(time.monotonic() - start)
+        return content
+
+    def read(self, block: BlockInfo) -> Union[str, None]:
+        '''
+        Reads a block from the best replica, hedging with the other one when it is slow
+        Arguments:
+            block - BlockInfo of the block
+        Returns:
+            content - Content of the block or None if no replica was found
+        '''
+        first, second = self.order(block)
+        with self.lock:
+            self.stats["reads"] += 1
+        if not HEDGE_READS:
+            content = self.fetch(*first)
+            if content is None:
+                with self.lock:
+                    self.stats["failovers"] += 1
+                content = self.fetch(*second)
+            return content
+        futures = {self.executor.submit(self.fetch, *first): first}
+        done, _ = wait(futures, timeout=self.threshold(first[0]))
+        stat = "failovers" if done else "hedged"
+        if done:
+            future = next(iter(done))
+            if future.exception() is None and future.result() is not None:
+                return future.result()
+        with self.lock:
+            self.stats[stat] += 1
+        futures[self.executor.submit(self.fetch, *second)] = second
+        error = None
+        for future in as_completed(futures):
+            if future.exception() is not None:
+                error = future.exception()
+                continue
+            if future.result() is not None:
+                if futures[future] is second and stat == "hedged":
+                    with self.lock:
+                        self.stats["hedge_wins"] += 1
+                return future.result()
+        if error is not None:
+            raise error
+        return None
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            stats = dict(self.stats)
+            stats["inflight"] = {f"Datanode {num}": count for num, count in sorted(self.inflight.items())}
+            stats["thresholds"] = {f"Datanode {num}": None for num in sorted(self.latencies)}
+        for num in sorted(self.latencies):
+            stats["thresholds"][f"Datanode {num}"] = self.threshold(num)
+        return stats
+
+replica_selector = ReplicaSelector()
+
+def reset_replica_selector() -> None:
+    # The threads of the executor don't survive a fork, so every PMR worker starts its own selector
+    global replica_selector
+    replica_selector = ReplicaSelector()
+
+os.register_at_fork(after_in_child=reset_replica_selector)
+
+@app.route('/replicaStats', methods=['GET'])
+def replicaStats() -> tuple[object, int]:
+    '''
+    This function returns the hedged read statistics of the server process and the current hedging threshold of each datanode
+    '''
+    return {
+        "response": replica_selector.get_stats(),
+        "status": "EDFS200"
+    }, 200
+
+@app.route('/datanodes', methods=['GET'])
+def listDatanodes() -> tuple[object, int]:
+    '''
+    This function returns the registered datanodes with the number of replicas and bytes stored on each
+    '''
+    datanodes.refresh(force=True)
+    with mysql_connection() as conn:
+        cursor = conn.cursor()
+        query = "SELECT datanode_num, COUNT(*), SUM(num_bytes) FROM (" + \
+            "SELECT replica1_datanode_num AS datanode_num, num_bytes FROM Block_info_table" + \
+            " UNION ALL " + \
+            "SELECT replica2_datanode_num, num_bytes FROM Block_info_table" + \
+            ") replicas GROUP BY datanode_num"
+        cursor.execute(query)
+        usage = {int(datanode_num): (int(replicas), int(size)) for datanode_num, replicas, size in cursor.fetchall()}
+        cursor.close()
+    response = {}
+    for datanode_num, datanode in sorted(datanodes.datanodes.items()):
+        replicas, size = usage.get(datanode_num, (0, 0))
+        response[f"Datanode {datanode_num}"] = {**datanode._asdict(), "replicas": replicas, "bytes": size}
+    return {
+        "response": response,
+        "status": "EDFS200"
+    }, 200
+
+@app.route('/addDatanode', methods=['GET'])
+def addDatanode() -> tuple[object, int]:
+    '''
+    This function registers a new datanode and creates its table or directory. New blocks start going to it
+    right away, existing blocks stay where they are
+    Arguments:
+        Optional:
+            directory: Local directory holding one file per replica instead of a MySQL table
+            host: MySQL host of the datanode (default the metadata database)
+            port: MySQL port of the datanode
+            database: Database of the datanode on host (default DATABASE)
+            table: Table of the datanode (default Datanode_<num>)
+            weight: Share of the new blocks relative to the other datanodes (default 1)
+    '''
+    args = request.args.to_dict()
+    host = args.get('host') or None
+    port = int(args['port']) if args.get('port') else None
+    database_name = args.get('database') or None
+    directory = os.path.abspath(args["directory"]) if args.get("directory") else None
+    weight = int(args.get('weight', 1))
+    if weight < 1:
+        return {
+            "response": f"addDatanode: Invalid weight: {weight}",
+            "status": "EDFS400"
+        }, 200
+    if 'table' in args and not TABLE_NAME.match(args['table']):
+        return {
+            "response": f"addDatanode: Invalid table name: {args['table']}",
+            "status": "EDFS400"
+        }, 200
+    with mysql_connection() as conn:
+        conn.begin()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT COALESCE(MAX(datanode_num), 0) + 1 FROM Datanode_registry FOR UPDATE")
+            datanode_num = int(cursor.fetchone()[0])
+            if directory is not None:
+                table = None
+                host, port, database_name = None, None, None
+                os.makedirs(directory, exist_ok=True)
+            else:
+                table = args.get('table', f"Datanode_{datanode_num}")
+                location = None if host is None else (host, port, database_name or DATABASE)
+                with mysql_connection(location) as dn_conn:
+                    dn_cursor = dn_conn.cursor()
+                    dn_cursor.execute(f"CREATE TABLE IF NOT EXISTS {table} (data_block_id VARCHAR(32), content LONGBLOB, PRIMARY KEY (data_block_id))")
+                    dn_cursor.close()
+            cursor.execute(
+                "INSERT INTO Datanode_registry (datanode_num, table_name, host, port, database_name, weight, state, directory) " + \
+                    "VALUES (%s, %s, %s, %s, %s, %s, 'active', %s)",
+                (datanode_num, table, host, port, database_name, weight, directory)
+            )
+            conn.commit()
+        finally:
+            cursor.close()
+    datanodes.refresh(force=True)
+    return {
+        "response": f"Datanode {datanode_num}",
+        "status": "EDFS200"
+    }, 200
+
+@app.route('/setDatanodeState', methods=['GET'])
+def setDatanodeState() -> tuple[object, int]:
+    '''
+    This function changes the state of a datanode. Readonly datanodes get no new blocks but are still read from
+    Arguments:
+        num: Number of the datanode
+        state: active or readonly
+    '''
+    args = request.args.to_dict()
+    state = args.get('state')
+    if state not in DATANODE_STATES:
+        return {
+            "response": f"setDatanodeState: Invalid state: {state}",
+            "status": "EDFS400"
+        }, 200
+    datanodes.refresh(force=True)
+    if int(args['num']) not in datanodes.datanodes:
+        return {
+            "response": f"setDatanodeState: No such datanode: {args['num']}",
+            "status": "EDFS400"
+        }, 200
+    with mysql_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE Datanode_registry SET state = %s WHERE datanode_num = %s", (state, int(args['num'])))
+        cursor.close()
+    datanodes.refresh(force=True)
+    return {
+        "response": "",
+        "status": "EDFS200"
+    }, 200
+
+class PartitionCache:
+    '''
+    Process-wide LRU cache of decoded partitions within a budget of PARTITION_CACHE_BYTES.
+    Entries are keyed by blk_id and the decoded columns (None for all of them). Blocks are never rewritten, so entries
+    only go stale when rm deletes their block. PMR workers are forked with a copy of the cache of the server, and send
+    what they decode back so that it lands in the cache of the server
+    '''
+    def __init__(self, budget: int) -> None:
+        self.budget = budget
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "invalidations": 0
+        }
+
+    def reset_lock(self) -> None:
+        self.lock = threading.Lock()
+
+    def contains(self, blk_id: str, columns: list = None) -> bool:
+        with self.lock:
+            return (blk_id, None) in self.entries or (columns is not None and (blk_id, tuple(columns)) in self.entries)
+
+    def get(self, blk_id: str, columns: list = None) -> Union[pd.DataFrame, None]:
+        '''
+        Returns the decoded partition, or just the given columns of it, or None on a miss
+        '''
+        keys = [(blk_id, None)]
+        if columns is not None:
+            keys.append((blk_id, tuple(columns)))
+        with self.lock:
+            for key in keys:
+                if key in self.entries:
+                    self.entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    df = self.entries[key][0]
+                    return df if key[1] is not None or columns is None else df[[column for column in columns if column in df.columns]]
+            self.stats["misses"] += 1
+        return None
+
+    def put(self, blk_id: str, columns: list, df: pd.DataFrame) -> None:
+        '''
+        Adds a decoded partition and evicts the least recently used ones over the budget
+        '''
+        size = int(df.memory_usage(deep=True).sum())
+        if size > self.budget:
+            return
+        key = (blk_id, tuple(columns) if columns is not None else None)
+        with self.lock:
+            if key in self.entries:
+                return
+            self.entries[key] = (df, size)
+            self.size += size
+            while self.size > self.budget:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.size -= evicted
+                self.stats["evictions"] += 1
+
+    def invalidate(self, blk_ids: list) -> None:
+        '''
+        Drops every entry of the given blocks
+        '''
+        blk_ids = set(blk_ids)
+        with self.lock:
+            for key in [key for key in self.entries if key[0] in blk_ids]:
+                self.size -= self.entries.pop(key)[1]
+                self.stats["invalidations"] += 1
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self.entries)
+            stats["bytes"] = self.size
+            stats["budget"] = self.budget
+        return stats
+
+partition_cache = PartitionCache(PARTITION_CACHE_BYTES)
+os.register_at_fork(after_in_child=partition_cache.reset_lock)
+
+def read_partition_block(block: BlockInfo, columns: list = None) -> tuple[Union[pd.DataFrame, None], bool]:
+    '''
+    Helper function to get a decoded partition from the cache, or read it from its replicas and cache it
+    Arguments:
+        block - BlockInfo of the partition
+        columns - Only decode these columns if given
+    Returns:
+        df - The rows of the partition or None if no replica was found
+        miss - True if the partition was read from the datanodes
+    '''
+    if PARTITION_CACHE_BYTES > 0:
+        df = partition_cache.get(block.blk_id, columns)
+        if df is not None:
+            return df, False
+    df = None
+    for datanode_num, data_blk_id in block_replicas(block):
+        # Local files aren't worth hedging, they are decoded without being read into memory first
+        if datanodes.directory(datanode_num) is not None:
+            df = decode_block_file(block, block_file(datanode_num, data_blk_id), columns)
+            if df is not None:
+                break
+    if df is None:
+        content = replica_selector.read(block)
+        if content is None:
+            return None, True
+        df = decode_block(block, content, columns)
+    if PARTITION_CACHE_BYTES > 0:
+        partition_cache.put(block.blk_id, columns, df)
+    return df, True
+
+@app.route('/cacheStats', methods=['GET'])
+def cacheStats() -> tuple[object, int]:
+    '''
+    This function returns the hit, miss and eviction counters and the memory use of the partition cache of the server
+    '''
+    return {
+        "response": partition_cache.get_stats(),
+        "status": "EDFS200"
+    }, 200
+
 def is_valid_path(nodes: list) -> tuple[str, int]:
     '''
     Helper function to check if given path exists in the EDFS
@@ -56,86 +1707,151 @@ def is_valid_path(nodes: list) -> tuple[str, int]:
         curParent - The node after which the path doesn't exists or empty string
         missingChildDepth - The depth of the missing child in the path or -1
     '''
-    conn = pymysql.connect(
-        host=HOST_NAME,
-        user=DB_USERNAME, 
-        password = DB_PASSWORD,
-        database=DATABASE
-    )
-    cursor = conn.cursor()
-    query = "SELECT nn.name AS parent_name, nn2.name AS child_name FROM parent_child pc " + \
-        "JOIN namenode nn ON pc.parent_inode = nn.inode_num " + \
-        "JOIN namenode nn2 ON pc.child_inode = nn2.inode_num"
-    cursor.execute(query)
-    res = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    parent_child = {v: k for k,v in res}
-    curParent = "/"
-    depth = 0
-    for node in nodes:
-        if curParent+(depth != 0)*'/'+node in parent_child:
-            if parent_child[curParent+(depth != 0)*'/'+node] == curParent:
-                curParent += (depth != 0)*'/' + node
-                depth += 1
-        else:
-            return curParent, depth
-    return "", -1
+    return namespace.resolve(nodes)
+
+def create_directories(cursor, paths: list) -> list:
+    '''
+    Helper function to create directories along with all of their missing parents (mkdir -p).
+    Inode numbers are generated here, so the whole batch is written with one multi-row INSERT into Namenode
+    and one into Parent_Child. Must be called inside namespace.mutation
+    Arguments:
+        cursor - Cursor of the namespace mutation
+        paths - List of paths of the directories to be created
+    Returns:
+        results - List of the error message of each path in order, or an empty string if it was created. A path given
+            twice fails the second time with File exists, as a second mkdir would
+    '''
+    results = []
+    namenode_rows = []
+    parent_child_rows = []
+    ctime = datetime.now()
+    for path in paths:
+        nodes = list(filter(None, path.split("/")))
+        curParent, missingChildDepth = is_valid_path(nodes)
+        if missingChildDepth == -1:
+            results.append(f"mkdir: {path}: File exists")
+            continue
+        parent = namespace.lookup(curParent)
+        if parent.node_type != 'd':
+            results.append(f"mkdir: {curParent}: Not a directory")
+            continue
+        for node in nodes[missingChildDepth:]:
+            inode_num = str(uuid4())
+            name = parent.name + (parent.name != '/')*'/' + node
+            namenode_rows.append((inode_num, 'd', name, None, None, None, ctime, DEFAULT_DIR_PERMISSION))
+            parent_child_rows.append((parent.inode, inode_num))
+            parent = namespace.add(name, inode_num, 'd', int(DEFAULT_DIR_PERMISSION), None)
+        results.append("")
+    if namenode_rows:
+        cursor.executemany(
+            "INSERT INTO Namenode (inode_num, node_type, name, replication, mtime, atime, ctime, permission) " + \
+                "VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+            namenode_rows
+        )
+        cursor.executemany("INSERT INTO Parent_Child VALUES (%s, %s)", parent_child_rows)
+    return results
 
 @app.route('/mkdir', methods = ['GET'])
 def mkdir() -> tuple[object, int]:
     '''
-    This function creates a new directory in the EDFS. Returns error if the directory already exists.
+    This function creates a new directory in the EDFS along with its missing parents. Returns error if the directory already exists.
     Arguments:
         path: Path of the new directory in the EDFS
     '''
     path = request.args.get('path')
-    nodes = list(filter(None, path.split("/")))
-    curParent, missingChildDepth = is_valid_path(nodes)
-    if missingChildDepth == -1:
+    with mysql_connection() as conn, namespace.mutation(conn) as cursor:
+        error = create_directories(cursor, [path])[0]
+    if error:
         return {
-            "response": f"mkdir: {path}: File exists", 
+            "response": error, 
             "status": "EDFS400"
         }, 200
+    return {
+        "response": "",
+        "status": "EDFS200"
+    }, 200
+
+@app.route('/mkdirs', methods = ['GET', 'POST'])
+def mkdirs() -> tuple[object, int]:
+    '''
+    This function creates many directories in the EDFS in a single transaction, along with their missing parents.
+    Arguments:
+        path: Path of a new directory in the EDFS, may be repeated (GET)
+        paths: JSON list of paths of the new directories (POST body: {"paths": [...]})
+    '''
+    if request.method == 'POST':
+        paths = request.get_json(force=True).get('paths', [])
     else:
-        conn = pymysql.connect(
-            host=HOST_NAME,
-            user=DB_USERNAME, 
-            password = DB_PASSWORD,
-            database=DATABASE
-        )
-        cursor = conn.cursor()
-        depth = missingChildDepth
-        for node in nodes[missingChildDepth:]:
-            query = "INSERT INTO Namenode VALUES (" + \
-                "UUID()," + \
-                "'d'," + \
-                f"'{curParent+(depth != 0)*'/'+node}'," + \
-                "NULL," + \
-                "NULL," + \
-                "NULL," + \
-                "NOW()," + \
-                f"{DEFAULT_DIR_PERMISSION}" + \
-                ")"
-            cursor.execute(query)
-            query = "SELECT nn.inode_num AS parent_inode, " + \
-                "nn2.inode_num AS child_inode " + \
-                "FROM Namenode nn, Namenode nn2 " + \
-                f"WHERE nn.name='{curParent}' AND nn2.name='{curParent+(depth != 0)*'/'+node}'"
-            cursor.execute(query)
-            res = cursor.fetchall()
-            query = "INSERT INTO Parent_Child VALUES (" + \
-                f"'{res[0][0]}'," + \
-                f"'{res[0][1]}')"
-            cursor.execute(query)
-            curParent += (depth != 0)*'/'+node
-        cursor.close()
-        conn.commit()
-        conn.close()
-        return {
-            "response": "",
-            "status": "EDFS200"
-        }, 200
+        paths = request.args.getlist('path')
+    with mysql_connection() as conn, namespace.mutation(conn) as cursor:
+        results = create_directories(cursor, paths)
+    failed = {path: error for path, error in zip(paths, results) if error}
+    return {
+        "response": {
+            "created": results.count(""),
+            "errors": failed
+        },
+        "status": "EDFS400" if failed else "EDFS200"
+    }, 200
+
+def stream_query(query: str, args: tuple = None):
+    '''
+    Helper function to run a query with an unbuffered cursor and yield its rows as MySQL produces them
+    Arguments:
+        query - The query to be run
+        args - Parameters of the query
+    '''
+    with mysql_connection() as conn:
+        cursor = conn.cursor(pymysql.cursors.SSCursor)
+        try:
+            cursor.execute(query, args)
+            for row in cursor:
+                yield row
+        finally:
+            # Drains whatever the client didn't wait for, so the connection can go back to the pool
+            cursor.close()
+
+def stream_lines(rows, format_row: Callable[[tuple], str], buffer_size: int = 65536):
+    '''
+    Helper function to turn streamed rows into chunks of text of about buffer_size characters
+    '''
+    buffer = []
+    size = 0
+    for row in rows:
+        line = format_row(row)
+        buffer.append(line)
+        size += len(line)
+        if size >= buffer_size:
+            yield "".join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield "".join(buffer)
+
+def ls_columns(alias: str, long: bool = False) -> str:
+    '''
+    Helper function returning the Namenode columns of a row of ls output, see format_ls_row
+    '''
+    if long:
+        return f"{alias}.node_type, {alias}.permission, {alias}.num_partitions, {alias}.num_bytes, {alias}.num_rows, {alias}.mtime, {alias}.name"
+    return f"{alias}.node_type, {alias}.permission, {alias}.mtime, {alias}.name"
+
+def node_ls_row(node: NamespaceNode, long: bool = False) -> tuple:
+    '''
+    Helper function building the row of ls output of a node of the in-memory tree, see format_ls_row
+    '''
+    if long:
+        blocks = node.blocks or []
+        return (node.node_type, node.permission, len(blocks), sum(block.num_bytes for block in blocks), node.num_rows, node.mtime, node.name)
+    return (node.node_type, node.permission, node.mtime, node.name)
+
+def format_ls_row(row: tuple) -> str:
+    '''
+    Helper function to format (node_type, permission, mtime, name) into a line of ls output.
+    Rows of ls -l are (node_type, permission, num_partitions, num_bytes, num_rows, mtime, name)
+    '''
+    formatted_permission = format_permissions(row[1])
+    return row[0]+formatted_permission+'\t' + '\t'.join(str(i) if i else '-' for i in row[2:]) + '\n'
 
 @app.route('/ls', methods=['GET'])
 def ls() -> tuple[object, int]:
@@ -143,46 +1859,203 @@ def ls() -> tuple[object, int]:
     This function lists the content of the given directory in the EDFS. Returns error if the directory doesn't exists.
     Arguments:
         path: Path of the directory in the EDFS
+        Optional:
+            recursive: true to stream the listing of the whole subtree (ls -R) as plain text
+            long: true to add the partition count, size in bytes and row count of every file (ls -l)
     '''
     path = request.args.get('path')
+    long = get_bool_arg(request.args, 'long')
     nodes = list(filter(None, path.split("/")))
     _, pathMissing = is_valid_path(nodes)
-    if pathMissing == -1:
-        conn = pymysql.connect(
-            host=HOST_NAME,
-            user=DB_USERNAME, 
-            password = DB_PASSWORD,
-            database=DATABASE
-        )
-        cursor = conn.cursor()
-        query = "SELECT nn2.node_type, " + \
-            "nn2.permission, " + \
-            "nn2.mtime, " + \
-            "nn2.name " + \
+    if pathMissing == -1 and namespace.fsimage is not None:
+        node = namespace.lookup(path)
+        if get_bool_arg(request.args, 'recursive'):
+            # The rows are built before streaming, so a slow client doesn't hold the tree lock
+            with namespace.lock:
+                rows = [node_ls_row(child, long) for child in namespace.walk(node)]
+            return Response(stream_with_context(stream_lines(rows, format_ls_row)), mimetype='text/plain')
+        with namespace.lock:
+            res = [node_ls_row(child, long) for child in node.children.values()]
+    elif pathMissing == -1:
+        if get_bool_arg(request.args, 'recursive'):
+            query, args = subtree_query(path)
+            query += f"SELECT {ls_columns('nn', long)} FROM subtree s " + \
+                "JOIN Namenode nn ON nn.inode_num = s.inode_num WHERE s.depth > 0 ORDER BY nn.name"
+            return Response(stream_with_context(stream_lines(stream_query(query, args), format_ls_row)), mimetype='text/plain')
+        condition, args = name_filter('nn', path)
+        query = f"SELECT {ls_columns('nn2', long)} " + \
             "FROM Parent_Child pc " + \
             "JOIN Namenode nn ON pc.parent_inode = nn.inode_num " + \
             "JOIN Namenode nn2 ON pc.child_inode = nn2.inode_num " + \
-            f"WHERE nn.name = '{path}'"
-        cursor.execute(query)
-        res = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        lsinfo = ""
-        for row in res:
-            formatted_permission = format_permissions(row[1])
-            lsinfo += row[0]+formatted_permission+'\t'
-            lsinfo += '\t'.join(str(i) if i else '-' for i in row[2:]) + '\n'
-        if lsinfo:
-            lsinfo = f"Found {len(res)} items\n" + lsinfo
+            f"WHERE {condition}"
+        with mysql_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, args)
+            res = cursor.fetchall()
+            cursor.close()
+    else:
+        return {
+            "response": f"ls: {path}: No such file or directory",
+            "status": "EDFS400"
+        }, 200
+    lsinfo = "".join(format_ls_row(row) for row in res)
+    if lsinfo:
+        lsinfo = f"Found {len(res)} items\n" + lsinfo
+    return {
+        "response": lsinfo,
+        "status": "EDFS200"
+    }, 200
+
+@app.route('/stat', methods=['GET'])
+def stat() -> tuple[object, int]:
+    '''
+    This function returns the metadata of a file/directory in the EDFS: size in bytes, row count, partition count and
+    the number of partitions and bytes stored on each datanode. Returns error if the path is invalid
+    Arguments:
+        path: Path of the file/directory in the EDFS
+    '''
+    path = request.args.get('path')
+    node = namespace.lookup(path)
+    if node is None:
+        return {
+            "response": f"stat: {path}: No such file or directory",
+            "status": "EDFS400"
+        }, 200
+    response = {
+        "path": path,
+        "type": "directory" if node.node_type == 'd' else "file",
+        "permission": node.node_type + format_permissions(node.permission),
+        "mtime": str(node.mtime) if node.mtime else None
+    }
+    if node.node_type == 'd':
+        response["children"] = len(node.children)
+        return {
+            "response": response,
+            "status": "EDFS200"
+        }, 200
+    placement = {}
+    if namespace.fsimage is not None:
+        blocks = node.blocks or []
+        response["bytes"] = sum(block.num_bytes for block in blocks)
+        response["rows"] = node.num_rows
+        response["partitions"] = len(blocks)
+        for block in blocks:
+            for datanode_num in (block.replica1_datanode_num, block.replica2_datanode_num):
+                datanode = placement.setdefault(f"Datanode {datanode_num}", {"partitions": 0, "bytes": 0})
+                datanode["partitions"] += 1
+                datanode["bytes"] += block.num_bytes
+    else:
+        with mysql_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT num_bytes, num_rows, num_partitions FROM Namenode WHERE inode_num = %s", (node.inode,))
+            response["bytes"], response["rows"], response["partitions"] = cursor.fetchone()
+            query = "SELECT datanode_num, COUNT(*), SUM(num_bytes) FROM (" + \
+                "SELECT replica1_datanode_num AS datanode_num, num_bytes FROM Block_info_table WHERE file_inode = %s" + \
+                " UNION ALL " + \
+                "SELECT replica2_datanode_num, num_bytes FROM Block_info_table WHERE file_inode = %s" + \
+                ") replicas GROUP BY datanode_num ORDER BY datanode_num"
+            cursor.execute(query, (node.inode, node.inode))
+            for datanode_num, partitions, size in cursor.fetchall():
+                placement[f"Datanode {datanode_num}"] = {"partitions": int(partitions), "bytes": int(size)}
+            cursor.close()
+    response["replicas"] = dict(sorted(placement.items()))
+    return {
+        "response": response,
+        "status": "EDFS200"
+    }, 200
+
+@app.route('/du', methods=['GET'])
+def du() -> tuple[object, int]:
+    '''
+    This function reports the size in bytes of the given file/directory in the EDFS. Returns error if the path is invalid
+    Arguments:
+        path: Path of the file/directory in the EDFS
+        Optional:
+            summary: true to report only the total of path (du -s) instead of streaming one line per entry of the directory
+    '''
+    path = request.args.get('path')
+    node = namespace.lookup(path)
+    if node is None:
+        return {
+            "response": f"du: {path}: No such file or directory",
+            "status": "EDFS400"
+        }, 200
+    if namespace.fsimage is not None:
+        if get_bool_arg(request.args, 'summary') or node.node_type != 'd':
+            return {
+                "response": f"{subtree_totals(node)['bytes']}\t{path}",
+                "status": "EDFS200"
+            }, 200
+        with namespace.lock:
+            children = sorted(node.children.values(), key=lambda child: child.name)
+        rows = ((subtree_totals(child)["bytes"], child.name) for child in children)
+        return Response(stream_with_context(stream_lines(rows, lambda row: f"{row[0]}\t{row[1]}\n")), mimetype='text/plain')
+    if get_bool_arg(request.args, 'summary') or node.node_type != 'd':
+        query, args = subtree_query(path)
+        query += "SELECT COALESCE(SUM(bi.num_bytes), 0) FROM subtree s JOIN Block_info_table bi ON bi.file_inode = s.inode_num"
+        with mysql_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, args)
+            size = cursor.fetchone()[0]
+            cursor.close()
         return {
-            "response": lsinfo,
+            "response": f"{size}\t{path}",
             "status": "EDFS200"
         }, 200
-    else:
+    # Same walk as subtree_query, but every inode also carries the child of path it is under
+    condition, args = name_filter('nn', path)
+    query = "WITH RECURSIVE subtree (inode_num, depth, top_inode) AS (" + \
+        f"SELECT nn.inode_num, 0, nn.inode_num FROM Namenode nn WHERE {condition}" + \
+        " UNION ALL " + \
+        "SELECT pc.child_inode, s.depth + 1, IF(s.depth = 0, pc.child_inode, s.top_inode) FROM Parent_Child pc " + \
+        "JOIN subtree s ON pc.parent_inode = s.inode_num" + \
+        ") SELECT COALESCE(SUM(bi.num_bytes), 0), nn.name FROM subtree s " + \
+        "JOIN Namenode nn ON nn.inode_num = s.top_inode " + \
+        "LEFT JOIN Block_info_table bi ON bi.file_inode = s.inode_num " + \
+        "WHERE s.depth > 0 GROUP BY s.top_inode, nn.name ORDER BY nn.name"
+    return Response(stream_with_context(stream_lines(stream_query(query, args), lambda row: f"{row[0]}\t{row[1]}\n")), mimetype='text/plain')
+
+@app.route('/count', methods=['GET'])
+def count() -> tuple[object, int]:
+    '''
+    This function counts the directories, files, partitions and bytes under the given path in the EDFS. Returns error if the path is invalid
+    Arguments:
+        path: Path of the file/directory in the EDFS
+    '''
+    path = request.args.get('path')
+    _, missingChildDepth = is_valid_path(list(filter(None, path.split("/"))))
+    if missingChildDepth != -1:
         return {
-            "response": f"ls: {path}: No such file or directory",
+            "response": f"count: {path}: No such file or directory",
             "status": "EDFS400"
         }, 200
+    if namespace.fsimage is not None:
+        return {
+            "response": {**subtree_totals(namespace.lookup(path)), "path": path},
+            "status": "EDFS200"
+        }, 200
+    query, args = subtree_query(path)
+    query += "SELECT COUNT(DISTINCT CASE WHEN nn.node_type = 'd' THEN nn.inode_num END), " + \
+        "COUNT(DISTINCT CASE WHEN nn.node_type = '-' THEN nn.inode_num END), " + \
+        "COUNT(bi.blk_id), " + \
+        "COALESCE(SUM(bi.num_bytes), 0) " + \
+        "FROM subtree s JOIN Namenode nn ON nn.inode_num = s.inode_num " + \
+        "LEFT JOIN Block_info_table bi ON bi.file_inode = s.inode_num"
+    with mysql_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, args)
+        res = cursor.fetchone()
+        cursor.close()
+    return {
+        "response": {
+            "directories": int(res[0]),
+            "files": int(res[1]),
+            "partitions": int(res[2]),
+            "bytes": int(res[3]),
+            "path": path
+        },
+        "status": "EDFS200"
+    }, 200
 
 def format_permissions(permission: int) -> str:
     res = ""
@@ -211,14 +2084,98 @@ def format_permissions(permission: int) -> str:
         power = power//10
     return res
 
+def delete_inodes(cursor, batch: list, totals: dict) -> bool:
+    '''
+    Helper function to delete a batch of inodes with their blocks using set-based statements.
+    Must be called inside namespace.mutation with the children of every directory in the batch
+    either in the batch or already deleted
+    Arguments:
+        cursor - Cursor of the namespace mutation
+        batch - List of (inode_num, depth, node_type, name) ordered deepest first
+        totals - Counters of the removed objects, updated in place
+    Returns:
+        bool - False if a directory in the batch got a new child since the subtree was listed
+    '''
+    inodes = [row[0] for row in batch]
+    placeholders = ", ".join(["%s"]*len(inodes))
+    directories = [row[0] for row in batch if row[2] == 'd']
+    if directories:
+        query = f"SELECT COUNT(*) FROM Parent_Child WHERE parent_inode IN ({', '.join(['%s']*len(directories))})" + \
+            f" AND child_inode NOT IN ({placeholders})"
+        cursor.execute(query, directories + inodes)
+        if cursor.fetchone()[0] > 0:
+            return False
+    query = "SELECT num_bytes, replica1_datanode_num, replica1_data_blk_id, replica2_datanode_num, replica2_data_blk_id, blk_id " + \
+        f"FROM Block_info_table WHERE file_inode IN ({placeholders})"
+    cursor.execute(query, inodes)
+    blocks = cursor.fetchall()
+    data_blocks = {}
+    for _, replica1_datanode, replica1_blk_id, replica2_datanode, replica2_blk_id, _ in blocks:
+        data_blocks.setdefault(replica1_datanode, []).append(replica1_blk_id)
+        data_blocks.setdefault(replica2_datanode, []).append(replica2_blk_id)
+    for datanode_num, data_block_ids in data_blocks.items():
+        if datanodes.transactional(datanode_num):
+            delete_data_blocks(datanode_num, data_block_ids, cursor)
+        else:
+            # Blocks on files or other MySQL instances are outside the transaction, so they go once the metadata is gone
+            namespace.after_commit(lambda datanode_num=datanode_num, data_block_ids=data_block_ids: delete_data_blocks(datanode_num, data_block_ids))
+    cursor.execute(f"DELETE FROM Block_info_table WHERE file_inode IN ({placeholders})", inodes)
+    # Parent_Child rows go away through ON DELETE CASCADE
+    cursor.execute(f"DELETE FROM Namenode WHERE inode_num IN ({placeholders})", inodes)
+    for _, _, _, name in batch:
+        namespace.remove(name)
+    partition_cache.invalidate([block[5] for block in blocks])
+    totals["directories"] += len(directories)
+    totals["files"] += len(batch) - len(directories)
+    totals["blocks"] += len(blocks)
+    totals["bytes"] += sum(block[0] for block in blocks)
+    return True
+
+def remove_tree(path: str) -> dict:
+    '''
+    Helper function to remove the inode at path and everything below it (rm -r).
+    The subtree is listed with one recursive CTE and deleted deepest first in batches of RM_BATCH_SIZE inodes,
+    one transaction per batch. If the subtree changes in between it is listed again
+    Arguments:
+        path - Path of the file/directory in the EDFS
+    Returns:
+        totals - Number of directories, files and blocks removed and their size in bytes
+    '''
+    totals = {
+        "directories": 0,
+        "files": 0,
+        "blocks": 0,
+        "bytes": 0
+    }
+    query, args = subtree_query(path)
+    query += "SELECT s.inode_num, s.depth, nn.node_type, nn.name FROM subtree s " + \
+        "JOIN Namenode nn ON nn.inode_num = s.inode_num ORDER BY s.depth DESC"
+    complete = False
+    while not complete:
+        with mysql_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, args)
+            rows = cursor.fetchall()
+            cursor.close()
+        complete = True
+        for start in range(0, len(rows), RM_BATCH_SIZE):
+            with mysql_connection() as conn, namespace.mutation(conn) as cursor:
+                complete = delete_inodes(cursor, rows[start:start+RM_BATCH_SIZE], totals)
+            if not complete:
+                break
+    return totals
+
 @app.route('/rm', methods=['GET'])
 def rm() -> tuple[object, int]:
     '''
     This function removes a file/directory from the EDFS. Returns error if directory is not empty or if path is invalid
     Arguments:
         path: Path of the file/directory in the EDFS
+        Optional:
+            recursive: true to remove a directory along with everything in it
     '''
     path = request.args.get('path')
+    recursive = get_bool_arg(request.args, 'recursive')
     if path == "/":
         return {
             "response": f"Cannot remove {path}: Root directory",
@@ -230,108 +2187,1025 @@ def rm() -> tuple[object, int]:
             "response": f"Cannot remove {path}: No such file or directory",
             "status": "EDFS400"
         }, 200
-    query = f"SELECT child_inode FROM Namenode nn LEFT JOIN Parent_Child pc ON nn.inode_num = pc.parent_inode WHERE nn.name = '{path}'"
-    conn = pymysql.connect(
-        host=HOST_NAME,
-        user=DB_USERNAME, 
-        password = DB_PASSWORD,
-        database=DATABASE
-    )
-    cursor = conn.cursor()
-    cursor.execute(query)
-    res = cursor.fetchall()
-    child_inode = res[0][0]
-    if child_inode:
-        cursor.close()
-        conn.close()
+    if not recursive and namespace.lookup(path).children:
         return {
             "response": f"Cannot remove {path}: Directory is not empty",
             "status": "EDFS400"
         }, 200
-    query = "DELETE nn, pc, bi, d1, d2, d3, d4, d5, d6 FROM Namenode nn" + \
-        " INNER JOIN Parent_Child pc ON nn.inode_num = pc.child_inode" + \
-        " LEFT JOIN Block_info_table bi ON nn.inode_num = bi.file_inode" + \
-        " LEFT JOIN Datanode_1 d1 ON bi.replica1_data_blk_id = d1.data_block_id" + \
-        " LEFT JOIN Datanode_2 d2 ON bi.replica1_data_blk_id = d2.data_block_id" + \
-        " LEFT JOIN Datanode_3 d3 ON bi.replica1_data_blk_id = d3.data_block_id" + \
-        " LEFT JOIN Datanode_1 d4 ON bi.replica2_data_blk_id = d4.data_block_id" + \
-        " LEFT JOIN Datanode_2 d5 ON bi.replica2_data_blk_id = d5.data_block_id" + \
-        " LEFT JOIN Datanode_3 d6 ON bi.replica2_data_blk_id = d6.data_block_id" + \
-        f" WHERE nn.name = '{path}'"
-    cursor.execute(query)
-    cursor.close()
-    conn.commit()
-    conn.close()
+    totals = remove_tree(path)
+    response = f"Deleted {path}"
+    if recursive:
+        response += f": {totals['directories']} directories, {totals['files']} files, " + \
+            f"{totals['blocks']} blocks, {totals['bytes']} bytes"
     return {
-        "response": f"Deleted {path}",
+        "response": response,
         "status": "EDFS200"
     }, 200
 
+def subtree_rows(node: NamespaceNode) -> list:
+    '''
+    Helper function to list the inodes of a subtree from the in-memory tree in the shape delete_inodes expects
+    Arguments:
+        node - Root of the subtree, listed as well
+    Returns:
+        rows - List of (inode_num, depth, node_type, name) ordered deepest first
+    '''
+    rows = [(current.inode, current.name.count("/"), current.node_type, current.name) for current in [node, *namespace.walk(node)]]
+    rows.sort(key=lambda row: row[1], reverse=True)
+    return rows
+
+def batch_ls(path: str) -> tuple[str, int]:
+    node = namespace.lookup(path)
+    if node is None:
+        return f"ls: {path}: No such file or directory", 400
+    with namespace.lock:
+        res = [(child.node_type, child.permission, child.mtime, child.name) for child in node.children.values()]
+    lsinfo = "".join(format_ls_row(row) for row in res)
+    if lsinfo:
+        lsinfo = f"Found {len(res)} items\n" + lsinfo
+    return lsinfo, 200
+
+def batch_rm_rows(path: str, recursive: bool) -> tuple[Union[str, list], int]:
+    if path == "/":
+        return f"Cannot remove {path}: Root directory", 400
+    node = namespace.lookup(path)
+    if node is None:
+        return f"Cannot remove {path}: No such file or directory", 400
+    if not recursive and node.children:
+        return f"Cannot remove {path}: Directory is not empty", 400
+    return subtree_rows(node), 200
+
+def delete_rows(cursor, rows: list, totals: dict) -> set:
+    '''
+    Helper function to delete the inodes of subtree_rows deepest first, in batches of RM_BATCH_SIZE inodes
+    Arguments:
+        cursor - Cursor of the namespace mutation
+        rows - List of (inode_num, depth, node_type, name)
+        totals - Counters of the removed objects, updated in place
+    Returns:
+        deleted - Inode numbers deleted, all of them unless a directory has a child that isn't in rows
+    '''
+    rows = sorted(rows, key=lambda row: row[1], reverse=True)
+    deleted = set()
+    for start in range(0, len(rows), RM_BATCH_SIZE):
+        if not delete_inodes(cursor, rows[start:start+RM_BATCH_SIZE], totals):
+            # Nothing above the directory can go either
+            break
+        deleted.update(row[0] for row in rows[start:start+RM_BATCH_SIZE])
+    return deleted
+
+def run_batch(cursor, ops: list, pipeline: bool) -> list:
+    '''
+    Helper function to run the operations of /batch in order inside one namespace mutation.
+    With pipeline, runs of consecutive mkdir ops are written with one create_directories call and runs of
+    consecutive rm ops with one set of delete_inodes statements
+    Arguments:
+        cursor - Cursor of the namespace mutation
+        ops - List of {"op": "mkdir" | "rm" | "ls", "path": ..., "recursive": ...}
+        pipeline - Whether to group consecutive ops of the same kind
+    Returns:
+        results - List of (response, status) in the order of ops
+    '''
+    results = [None]*len(ops)
+    i = 0
+    while i < len(ops):
+        op = ops[i].get("op")
+        end = i + 1
+        if pipeline:
+            while end < len(ops) and ops[end].get("op") == op:
+                end += 1
+        group = range(i, end)
+        if op == "mkdir":
+            created = create_directories(cursor, [ops[j]["path"] for j in group])
+            for j, error in zip(group, created):
+                results[j] = (error, 400) if error else ("", 200)
+        elif op == "rm":
+            rows = {}
+            removed = {}
+            for j in group:
+                path = ops[j]["path"]
+                res, status = batch_rm_rows(path, bool(ops[j].get("recursive")))
+                if status != 200:
+                    results[j] = (res, status)
+                    continue
+                rows.update((row[0], row) for row in res)
+                removed[j] = [row[0] for row in res]
+                results[j] = (f"Deleted {path}", 200)
+            totals = {"directories": 0, "files": 0, "blocks": 0, "bytes": 0}
+            deleted = delete_rows(cursor, list(rows.values()), totals)
+            if len(deleted) < len(rows):
+                # A directory had a child the tree didn't list, the other ops are removed one by one
+                for inodes in removed.values():
+                    deleted |= delete_rows(cursor, [rows[inode] for inode in inodes if inode not in deleted], totals)
+            for j, inodes in removed.items():
+                if not deleted.issuperset(inodes):
+                    results[j] = (f"Cannot remove {ops[j]['path']}: Directory is not empty", 400)
+        elif op == "ls":
+            for j in group:
+                results[j] = batch_ls(ops[j]["path"])
+        else:
+            for j in group:
+                results[j] = (f"batch: Unknown operation: {op}", 400)
+        i = end
+    return results
+
+@app.route('/batch', methods=['POST'])
+def batch() -> tuple[object, int]:
+    '''
+    This function runs a list of namespace operations against one snapshot of the namespace, in a single transaction.
+    Operations that fail are reported in their result and don't stop the others
+    Arguments:
+        ops: JSON list of operations (POST body: {"ops": [{"op": "mkdir", "path": ...}, {"op": "rm", "path": ..., "recursive": true}, {"op": "ls", "path": ...}]})
+        Optional:
+            pipeline: true to group consecutive operations of the same kind into set-based statements
+    '''
+    body = request.get_json(force=True)
+    ops = body.get('ops', [])
+    if any(not isinstance(op, dict) or not isinstance(op.get("path"), str) for op in ops):
+        return {
+            "response": "batch: Every operation needs an op and a path",
+            "status": "EDFS400"
+        }, 200
+    with mysql_connection() as conn, namespace.mutation(conn) as cursor:
+        results = run_batch(cursor, ops, bool(body.get('pipeline')))
+    return {
+        "response": [
+            {
+                "op": op.get("op"),
+                "path": op["path"],
+                "response": response,
+                "status": "EDFS"+str(status)
+            } for op, (response, status) in zip(ops, results)
+        ],
+        "status": "EDFS200" if all(status == 200 for _, status in results) else "EDFS400"
+    }, 200
+
 @app.route('/cat', methods=['GET'])
 def cat() -> tuple[object, int]:
     '''
     This function returns the content of the file
     Arguments:
-        path: Path of the file/directory in the EDFS
+        path: Path of the file/directory in the EDFS, or a glob pattern such as /data/*/part*.csv
+        Optional:
+            regex: true to match path as a regular expression on the full path instead of a glob
+            stream: true to stream the file as a chunked text/csv response instead of a JSON envelope
     '''
     path = request.args.get('path')
-    _, missingChildDepth = is_valid_path(list(filter(None, path.split("/"))))
-    if missingChildDepth != -1:
-        return {
-            "response": f"{path}: No such file or directory",
-            "status": "EDFS400"
-        }, 200
-    query = "SELECT IFNULL(" + \
-                "CONCAT(COALESCE(d1.content, ''), COALESCE(d2.content, ''), COALESCE(d3.content, '')), " + \
-                "CONCAT(COALESCE(d4.content, ''), COALESCE(d5.content, ''), COALESCE(d6.content, ''))" + \
-            ") AS content FROM Block_info_table bi" + \
-            " INNER JOIN Namenode nn ON nn.inode_num = bi.file_inode" + \
-            " LEFT JOIN Datanode_1 d1 ON d1.data_block_id = bi.replica1_data_blk_id" + \
-            " LEFT JOIN Datanode_2 d2 ON d2.data_block_id = bi.replica1_data_blk_id" + \
-            " LEFT JOIN Datanode_3 d3 ON d3.data_block_id = bi.replica1_data_blk_id" + \
-            " LEFT JOIN Datanode_1 d4 ON d4.data_block_id = bi.replica2_data_blk_id" + \
-            " LEFT JOIN Datanode_2 d5 ON d5.data_block_id = bi.replica2_data_blk_id" + \
-            " LEFT JOIN Datanode_3 d6 ON d6.data_block_id = bi.replica2_data_blk_id" + \
-            f" WHERE nn.name = '{path}'"
-    conn = pymysql.connect(
-        host=HOST_NAME,
-        user=DB_USERNAME, 
-        password = DB_PASSWORD,
-        database=DATABASE
-    )
-    cursor = conn.cursor()
-    cursor.execute(query)
-    res = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    if len(res) > 0:
-        df = pd.DataFrame()
-        for row in res:
-            csvStringIO = StringIO(row[0])
-            row_df = pd.read_csv(csvStringIO, sep=",")
-            df = pd.concat([df, row_df])
-        df = df.sort_values(by='index')
-        df = df.drop('index', axis=1)
+    regex = get_bool_arg(request.args, 'regex')
+    if is_pattern(path, regex):
+        contents = {file_path: readFileContent(file_path)[0] for file_path in expand_paths(path, regex)}
         return {
-            "response": df.to_csv(index=False),
-            "status": "EDFS200"
+            "response": contents if contents else f"{path}: No such file or directory",
+            "status": "EDFS200" if contents else "EDFS400"
         }, 200
+    if get_bool_arg(request.args, 'stream'):
+        blocks = file_blocks(path)
+        if blocks is None:
+            return {
+                "response": f"{path}: No such file or directory",
+                "status": "EDFS400"
+            }, 200
+        return Response(stream_with_context(stream_file(blocks)), mimetype='text/csv')
+    response, status = readFileContent(path)
     return {
-        "response": "",
-        "status": "EDFS204"
+        "response": response,
+        "status": "EDFS"+str(status)
     }, 200
 
+def file_blocks(path: str) -> Union[list, None]:
+    '''
+    Helper function to list the blocks of a file
+    Arguments:
+        path - Path of the file in the EDFS
+    Returns:
+        blocks - List of BlockInfo ordered by offset, or None if the path doesn't exist
+    '''
+    node = namespace.lookup(path)
+    if node is None:
+        return None
+    if namespace.fsimage is not None:
+        return list(node.blocks or [])
+    with mysql_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT {BLOCK_INFO_COLUMNS} FROM Block_info_table WHERE file_inode = %s ORDER BY offset", (node.inode,))
+        blocks = [BlockInfo(*row) for row in cursor.fetchall()]
+        cursor.close()
+    return blocks
+
+def partition_blocks(path: str, hash: str = None, low: str = None, high: str = None) -> Union[list, None]:
+    '''
+    Helper function to list the blocks of a file, optionally only those of one hash value. For a file put with
+    partitioning=hash these are the blocks of the bucket of the value, which also hold other keys, and with
+    partitioning=range those of the range holding it. low and high keep the ranges that overlap them
+    Arguments:
+        path - Path of the file in the EDFS
+        hash - Hash value of the partitions to keep
+        low - Lowest value of the range column to keep, only for files put with partitioning=range
+        high - Highest value of the range column to keep, only for files put with partitioning=range
+    Returns:
+        blocks - List of BlockInfo ordered by offset, or None if the path doesn't exist
+    '''
+    blocks = file_blocks(path)
+    if blocks is None or not (hash or low or high):
+        return blocks
+    function = blocks[0].bucket_function if blocks else None
+    if function is None and (low or high):
+        return []
+    if function is not None:
+        try:
+            if hash:
+                key, _, value = lookup_key(hash, function)
+                if function.startswith("md5-"):
+                    # Hash partitioned, only the bucket of the key can hold it
+                    blocks = [block for block in blocks if block.bucket == key_bucket(key, function)]
+                else:
+                    blocks = [block for block in blocks if in_range(block, value, value)]
+            low = lookup_key(low, function)[2] if low else None
+            high = lookup_key(high, function)[2] if high else None
+        except ValueError:
+            # Not a number for a numeric column, no partition holds it
+            return []
+        return [block for block in blocks if in_range(block, low, high)]
+    try:
+        hash = literal_eval(hash)
+    except (ValueError, SyntaxError):
+        pass
+    return [block for block in blocks if block.hash_attribute == str(hash)]
+
+def block_rows(read: Callable[[BlockInfo], Union[str, None]], run: list, header: list):
+    '''
+    Generator over the rows of consecutive blocks of one hash group, reading one block at a time.
+    put splits each hash group into blocks in the order of the index column, so the rows come out sorted on it
+    Arguments:
+        read - Function returning the content of a block
+        run - List of BlockInfo of the hash group ordered by offset
+        header - Filled with the columns of the file without index when the first block is read
+    Returns:
+        rows - Iterator of (index, values without index)
+    '''
+    for block in run:
+        content = read(block)
+        if content is None:
+            raise IOError(f"No replica of block {block.blk_id} found")
+        if block.format == 'csv':
+            text = block_payload(block, content)
+            text = text.decode() if isinstance(text, bytes) else text
+        else:
+            text = decode_block(block, content).to_csv(index=False)
+        reader = csv.reader(StringIO(text))
+        columns = next(reader, None)
+        if columns is None:
+            continue
+        position = columns.index('index')
+        if not header:
+            header.extend(columns[:position] + columns[position+1:])
+        rows = [(int(row[position]), row[:position] + row[position+1:]) for row in reader if row]
+        rows.sort(key=itemgetter(0))
+        yield from rows
+
+INDEX_RANGE = re.compile(r"\[(-?\d+), (-?\d+)\]")
+
+def index_chains(groups: dict) -> list:
+    '''
+    Helper function for stream_file. Joins the hash groups whose hash attribute is an index range, as stream_blocks
+    stores the rows of a file without hash column, into runs of groups whose ranges follow each other, in offset order
+    Arguments:
+        groups - Dictionary of hash attribute to the list of BlockInfo of the group ordered by offset
+    Returns:
+        runs - List of lists of BlockInfo, each sorted on the index column once the rows of every block are
+    '''
+    runs = []
+    chains = []
+    ranged = []
+    for hash_val, run in groups.items():
+        match = INDEX_RANGE.fullmatch(str(hash_val))
+        if match:
+            ranged.append((int(match.group(1)), int(match.group(2)), run))
+        else:
+            runs.append(run)
+    for first, last, run in sorted(ranged, key=lambda item: (item[0], item[2][0].offset)):
+        for chain in chains:
+            if chain[0] < first:
+                chain[0] = last
+                chain[1].extend(run)
+                break
+        else:
+            chains.append([last, list(run)])
+    return runs + [chain[1] for chain in chains]
+
+def stream_file(blocks: list, buffer_size: int = 65536, prefetch: bool = False):
+    '''
+    Generator over the content of a file as CSV text in the original row order, in chunks of about buffer_size characters.
+    The blocks of each hash group form a run sorted on the stored index column, and the runs are merged with a heap,
+    so at most one block per run is held in memory. Blocks put without a hash column hold the range of their index as
+    hash attribute, those whose ranges don't overlap are read one after the other as a single run (see index_chains)
+    Arguments:
+        blocks - List of BlockInfo of the file ordered by offset
+        prefetch - True to read all the blocks up front with read_blocks, for callers that keep the whole file anyway
+    '''
+    groups = {}
+    for block in blocks:
+        groups.setdefault(block.hash_attribute, []).append(block)
+    runs = index_chains(groups)
+    header = []
+    with mysql_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            if prefetch:
+                contents = read_blocks(cursor, blocks)
+                read = lambda block: contents.pop(block.blk_id, None)
+            else:
+                read = lambda block: read_block(cursor, block)
+            merged = heapq.merge(*(block_rows(read, run, header) for run in runs), key=itemgetter(0))
+            first = next(merged, None)
+            if first is None:
+                return
+            buffer = StringIO()
+            writer = csv.writer(buffer, lineterminator='\n')
+            writer.writerow(header)
+            writer.writerow(first[1])
+            for _, values in merged:
+                writer.writerow(values)
+                if buffer.tell() >= buffer_size:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue()
+        finally:
+            cursor.close()
+
+def readFileContent(path: str) -> tuple[str, int]:
+    blocks = file_blocks(path)
+    if blocks is None:
+        return f"{path}: No such file or directory", 400
+    content = "".join(stream_file(blocks, prefetch=True))
+    if content:
+        return content, 200
+    return "", 204
+
+BLOCK_INSERT = "INSERT INTO Block_info_table (blk_id, file_inode, hash_attribute, num_bytes, offset, " + \
+    "replica1_data_blk_id, replica1_datanode_num, replica2_data_blk_id, replica2_datanode_num, format, compression, raw_bytes, " + \
+    "bucket, bucket_function, range_low, range_high) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"
+
+class UploadLanes:
+    '''
+    Uploads batches of replicas concurrently, one lane per datanode. A lane is a single thread, so each datanode is
+    written over one connection or session at a time and batches reach it in the order they were submitted, while
+    the datanodes are written in parallel with each other and with the encoding of the next blocks.
+    At most PUT_MAX_PENDING_BATCHES batches are queued or in flight: submit blocks until a lane completes one, so
+    the producer never runs further ahead of the slowest datanode than that
+    '''
+    def __init__(self) -> None:
+        self.lanes = {}
+        self.slots = threading.BoundedSemaphore(PUT_MAX_PENDING_BATCHES)
+        self.futures = []
+
+    def submit(self, datanode: object, fn: Callable, *args) -> None:
+        '''
+        Queues fn(*args) on the lane of datanode, raising the error of any batch that already failed
+        '''
+        self.check()
+        self.slots.acquire()
+        if datanode not in self.lanes:
+            self.lanes[datanode] = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"upload-{datanode}")
+        try:
+            future = self.lanes[datanode].submit(fn, *args)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        self.futures.append(future)
+
+    def check(self) -> None:
+        '''
+        Raises the error of the first failed batch and forgets the batches that completed
+        '''
+        pending = []
+        for future in self.futures:
+            if not future.done():
+                pending.append(future)
+            elif future.exception() is not None:
+                raise future.exception()
+        self.futures = pending
+
+    def wait(self) -> None:
+        '''
+        Waits until every queued batch is acknowledged, raises the error of the first that failed
+        '''
+        wait(self.futures)
+        self.check()
+
+    def close(self, cancel: bool = False) -> None:
+        '''
+        Stops the lanes once their running batch is done, dropping the queued ones if cancel
+        '''
+        for lane in self.lanes.values():
+            lane.shutdown(wait=True, cancel_futures=cancel)
+        self.lanes = {}
+        self.futures = []
+
+def write_replica_batch(datanode_num: int, rows: list) -> None:
+    '''
+    Helper function to store a batch of replicas on one datanode, with one executemany for datanode tables, which
+    pymysql sends as multi-row INSERTs, and one file per replica for file datanodes
+    Arguments:
+        datanode_num - Number of the datanode
+        rows - List of (data_blk_id, content)
+    '''
+    if datanodes.directory(datanode_num) is not None:
+        for data_blk_id, content in rows:
+            write_block_file(block_file(datanode_num, data_blk_id), content)
+        return
+    with datanode_cursor(datanode_num) as dn_cursor:
+        dn_cursor.executemany(f"INSERT INTO {datanodes.table(datanode_num)} VALUES (%s, %s)", rows)
+        if dn_cursor.rowcount != len(rows):
+            raise pymysql.err.IntegrityError(f"Datanode {datanode_num} stored {dn_cursor.rowcount} of {len(rows)} replicas")
+
+class BlockWriter:
+    '''
+    Writes the blocks of a put in batches. The replicas of every datanode are buffered and written with
+    write_replica_batch once PUT_BATCH_BYTES of content are pending for it, so a batch costs a few round trips
+    instead of one per replica. With PUT_PARALLEL the batches are uploaded by UploadLanes, each datanode on a
+    connection of its own; otherwise they are written in turn and file replicas right away.
+    The replicas are written before the put opens its namespace mutation, so none of them belongs to its transaction:
+    the Block_info_table rows are kept and inserted by insert_blocks once the file is published.
+    Used as a context manager: leaving the with block waits until every replica is acknowledged and deletes the
+    replicas written so far if anything failed
+    '''
+    def __init__(self) -> None:
+        self.lanes = UploadLanes() if PUT_PARALLEL else None
+        self.replicas = {}
+        self.pending_bytes = {}
+        self.added = []
+
+    def __enter__(self) -> "BlockWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        if exc_type is not None:
+            self.abort()
+            return False
+        try:
+            self.flush()
+            if self.lanes is not None:
+                self.lanes.wait()
+                self.lanes.close()
+        except BaseException:
+            self.abort()
+            raise
+        return False
+
+    def add(self, block: BlockInfo, content: bytes) -> None:
+        '''
+        Queues the replicas of a block, writing the batch of a datanode once PUT_BATCH_BYTES are pending for it
+        '''
+        self.added.append(block)
+        replicas = block_replicas(block)
+        if self.lanes is None:
+            files = [(datanode_num, data_blk_id) for datanode_num, data_blk_id in replicas if datanodes.directory(datanode_num) is not None]
+            if files:
+                write_replicas([datanode_num for datanode_num, _ in files], [data_blk_id for _, data_blk_id in files], content)
+            replicas = [(datanode_num, data_blk_id) for datanode_num, data_blk_id in replicas if datanodes.directory(datanode_num) is None]
+        for datanode_num, data_blk_id in replicas:
+            self.replicas.setdefault(datanode_num, []).append((data_blk_id, content))
+            self.pending_bytes[datanode_num] = self.pending_bytes.get(datanode_num, 0) + len(content)
+            if self.pending_bytes[datanode_num] >= PUT_BATCH_BYTES:
+                self.flush_datanode(datanode_num)
+
+    def flush_datanode(self, datanode_num: int) -> None:
+        '''
+        Writes or submits the queued replicas of one datanode
+        '''
+        rows = self.replicas.pop(datanode_num)
+        del self.pending_bytes[datanode_num]
+        if self.lanes is None:
+            write_replica_batch(datanode_num, rows)
+        else:
+            self.lanes.submit(datanode_num, write_replica_batch, datanode_num, rows)
+
+    def flush(self) -> None:
+        '''
+        Writes or submits the queued replicas of every datanode
+        '''
+        for datanode_num in list(self.replicas):
+            self.flush_datanode(datanode_num)
+
+    def insert_blocks(self, cursor, inode_num: str) -> None:
+        '''
+        Inserts the Block_info_table rows of every block added, with the cursor of the namespace mutation that
+        publishes the file
+        '''
+        if self.added:
+            cursor.executemany(BLOCK_INSERT, [(block.blk_id, inode_num, *block[1:]) for block in self.added])
+
+    def abort(self) -> None:
+        '''
+        Drops the queued batches and deletes the replicas of every block added so far
+        '''
+        if self.lanes is not None:
+            self.lanes.close(cancel=True)
+        discard_blocks(self.added)
+
+class BlockSizer:
+    '''
+    Cuts the rows of a put into blocks of about target bytes once encoded in block_format. Rows are cut on the running
+    sum of their widths, so wide and narrow rows weigh what they take, into the fewest blocks that fit target, all
+    about the same size. For csv the widths are the exact lengths of the CSV lines and the blocks are sliced out of
+    that one encoding. For arrow and parquet they are estimated from the column types and scaled by the ratio of
+    encoded to estimated bytes of the last block, the rows left are cut again whenever a block misses its estimate
+    by more than PUT_BLOCK_TOLERANCE of target, and a block that still ends up that far over target is split in half
+    '''
+    def __init__(self, target: int, block_format: str) -> None:
+        self.target = target
+        self.block_format = block_format
+        self.ratio = 1.0
+
+    def cut(self, df: pd.DataFrame) -> list:
+        '''
+        Returns:
+            blocks - List of (chunk, raw) with the rows and the encoded content (before compression) of each block
+        '''
+        if df.shape[0] == 0:
+            return []
+        if self.block_format == 'csv':
+            text = encode_csv(df)
+            ends = np.flatnonzero(np.frombuffer(text, dtype=np.uint8) == ord("\n"))
+            if len(ends) == df.shape[0] + 1:
+                header = int(ends[0]) + 1
+                bounds = self.bounds(np.diff(ends), header)
+                return [(df.iloc[start:end], text[:header] + text[ends[start]+1:ends[end]+1]) for start, end in zip(bounds, bounds[1:])]
+            # Line breaks inside values, fall back on the estimate
+        widths = self.estimate(df)
+        blocks = []
+        start = 0
+        while start < df.shape[0]:
+            ratio = self.ratio
+            bounds = self.bounds(widths[start:]*ratio, 0)
+            for low, high in zip(bounds, bounds[1:]):
+                estimated = float(widths[start+low:start+high].sum())
+                blocks.extend(self.encode(df.iloc[start+low:start+high], estimated))
+                if abs(len(blocks[-1][1]) - estimated*ratio) > self.target*PUT_BLOCK_TOLERANCE:
+                    # The estimate was off, cut the rows left again with the ratio corrected by this block
+                    break
+            start += high
+        return blocks
+
+    def bounds(self, widths: np.ndarray, header: int) -> list:
+        '''
+        Returns the row positions where blocks start followed by the number of rows, splitting the widths (plus a
+        header per block) into the fewest parts of at most target bytes, all of about the same sum
+        '''
+        total = float(widths.sum())
+        parts = max(1, ceil(total/max(self.target - header, 1)))
+        cuts = np.searchsorted(np.cumsum(widths), total*np.arange(1, parts)/parts, side='right')
+        return sorted({0, *(int(cut) for cut in cuts if 0 < cut < len(widths)), len(widths)})
+
+    def estimate(self, df: pd.DataFrame) -> np.ndarray:
+        '''
+        Estimated bytes of every row in a columnar format: the width of numeric values, the length of text
+        '''
+        widths = np.zeros(df.shape[0])
+        for column in df.columns:
+            if pd.api.types.is_numeric_dtype(df[column].dtype):
+                widths += df[column].dtype.itemsize if hasattr(df[column].dtype, "itemsize") else 8
+            else:
+                widths += df[column].astype(str).str.len().to_numpy() + 4
+        return widths
+
+    def encode(self, chunk: pd.DataFrame, estimated: float) -> list:
+        raw = BLOCK_CODECS[self.block_format].encode(chunk)
+        if len(raw) > self.target*(1 + PUT_BLOCK_TOLERANCE) and chunk.shape[0] > 1:
+            half = chunk.shape[0]//2
+            share = estimated*half/chunk.shape[0]
+            return self.encode(chunk.iloc[:half], share) + self.encode(chunk.iloc[half:], estimated - share)
+        if estimated > 0:
+            self.ratio = len(raw)/estimated
+        return [(chunk, raw)]
+
+def store_block(writer: BlockWriter, chunk: pd.DataFrame, hash_val: object, offset: int, block_format: str, compression: str, bucket: int = None, function: str = None, bounds: tuple = (None, None), raw: bytes = None) -> BlockInfo:
+    '''
+    Helper function to encode, compress and store one block of a file with all its replicas
+    Arguments:
+        writer - BlockWriter of the put
+        chunk - Rows of the block, including the index column
+        hash_val - Hash attribute of the block
+        offset - Offset of the block in the file
+        block_format - Key of BLOCK_CODECS
+        compression - Key of COMPRESSION_CODECS
+        bucket - Bucket of the block with partitioning=hash or range
+        function - bucket_function of the file with partitioning=hash or range
+        bounds - range_bounds of the block with partitioning=range
+        raw - chunk already encoded in block_format, as BlockSizer cuts it
+    Returns:
+        block - BlockInfo of the stored block
+    '''
+    if raw is None:
+        raw = BLOCK_CODECS[block_format].encode(chunk)
+    content = COMPRESSION_CODECS[compression].compress(raw)
+    block_id = "".join(choices(string.ascii_letters, k=32))
+    data_block_id1 = "".join(choices(string.ascii_letters, k=32))
+    data_block_id2 = "".join(choices(string.ascii_letters, k=32))
+    data_block_ids = [data_block_id1, data_block_id2]
+    datanode_nums = datanodes.place(block_id)
+    block = BlockInfo(block_id, str(hash_val), len(content), offset, data_block_ids[0], datanode_nums[0], data_block_ids[1], datanode_nums[1], block_format, compression, len(raw), bucket, function, *bounds)
+    writer.add(block, content)
+    return block
+
+class IngestError(Exception):
+    pass
+
+def discard_blocks(blocks: list) -> None:
+    '''
+    Helper function deleting the replicas of the blocks of a failed put, each datanode over a connection of its own
+    '''
+    replicas = {}
+    for block in blocks:
+        for datanode_num, data_blk_id in block_replicas(block):
+            replicas.setdefault(datanode_num, []).append(data_blk_id)
+    for datanode_num, data_blk_ids in replicas.items():
+        delete_data_blocks(datanode_num, data_blk_ids)
+
+def hash_keys(column: pd.Series) -> pd.Series:
+    '''
+    Helper function returning the hash attribute of every row of a chunk of the hash column, missing values become 0 or NULL like in put
+    '''
+    if pd.api.types.is_numeric_dtype(column.dtype):
+        return column.fillna(0).astype(str)
+    return column.fillna("NULL").astype(str)
+
+PARTITIONINGS = ("value", "hash", "range")
+BUCKET_FUNCTION = re.compile(r"^(md5|range)-(num|text):(\d+):(.*)$", re.S)
+
+def bucket_function(dtype: object, buckets: int, column: str, scheme: str = "md5") -> str:
+    '''
+    Helper function describing how the rows of a file put with partitioning=hash or range were spread over its
+    buckets, recorded with its blocks: <md5|range>-<num|text>:<buckets>:<column>
+    '''
+    return f"{scheme}-{'num' if pd.api.types.is_numeric_dtype(dtype) else 'text'}:{buckets}:{column}"
+
+def bucket_keys(column: pd.Series) -> pd.Series:
+    '''
+    Helper function returning the text that is hashed for every value of the hash column. Integral floats lose
+    their .0, so a key hashes the same whether missing values made its column float or not
+    '''
+    keys = hash_keys(column)
+    if pd.api.types.is_float_dtype(column.dtype):
+        keys = keys.str.replace(r"\.0$", "", regex=True)
+    return keys
+
+def bucket_ids(column: pd.Series, buckets: int) -> np.ndarray:
+    '''
+    Helper function returning the bucket of every value of the hash column, the first 8 bytes of the MD5 of its key
+    modulo buckets. Each distinct key is only hashed once
+    '''
+    codes, uniques = pd.factorize(bucket_keys(column))
+    return np.array([ring_hash(key) % buckets for key in uniques], dtype=np.int64)[codes]
+
+def range_values(column: pd.Series, numeric: bool) -> pd.Series:
+    '''
+    Helper function returning the values of the range column as they are compared, missing values become 0 or NULL like in put
+    '''
+    return column.fillna(0) if numeric else column.fillna("NULL").astype(str)
+
+def split_points(sample: pd.Series, partitions: int) -> list:
+    '''
+    Helper function returning the split points of partitions ranges of about the same number of rows, the quantiles
+    of a sample of the range column. Repeated values can't be split, so heavy values give fewer ranges
+    Arguments:
+        sample - Sample of the range column
+        partitions - Number of ranges wanted
+    Returns:
+        points - Sorted distinct values, range i holds points[i-1] <= value < points[i]
+    '''
+    values = np.sort(range_values(sample, pd.api.types.is_numeric_dtype(sample.dtype)).to_numpy())
+    if len(values) == 0:
+        return []
+    points = [values[len(values)*i//partitions] for i in range(1, partitions)]
+    # A shorter text still splits the ranges, and keeps the JSON of the bounds within their column
+    points = [point[:100] if isinstance(point, str) else point.item() if isinstance(point, np.generic) else point for point in points]
+    return sorted(set(points))
+
+def range_ids(column: pd.Series, points: list) -> np.ndarray:
+    '''
+    Helper function returning the range of every value of the range column
+    '''
+    if pd.api.types.is_numeric_dtype(column.dtype):
+        return np.searchsorted(np.array(points, dtype=float), range_values(column, True).to_numpy(dtype=float), side='right')
+    return np.searchsorted(np.array(points, dtype=object), range_values(column, False).to_numpy(dtype=object), side='right')
+
+def range_bounds(points: list, partition: int) -> tuple[Union[str, None], Union[str, None]]:
+    '''
+    Helper function returning the JSON of the lower (inclusive) and upper (exclusive) bound of a range, None if unbounded
+    '''
+    low = json.dumps(points[partition-1]) if partition > 0 else None
+    high = json.dumps(points[partition]) if partition < len(points) else None
+    return low, high
+
+def lookup_key(hash: str, function: str) -> tuple[str, str, object]:
+    '''
+    Helper function parsing a value given to a read of a file put with partitioning=hash or range
+    Arguments:
+        hash - Value from the request, a Python literal or plain text
+        function - bucket_function of the blocks of the file
+    Returns:
+        key - The key as bucket_keys writes it
+        column - The hash or range column
+        value - The value to compare with the range column
+    '''
+    _, kind, _, column = BUCKET_FUNCTION.match(function).groups()
+    try:
+        value = literal_eval(hash)
+    except (ValueError, SyntaxError):
+        value = hash
+    if kind == 'text' and not isinstance(value, str):
+        # Text keys are hashed as written, only quotes are taken off
+        value = hash
+    if kind == 'num' and not isinstance(value, (int, float)):
+        raise ValueError(f"{hash} is not a number, {column} is numeric")
+    if kind == 'num' and isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value), column, value
+
+def key_bucket(key: str, function: str) -> int:
+    '''
+    Helper function returning the bucket holding a key of a file put with partitioning=hash
+    '''
+    return ring_hash(key) % int(BUCKET_FUNCTION.match(function).group(3))
+
+def key_rows(df: pd.DataFrame, function: str, hash: str = None, low: str = None, high: str = None) -> pd.Series:
+    '''
+    Helper function returning which rows of a partition of a file put with partitioning=hash or range hold the key
+    hash and lie between low and high, since the partitions picked for them also hold other values
+    '''
+    _, kind, _, column = BUCKET_FUNCTION.match(function).groups()
+    mask = pd.Series(True, index=df.index)
+    if hash:
+        mask &= bucket_keys(df[column]) == lookup_key(hash, function)[0]
+    if low or high:
+        values = range_values(df[column], kind == 'num')
+        if low:
+            mask &= values >= lookup_key(low, function)[2]
+        if high:
+            mask &= values <= lookup_key(high, function)[2]
+    return mask
+
+def in_range(block: BlockInfo, low: object = None, high: object = None) -> bool:
+    '''
+    Helper function telling if the range of a block of a file put with partitioning=range can hold values between
+    low and high (both inclusive, None for unbounded)
+    '''
+    if low is not None and block.range_high is not None and low >= json.loads(block.range_high):
+        return False
+    if high is not None and block.range_low is not None and high < json.loads(block.range_low):
+        return False
+    return True
+
+def conform_chunk(chunk: pd.DataFrame, dtypes: pd.Series) -> pd.DataFrame:
+    '''
+    Helper function giving a chunk of a streamed put the column types of its first chunk, since the CSV reader infers
+    them chunk by chunk. Integer columns that got floats because of missing values become nullable Int64, so their
+    values keep the same text in every block
+    '''
+    for column, dtype in dtypes.items():
+        if column not in chunk.columns or chunk[column].dtype == dtype:
+            continue
+        if pd.api.types.is_integer_dtype(dtype):
+            if not pd.api.types.is_integer_dtype(chunk[column].dtype):
+                chunk[column] = chunk[column].astype("Int64")
+        elif pd.api.types.is_float_dtype(dtype):
+            chunk[column] = chunk[column].astype(dtype)
+        elif pd.api.types.is_bool_dtype(dtype):
+            chunk[column] = chunk[column].astype("boolean")
+        else:
+            chunk[column] = chunk[column].astype(object)
+    return chunk
+
+def sample_column(source: str, column: str, fraction: float) -> pd.Series:
+    '''
+    Helper function for put with stream=true and partitioning=range, reading only the range column of source, chunk
+    by chunk, and keeping a random fraction of its rows
+    '''
+    rng = np.random.default_rng(0)
+    parts = [chunk[column].sample(frac=fraction, random_state=rng) for chunk in pd.read_csv(source, usecols=[column], chunksize=PUT_CHUNK_ROWS)]
+    return pd.concat(parts) if parts else pd.Series(dtype=object)
+
+class UploadStream(RawIOBase):
+    '''
+    File of the CSV sent in the body of an upload request, either raw or as the first file of a multipart/form-data
+    body, which is decoded as it arrives instead of being spooled to a temporary file first. A thread receives the
+    body UPLOAD_READ_BYTES at a time, up to UPLOAD_READ_AHEAD reads ahead of the reader, so the network transfer
+    overlaps parsing and the writes to the datanodes
+    '''
+    name = "the uploaded file"
+
+    def __init__(self, stream, boundary: str = None) -> None:
+        super().__init__()
+        self.stream = stream
+        self.decoder = MultipartDecoder(boundary.encode()) if boundary else None
+        self.chunks = queue.Queue(maxsize=UPLOAD_READ_AHEAD)
+        self.stopped = threading.Event()
+        self.buffer = memoryview(b"")
+        self.body_done = False
+        self.in_file = False
+        self.file_done = False
+        self.received = 0
+        threading.Thread(target=self.receive, name="upload-receive", daemon=True).start()
+
+    def readable(self) -> bool:
+        return True
+
+    def receive(self) -> None:
+        try:
+            while not self.stopped.is_set():
+                data = self.stream.read(UPLOAD_READ_BYTES)
+                self.enqueue(data)
+                if not data:
+                    return
+        except Exception as e:
+            self.enqueue(e)
+
+    def enqueue(self, item: object) -> None:
+        while not self.stopped.is_set():
+            try:
+                self.chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def body(self) -> bytes:
+        '''
+        Returns the next bytes of the request body, b"" at its end
+        '''
+        if self.body_done:
+            return b""
+        item = self.chunks.get()
+        if isinstance(item, Exception):
+            raise IngestError(f"put: Receiving the upload failed: {item}")
+        self.body_done = not item
+        return item
+
+    def file_data(self) -> bytes:
+        '''
+        Returns the next bytes of the file, b"" at its end
+        '''
+        if self.decoder is None:
+            return self.body()
+        while not self.file_done:
+            try:
+                event = self.decoder.next_event()
+            except ValueError as e:
+                raise IngestError(f"put: Invalid multipart body: {e}")
+            if isinstance(event, NeedData):
+                if self.body_done:
+                    raise IngestError("put: The multipart body ended before the file did")
+                self.decoder.receive_data(self.body() or None)
+            elif isinstance(event, File):
+                self.in_file = True
+            elif isinstance(event, Data) and self.in_file:
+                self.file_done = not event.more_data
+                if event.data:
+                    return event.data
+            elif isinstance(event, Epilogue):
+                raise IngestError("put: No file in the multipart body")
+        return b""
+
+    def readinto(self, buffer) -> int:
+        if not self.buffer:
+            self.buffer = memoryview(self.file_data())
+        size = min(len(buffer), len(self.buffer))
+        buffer[:size] = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        self.received += size
+        return size
+
+    def close(self) -> None:
+        self.stopped.set()
+        super().close()
+
+def stream_blocks(writer: BlockWriter, source: Union[str, RawIOBase], hash_attr: str, partition_size: int, block_format: str, compression: str, partitioning: str = "value", partitions: int = None) -> tuple[list, int]:
+    '''
+    Helper function for put with stream=true. Reads source PUT_CHUNK_ROWS rows at a time and appends the rows of every
+    hash value to a buffer of its own. Once a buffer holds two blocks' worth of bytes it is cut by BlockSizer and all
+    but its last block are stored, the last one stays buffered for the rows to come.
+    Past PUT_MAX_OPEN_PARTITIONS buffers the fullest one is stored early, so memory stays around
+    2*PUT_MAX_OPEN_PARTITIONS blocks plus one chunk whatever the size of the file.
+    Without a hash column the rows are stored in file order, with the range of their index as hash attribute.
+    With partitioning=hash or range the rows are buffered per hash bucket or range instead of per value, the split
+    points of the ranges come from a first pass over the range column (see sample_column), so partitioning=range
+    needs a path.
+    Column types are those of the first chunk, raises IngestError if a later chunk doesn't fit them
+    Arguments:
+        writer - BlockWriter of the put
+        source - Path of the CSV file in the local file system, or a file read once from start to end (UploadStream)
+        hash_attr - The column on which the file is hashed
+        partition_size - Target size of a block in bytes of block_format, before compression
+        block_format - Key of BLOCK_CODECS
+        compression - Key of COMPRESSION_CODECS
+        partitioning - One of PARTITIONINGS
+        partitions - Number of hash buckets or ranges for partitioning=hash or range
+    Returns:
+        blocks - List of BlockInfo of the stored blocks, ordered by offset
+        num_rows - Number of rows of the file
+    '''
+    blocks = []
+    buffers = {}
+    buffered = {}
+    num_rows = 0
+
+    sizer = BlockSizer(partition_size, block_format)
+
+    def store(key: object, data: pd.DataFrame, raw: bytes) -> None:
+        if function is not None:
+            bounds = range_bounds(points, int(key)) if partitioning == 'range' else (None, None)
+            blocks.append(store_block(writer, data, key, len(blocks), block_format, compression, int(key), function, bounds, raw))
+            return
+        hash_val = key if key is not None else f"[{data['index'].iloc[0]}, {data['index'].iloc[-1]}]"
+        blocks.append(store_block(writer, data, hash_val, len(blocks), block_format, compression, raw=raw))
+
+    def flush(key: object, partial: bool) -> None:
+        frames = buffers.pop(key)
+        del buffered[key]
+        cut = sizer.cut(pd.concat(frames) if len(frames) > 1 else frames[0])
+        if not partial:
+            # The last block is cut from the rows buffered so far, it waits for the next ones to fill up
+            data, raw = cut.pop()
+            buffers[key] = [data]
+            buffered[key] = len(raw)
+        for data, raw in cut:
+            store(key, data, raw)
+
+    name = getattr(source, "name", source)
+    reader = pd.read_csv(source, chunksize=PUT_CHUNK_ROWS)
+    sample = next(reader, None)
+    if sample is None:
+        # Only a header
+        return blocks, num_rows
+    # Bytes of a row estimated on the first chunk, to know when a buffer holds enough of them to be cut
+    sample_bytes = max(len(encode_csv(sample)), 1)
+    row_bytes = sample_bytes/max(sample.shape[0], 1)
+    dtypes = sample.dtypes
+    if partitioning != 'value' and hash_attr not in dtypes:
+        raise IngestError(f"put: Hash column {hash_attr} not found in {name}")
+    function = None
+    points = []
+    if partitioning == 'hash':
+        function = bucket_function(dtypes[hash_attr], partitions, hash_attr)
+    elif partitioning == 'range':
+        # Rows of the file estimated from the first chunk, to sample about PUT_RANGE_SAMPLE_ROWS of them
+        estimated_rows = sample.shape[0]*os.path.getsize(source)/sample_bytes
+        points = split_points(sample_column(source, hash_attr, min(1, PUT_RANGE_SAMPLE_ROWS/max(estimated_rows, 1))), partitions)
+        function = bucket_function(dtypes[hash_attr], len(points) + 1, hash_attr, "range")
+    chunks = chain((sample,), reader)
+    del sample
+    for chunk in chunks:
+        try:
+            chunk = conform_chunk(chunk, dtypes)
+        except (ValueError, TypeError) as e:
+            raise IngestError(f"put: {name} doesn't keep the column types of its first {PUT_CHUNK_ROWS} rows ({e}), " + \
+                "put it without stream or raise PUT_CHUNK_ROWS")
+        # The reader numbers the rows of every chunk from where the previous one ended
+        chunk = chunk.reset_index()
+        num_rows += chunk.shape[0]
+        if partitioning == 'hash':
+            groups = chunk.groupby(bucket_ids(chunk[hash_attr], partitions), sort=False)
+        elif partitioning == 'range':
+            groups = chunk.groupby(range_ids(chunk[hash_attr], points), sort=False)
+        else:
+            groups = chunk.groupby(hash_keys(chunk[hash_attr]), sort=False) if hash_attr in chunk.columns else [(None, chunk)]
+        for key, data in groups:
+            buffers.setdefault(key, []).append(data)
+            buffered[key] = buffered.get(key, 0) + len(data)*row_bytes
+            if buffered[key] >= 2*partition_size:
+                flush(key, False)
+        if len(buffers) > PUT_MAX_OPEN_PARTITIONS:
+            for key in heapq.nlargest(len(buffers) - PUT_MAX_OPEN_PARTITIONS, buffered, key=buffered.get):
+                flush(key, True)
+    for key in list(buffers):
+        flush(key, True)
+    return blocks, num_rows
+
 @app.route('/put', methods=['GET'])
 def put() -> tuple[object, int]:
     '''
-    This function puts the file specified into the EDFS. Returns error if the path is invalid or file is invalid
+    This function puts the file specified into the EDFS. Returns error if the path is invalid, the destination exists or file is invalid.
+    The replicas of each block go to the datanodes picked by the hash ring of the datanode registry.
+    With stream=true the file is read in chunks instead of all at once (see stream_blocks).
+    Blocks are written in batches by BlockWriter, concurrently on every datanode with PUT_PARALLEL, and the response
+    reports the ingest throughput
     Arguments:
         source: Path of the file in the local file system
         destination: Path of the file in the EDFS
         Optional:
             partitions: Number of partitions of the file to be stored
             hash: The column on which the file is to be hashed
+            format: Format of the stored blocks, csv, arrow or parquet (default BLOCK_FORMAT)
+            compression: Compression of the stored blocks, none, zlib, lzma, zstd or lz4 (default BLOCK_COMPRESSION)
+            stream: true to ingest the file in bounded memory
+            partitioning: value for a partition per distinct value of hash (default), hash for exactly partitions
+                buckets of hash, picked by a stable hash of the value (see bucket_ids), or range for partitions ranges
+                of hash with about as many rows each, split on the quantiles of a sample (see split_points)
     '''
+    start = time.perf_counter()
     args = request.args.to_dict()
     source = args['source']
     if not os.path.exists(source):
@@ -345,135 +3219,221 @@ def put() -> tuple[object, int]:
             "response": f"put: Invalid file: {source}",
             "status": "EDFS400"
         }, 200
+    return ingest_file(source, args, os.path.getsize(source), get_bool_arg(args, 'stream'), start)
+
+def parent_path(path: str) -> str:
+    '''
+    Helper function returning the path of the directory holding path
+    '''
+    return '/'.join(path.split('/')[:-1]) or '/'
+
+def destination_error(destination: str) -> str:
+    '''
+    Helper function for put and upload checking that the parent of the destination is a directory and that nothing
+    is stored at the destination yet
+    Returns:
+        error - The error message, or an empty string if the file can be stored there
+    '''
+    parent = namespace.lookup(parent_path(destination))
+    if parent is None:
+        return f"Path does not exist: {destination}"
+    if parent.node_type != 'd':
+        return f"put: {parent.name}: Not a directory"
+    if namespace.lookup(destination) is not None:
+        return f"put: {destination}: File exists"
+    return ""
+
+def ingest_file(source: Union[str, UploadStream], args: dict, file_size: int, stream: bool, start: float) -> tuple[object, int]:
+    '''
+    Helper function for put and upload storing a CSV file in the EDFS, with the arguments of put.
+    Arguments:
+        source - Path of the file in the local file system, or the UploadStream of an upload
+        args - Arguments of the request
+        file_size - Size of the file in bytes, None if unknown until it is read
+        stream - true to ingest the file in bounded memory (see stream_blocks)
+        start - perf_counter at the start of the request, for the throughput in the response
+    '''
+    block_format = args.get('format', BLOCK_FORMAT)
+    if block_format not in BLOCK_CODECS:
+        return {
+            "response": f"put: Unsupported block format: {block_format}",
+            "status": "EDFS400"
+        }, 200
+    compression = args.get('compression', BLOCK_COMPRESSION)
+    if compression not in COMPRESSION_CODECS:
+        return {
+            "response": f"put: Unsupported compression: {compression}",
+            "status": "EDFS400"
+        }, 200
     destination = args['destination']
-    _, missingChildDepth = is_valid_path(list(filter(None, destination.split("/")))[:-1])
-    if missingChildDepth != -1:
+    error = destination_error(destination)
+    if error:
         return {
-            "response": f"Path does not exist: {destination}",
+            "response": error,
             "status": "EDFS400"
         }, 200
-    curParent = '/'.join(destination.split('/')[:-1])
     partitions = int(args['partitions'])
     hash_attr = 0
     if 'hash' in args:
         hash_attr = args['hash']
-    file_size = os.path.getsize(source)
-    partition_size = min(ceil(file_size/partitions), MAX_PARTITION_SIZE)
-    conn = pymysql.connect(
-        host=HOST_NAME,
-        user=DB_USERNAME, 
-        password = DB_PASSWORD,
-        database=DATABASE
-    )
-    cursor = conn.cursor()
-    query = "INSERT INTO Namenode VALUES (" + \
-        "UUID()," + \
-        "'-'," + \
-        f"'{destination}'," + \
-        f"{REPLICATION_FACTOR}," + \
-        "NULL," + \
-        "NULL," + \
-        "NOW()," + \
-        f"{DEFAULT_FILE_PERMISSION}" + \
-        ")"
-    cursor.execute(query)
-    cursor.execute(f"SELECT nn.inode_num, nn2.inode_num FROM Namenode nn, Namenode nn2 WHERE nn.name = '{destination}' AND nn2.name = '{curParent}'")
-    res = cursor.fetchall()
-    inode_num = res[0][0]
-    parent_inode_num = res[0][1]
-    blk_info_query = "INSERT INTO Block_info_table VALUES (" + \
-        "'{}'," + \
-        f"'{inode_num}'," + \
-        "'{}'," + \
-        "{}," + \
-        "{}," + \
-        "'{}'," + \
-        "{}," + \
-        "'{}'," + \
-        "{}" + \
-        ")"
-    datanode_query = "INSERT INTO Datanode_{} VALUES (" + \
-        "'{}'," + \
-        "\"{}\"" + \
-        ")"
-    parent_child_query = "INSERT INTO Parent_Child VALUES ('{}', '{}')"
-    df = pd.read_csv(source)
-    df = df.reset_index()
-    rowsPerPartition = ceil((df.shape[0]*partition_size)/file_size)
-    offset = 0
+    partitioning = args.get('partitioning', 'value')
+    if partitioning not in PARTITIONINGS or (partitioning != 'value' and 'hash' not in args):
+        return {
+            "response": f"put: Unsupported partitioning: {partitioning}" if partitioning not in PARTITIONINGS else \
+                f"put: partitioning={partitioning} needs a hash column",
+            "status": "EDFS400"
+        }, 200
+    # Hash buckets and ranges are only split into several blocks if they outgrow MAX_PARTITION_SIZE, as are files of
+    # unknown size
+    partition_size = min(ceil(file_size/partitions), MAX_PARTITION_SIZE) if partitioning == 'value' and file_size else MAX_PARTITION_SIZE
+    # The blocks are written before the namespace is touched, so the mutation lock and the generation row are only
+    # held for the few statements that publish the file, however long it takes to read or receive
     try:
-        if np.issubdtype(df[hash_attr].dtypes, np.number):
-            df[hash_attr].fillna(0, inplace=True)
-        else:
-            df[hash_attr].fillna("NULL", inplace=True)
-        groups = df.groupby(by=hash_attr)
-        
-    except KeyError:
-        df["hash"] = pd.cut(x=df[df.columns[0]], bins=partitions)
-        df["hash"] = df["hash"].astype(str)
-        groups = df.groupby(by="hash")
-        del df["hash"]
-    for hash_val, data in groups:
-        num_partitions = ceil(data.shape[0]/rowsPerPartition)
-        for chunk in np.array_split(data, num_partitions):
-            chunk_str = chunk.to_csv(index=False)
-            block_id = "".join(choices(string.ascii_letters, k=32))
-            data_block_id1 = "".join(choices(string.ascii_letters, k=32))
-            data_block_id2 = "".join(choices(string.ascii_letters, k=32))
-            data_block_ids = [data_block_id1, data_block_id2]
-            datanode_nums = sample(range(1, 4), REPLICATION_FACTOR)
-            for i in range(REPLICATION_FACTOR):
-                cursor.execute(datanode_query.format(datanode_nums[i], data_block_ids[i], chunk_str))
-            cursor.execute(blk_info_query.format(block_id, hash_val, getsizeof(chunk_str), offset, data_block_ids[0], datanode_nums[0], data_block_ids[1], datanode_nums[1]))
-            offset += 1
-    cursor.execute(parent_child_query.format(parent_inode_num, inode_num))
-    cursor.close()
-    conn.commit()
-    conn.close()
+        with BlockWriter() as writer:
+            if stream:
+                blocks, num_rows = stream_blocks(writer, source, hash_attr, partition_size, block_format, compression, partitioning, partitions)
+            else:
+                df = pd.read_csv(source)
+                df = df.reset_index()
+                num_rows = df.shape[0]
+                sizer = BlockSizer(partition_size, block_format)
+                offset = 0
+                blocks = []
+                function = None
+                points = []
+                if partitioning != 'value' and hash_attr not in df.columns:
+                    raise IngestError(f"put: Hash column {hash_attr} not found in {source}")
+                if partitioning == 'hash':
+                    function = bucket_function(df[hash_attr].dtype, partitions, hash_attr)
+                    groups = df.groupby(bucket_ids(df[hash_attr], partitions))
+                elif partitioning == 'range':
+                    sample = df[hash_attr].sample(n=min(PUT_RANGE_SAMPLE_ROWS, num_rows), random_state=0)
+                    points = split_points(sample, partitions)
+                    function = bucket_function(df[hash_attr].dtype, len(points) + 1, hash_attr, "range")
+                    groups = df.groupby(range_ids(df[hash_attr], points))
+                else:
+                    try:
+                        groups = df.groupby(hash_keys(df[hash_attr]))
+                    except KeyError:
+                        df["hash"] = pd.cut(x=df[df.columns[0]], bins=partitions)
+                        df["hash"] = df["hash"].astype(str)
+                        groups = df.groupby(by="hash")
+                        del df["hash"]
+                for hash_val, data in groups:
+                    for chunk, raw in sizer.cut(data):
+                        blocks.append(store_block(writer, chunk, hash_val, offset, block_format, compression,
+                            int(hash_val) if function else None, function,
+                            range_bounds(points, int(hash_val)) if partitioning == 'range' else (None, None), raw))
+                        offset += 1
+    except IngestError as e:
+        return {
+            "response": str(e),
+            "status": "EDFS400"
+        }, 200
+    try:
+        with mysql_connection() as conn, namespace.mutation(conn) as cursor:
+            # Another request may have taken the destination or removed its parent meanwhile
+            error = destination_error(destination)
+            if not error:
+                inode_num = str(uuid4())
+                cursor.execute(
+                    "INSERT INTO Namenode (inode_num, node_type, name, replication, mtime, atime, ctime, permission, num_bytes, num_rows, num_partitions) " + \
+                        "VALUES (%s, '-', %s, %s, NULL, NULL, NOW(), %s, %s, %s, %s)",
+                    (inode_num, destination, REPLICATION_FACTOR, DEFAULT_FILE_PERMISSION, sum(block.num_bytes for block in blocks), num_rows, len(blocks))
+                )
+                cursor.execute("INSERT INTO Parent_Child VALUES (%s, %s)", (namespace.lookup(parent_path(destination)).inode, inode_num))
+                writer.insert_blocks(cursor, inode_num)
+                namespace.add(destination, inode_num, '-', int(DEFAULT_FILE_PERMISSION), None, blocks, num_rows)
+    except BaseException:
+        discard_blocks(blocks)
+        raise
+    if error:
+        discard_blocks(blocks)
+        return {
+            "response": error,
+            "status": "EDFS400"
+        }, 200
+    if isinstance(source, UploadStream):
+        file_size = source.received
+    elapsed = time.perf_counter() - start
+    response = f"put: {num_rows} rows in {len(blocks)} blocks, {file_size/2**20:.1f} MB in {elapsed:.1f} s " + \
+        f"({file_size/2**20/elapsed:.1f} MB/s)"
     return {
-        "response": "",
+        "response": response,
         "status": "EDFS200"
     }, 200
 
+@app.route('/upload', methods=['POST'])
+def upload() -> tuple[object, int]:
+    '''
+    This function puts the CSV file sent in the body of the request into the EDFS, instead of one in the local file
+    system of the server. The file is ingested like put with stream=true as it arrives (see UploadStream), so nothing
+    is staged on the server. The body is received and its blocks stored before the namespace is locked, so a slow client
+    only holds up its own request. The body is either the file itself, sent with a Content-Length or chunked, or a
+    multipart/form-data form whose first file field is the file. Chunked bodies need a WSGI server that marks the end
+    of the input, as the Werkzeug development server and gunicorn do
+    Arguments:
+        destination: Path of the file in the EDFS
+        Optional:
+            partitions, hash, format, compression: As for put
+            partitioning: value (default) or hash, range samples the file before reading it, which needs a path
+    '''
+    start = time.perf_counter()
+    args = request.args.to_dict()
+    if args.get('partitioning') == 'range':
+        return {
+            "response": "put: partitioning=range needs a second pass over the file, put it from a path instead",
+            "status": "EDFS400"
+        }, 200
+    mimetype, options = parse_options_header(request.headers.get('Content-Type', ''))
+    boundary = None
+    if mimetype == 'multipart/form-data':
+        boundary = options.get('boundary')
+        if not boundary:
+            return {
+                "response": "put: multipart/form-data body without a boundary",
+                "status": "EDFS400"
+            }, 200
+    with UploadStream(request.stream, boundary) as source:
+        return ingest_file(source, args, request.content_length, True, start)
+
 @app.route('/getPartitionLocations', methods=['GET'])
 def getPartitionLocations() -> tuple[object, int]:
     '''
     This function returns the partition locations of a file in the EDFS. Returns error if path is invalid
     Arguments:
-        path: Path of the file/directory in the EDFS
+        path: Path of the file/directory in the EDFS, or a glob pattern such as /data/*/part*.csv
+        Optional:
+            regex: true to match path as a regular expression on the full path instead of a glob
+            low, high: Only the partitions of a file put with partitioning=range whose range overlaps low to high
     '''
     path = request.args.get('path')
-    response, status = getPartitionIds(path)
+    regex = get_bool_arg(request.args, 'regex')
+    low = request.args.get('low')
+    high = request.args.get('high')
+    if is_pattern(path, regex):
+        locations = {file_path: getPartitionIds(file_path, None, low, high)[0] for file_path in expand_paths(path, regex)}
+        return {
+            "response": locations if locations else f"{path}: No such file or directory",
+            "status": "EDFS200" if locations else "EDFS400"
+        }, 200
+    response, status = getPartitionIds(path, None, low, high)
     return {
         "response": response,
         "status": "EDFS"+str(status)
     }, 200
 
-def getPartitionIds(path: str, hash: str = None) -> tuple[Union[str, dict], int]:
+def getPartitionIds(path: str, hash: str = None, low: str = None, high: str = None) -> tuple[Union[str, dict], int]:
     _, missingChildDepth = is_valid_path(list(filter(None, path.split("/"))))
     if missingChildDepth != -1:
         return f"{path}: No such file or directory", 400
-    query = "SELECT bi.offset, bi.replica1_datanode_num, bi.replica1_data_blk_id, bi.replica2_datanode_num, bi.replica2_data_blk_id FROM Block_info_table bi" + \
-        " INNER JOIN Namenode nn ON nn.inode_num = bi.file_inode" + \
-        f" WHERE nn.name = '{path}'"
-    if hash:
-        try:
-            hash = literal_eval(hash)
-        except ValueError:
-            pass
-        query += f" AND bi.hash_attribute = '{hash}'"
-    query += " ORDER BY bi.offset"
-    conn = pymysql.connect(
-        host=HOST_NAME,
-        user=DB_USERNAME, 
-        password = DB_PASSWORD,
-        database=DATABASE
-    )
-    cursor = conn.cursor()
-    cursor.execute(query)
-    res = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    blocks = partition_blocks(path, hash, low, high)
+    if blocks is None:
+        return f"{path}: No such file or directory", 400
+    res = [
+        (block.offset, block.replica1_datanode_num, block.replica1_data_blk_id, block.replica2_datanode_num, block.replica2_data_blk_id)
+        for block in blocks
+    ]
     partitions = {
         "Replica 1": dict(),
         "Replica 2": dict()
@@ -506,11 +3466,8 @@ def readPartition() -> tuple[object, int]:
             "status": "EDFS400"
         }, 200
     response, status = readPartitionContent(path, partition)
-    df = pd.DataFrame()
     if status == 200:
-        csvStringIO = StringIO(response)
-        df = pd.read_csv(csvStringIO, sep=",")
-        df = df.sort_values(by='index')
+        df = response.sort_values(by='index')
         df = df.drop('index', axis=1)
         response = df.to_csv(index=False)
     return {
@@ -518,157 +3475,177 @@ def readPartition() -> tuple[object, int]:
         "status": "EDFS"+str(status)
     }, 200
 
-def readPartitionContent(path: str, partition: int) -> tuple[str, int]:
-    query = "SELECT IFNULL(" + \
-                "CONCAT(COALESCE(d1.content, ''), COALESCE(d2.content, ''), COALESCE(d3.content, '')), " + \
-                "CONCAT(COALESCE(d4.content, ''), COALESCE(d5.content, ''), COALESCE(d6.content, ''))" + \
-            ") AS content FROM Block_info_table bi" + \
-            " INNER JOIN Namenode nn ON nn.inode_num = bi.file_inode" + \
-            " LEFT JOIN Datanode_1 d1 ON d1.data_block_id = bi.replica1_data_blk_id" + \
-            " LEFT JOIN Datanode_2 d2 ON d2.data_block_id = bi.replica1_data_blk_id" + \
-            " LEFT JOIN Datanode_3 d3 ON d3.data_block_id = bi.replica1_data_blk_id" + \
-            " LEFT JOIN Datanode_1 d4 ON d4.data_block_id = bi.replica2_data_blk_id" + \
-            " LEFT JOIN Datanode_2 d5 ON d5.data_block_id = bi.replica2_data_blk_id" + \
-            " LEFT JOIN Datanode_3 d6 ON d6.data_block_id = bi.replica2_data_blk_id" + \
-            f" WHERE nn.name = '{path}' AND bi.offset = {int(partition) - 1}"
-    conn = pymysql.connect(
-        host=HOST_NAME,
-        user=DB_USERNAME, 
-        password = DB_PASSWORD,
-        database=DATABASE
-    )
-    cursor = conn.cursor()
-    cursor.execute(query)
-    res = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    if len(res) == 0:
-        return f"No content found for partition {partition} of file {path}", 400
-    return res[0][0], 200
+def partition_block(path: str, partition: int) -> Union[BlockInfo, None]:
+    '''
+    Helper function returning the BlockInfo of a partition of a file (1-indexed), None if there is no such partition
+    '''
+    offset = int(partition) - 1
+    node = namespace.lookup(path)
+    blocks = []
+    if node is not None and namespace.fsimage is not None:
+        blocks = [block for block in node.blocks or [] if block.offset == offset]
+    elif node is not None:
+        with mysql_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT {BLOCK_INFO_COLUMNS} FROM Block_info_table WHERE file_inode = %s AND offset = %s", (node.inode, offset))
+            blocks = [BlockInfo(*row) for row in cursor.fetchall()]
+            cursor.close()
+    return blocks[0] if blocks else None
 
-@app.route('/getAvg', methods = ['GET'])
-def getAvg() -> tuple[str, int]:
-    args = request.args.to_dict()
-    path = args["path"]
-    col = args["col"]
-    hash = None
-    if "hash" in args:
-        hash = args["hash"]
-    debug = False
-    if "debug" in args:
-        try:
-            debug = literal_eval(args["debug"])
-        except ValueError:
-            pass
-    data, status = readPartitionContent(path, 1)
-    if status != 200:
-        return data, status
-    csvStringIO = StringIO(data)
-    df = pd.read_csv(csvStringIO, sep=",")
-    try:
-        if not np.issubdtype(df[col].dtypes, np.number):
-            return {
-                "response": f"Cannot calculate average on column {col}: Data not numeric",
-                "status": "EDFS400"
-            }, 200
-    except KeyError:
+@app.route('/readBlock', methods=['GET'])
+def readBlock() -> Union[Response, tuple[object, int]]:
+    '''
+    This function returns a partition of a file as stored on its datanode, still encoded and compressed, with its
+    format and compression in the X-EDFS-Format and X-EDFS-Compression headers. Replicas on file datanodes are sent
+    with send_file, which WSGI servers providing wsgi.file_wrapper (e.g. gunicorn) serve with sendfile(2)
+    Arguments:
+        path: Path of the file in the EDFS
+        partition: Partition number to be read (1-indexed)
+    '''
+    path = request.args.get('path')
+    partition = request.args.get('partition')
+    block = partition_block(path, partition)
+    if block is None:
         return {
-            "response": f"Column {col} doesn't exist",
+            "response": f"No content found for partition {partition} of file {path}",
             "status": "EDFS400"
         }, 200
-    partitions, status = getPartitionIds(path, hash)
-    resultPromises = []
-    if status == 200:
-        with Pool(processes=max(len(partitions["Replica 1"]), len(partitions["Replica 2"]))) as pool:
-            if partitions["Replica 1"]:
-                resultPromises = [pool.apply_async(mapPartition, args=(path, partition, calcAvg, col, debug)) for partition, _ in partitions["Replica 1"].items()]
-            elif partitions["Replica 2"]:
-                resultPromises = [pool.apply_async(mapPartition, args=(path, partition, calcAvg, col, debug)) for partition, _ in partitions["Replica 2"].items()]
-            results = [promise.get() for promise in resultPromises]
-        pool.join()
-        response, red_status = reduce(results, combineAverages, debug)
+    headers = {"X-EDFS-Format": block.format, "X-EDFS-Compression": block.compression}
+    for datanode_num, data_blk_id in block_replicas(block):
+        if datanodes.directory(datanode_num) is not None:
+            try:
+                response = send_file(block_file(datanode_num, data_blk_id), mimetype="application/octet-stream")
+            except FileNotFoundError:
+                continue
+            response.headers.update(headers)
+            return response
+    content = replica_selector.read(block)
+    if content is None:
         return {
-            "response": response,
-            "status": "EDFS"+str(red_status)
+            "response": f"No content found for partition {partition} of file {path}",
+            "status": "EDFS400"
         }, 200
-    return {
-        "response": partitions,
-        "status": "EDFS"+str(status)
-    }, 200
+    return Response(content, mimetype="application/octet-stream", headers=headers)
 
-@app.route('/getMax', methods=['GET'])
-def getMax() -> tuple[str, int]:
-    args = request.args.to_dict()
-    path = args["path"]
-    col = args["col"]
-    hash = None
-    if "hash" in args:
-        hash = args["hash"]
-    debug = False
-    if "debug" in args:
-        try:
-            debug = literal_eval(args["debug"])
-        except ValueError:
-            pass
-    data, status = readPartitionContent(path, 1)
-    if status != 200:
-        return data, status
-    csvStringIO = StringIO(data)
-    df = pd.read_csv(csvStringIO, sep=",")
-    try:
-        if not np.issubdtype(df[col].dtypes, np.number):
-            return {
-                "response": f"Cannot calculate max on column {col}: Data not numeric",
-                "status": "EDFS400"
-            }, 200
-    except KeyError:
+@app.route('/readRange', methods=['GET'])
+def readRange() -> Union[Response, tuple[object, int]]:
+    '''
+    This function streams the rows of a file put with partitioning=range whose value of the range column lies between
+    low and high, sorted on it, as a chunked text/csv response. Only the partitions whose range overlaps low to high
+    are read, in the order of their ranges
+    Arguments:
+        path: Path of the file in the EDFS
+        Optional:
+            low: Lowest value of the range column to return (default unbounded)
+            high: Highest value of the range column to return (default unbounded)
+    '''
+    path = request.args.get('path')
+    low = request.args.get('low')
+    high = request.args.get('high')
+    blocks = file_blocks(path)
+    if blocks is None:
         return {
-            "response": f"Column {col} doesn't exist",
+            "response": f"{path}: No such file or directory",
             "status": "EDFS400"
         }, 200
-    partitions, status = getPartitionIds(path, hash)
-    resultPromises = []
-    if status == 200:
-        with Pool(processes=max(len(partitions["Replica 1"]), len(partitions["Replica 2"]))) as pool:
-            if partitions["Replica 1"]:
-                resultPromises = [pool.apply_async(mapPartition, args=(path, partition, calcMax, col, debug)) for partition, _ in partitions["Replica 1"].items()]
-            elif partitions["Replica 2"]:
-                resultPromises = [pool.apply_async(mapPartition, args=(path, partition, calcMax, col, debug)) for partition, _ in partitions["Replica 2"].items()]
-            results = [promise.get() for promise in resultPromises]
-        pool.join()
-        response, red_status = reduce(results, cumulativeMax, debug)
+    if blocks and not (blocks[0].bucket_function or "").startswith("range-"):
         return {
-            "response": response,
-            "status": "EDFS"+str(red_status)
+            "response": f"readRange: {path} was not put with partitioning=range",
+            "status": "EDFS400"
         }, 200
-    return {
-        "response": partitions,
-        "status": "EDFS"+str(status)
-    }, 200
+    try:
+        low_value = lookup_key(low, blocks[0].bucket_function)[2] if low and blocks else None
+        high_value = lookup_key(high, blocks[0].bucket_function)[2] if high and blocks else None
+    except ValueError as e:
+        return {
+            "response": f"readRange: {e}",
+            "status": "EDFS400"
+        }, 200
+    blocks = [block for block in blocks if in_range(block, low_value, high_value)]
+    return Response(stream_with_context(stream_range(blocks, low, high)), mimetype='text/csv')
 
-@app.route('/getMin', methods=['GET'])
-def getMin() -> tuple[str, int]:
-    args = request.args.to_dict()
+def stream_range(blocks: list, low: str = None, high: str = None):
+    '''
+    Generator over the rows of a file put with partitioning=range between low and high as CSV text, sorted on the
+    range column and then on the original row order. The blocks of one range are read, filtered and sorted together,
+    so memory stays around one range
+    Arguments:
+        blocks - List of BlockInfo of the ranges to read
+        low, high - Bounds of the range column from the request
+    '''
+    if not blocks:
+        return
+    function = blocks[0].bucket_function
+    _, kind, _, column = BUCKET_FUNCTION.match(function).groups()
+    ranges = {}
+    for block in sorted(blocks, key=lambda block: (block.bucket, block.offset)):
+        ranges.setdefault(block.bucket, []).append(block)
+    header = True
+    for run in ranges.values():
+        frames = []
+        for block in run:
+            df, _ = read_partition_block(block)
+            if df is None:
+                raise IOError(f"No replica of block {block.blk_id} found")
+            frames.append(df)
+        df = pd.concat(frames) if len(frames) > 1 else frames[0]
+        df = df[key_rows(df, function, None, low, high)]
+        df = df.assign(range_key=range_values(df[column], kind == 'num')).sort_values(["range_key", "index"], kind="stable")
+        yield df.drop(columns=["range_key", "index"]).to_csv(index=False, header=header)
+        header = False
+
+def readPartitionContent(path: str, partition: int, columns: list = None) -> tuple[Union[pd.DataFrame, str], int]:
+    '''
+    Helper function to read and decode a partition of a file
+    Arguments:
+        path - Path of the file in the EDFS
+        partition - Partition number to be read (1-indexed)
+        columns - Only decode these columns if given
+    Returns:
+        df - The rows of the partition, including the index column, or an error message
+    '''
+    block = partition_block(path, partition)
+    df = read_partition_block(block, columns)[0] if block is not None else None
+    if df is None:
+        return f"No content found for partition {partition} of file {path}", 400
+    return df, 200
+
+def aggregate(args: dict, calc: Callable[[pd.DataFrame, str], tuple[dict, int]], combine: Callable[[list, bool], tuple[str, int]], description: str) -> tuple[object, int]:
+    '''
+    Helper function shared by getAvg, getMax and getMin. Maps calc over every partition of every file matched by path
+    in a process pool and reduces the results with combine
+    Arguments:
+        args - Arguments of the request: path, col and optionally hash, low, high, debug and regex
+        calc - The callback applied to the content of each partition
+        combine - The callback reducing the results of calc
+        description - Name of the aggregate used in error messages
+    '''
     path = args["path"]
     col = args["col"]
     hash = None
     if "hash" in args:
         hash = args["hash"]
+    low = args.get("low")
+    high = args.get("high")
     debug = False
     if "debug" in args:
         try:
             debug = literal_eval(args["debug"])
         except ValueError:
             pass
-    data, status = readPartitionContent(path, 1)
+    paths = expand_paths(path, get_bool_arg(args, 'regex'))
+    if not paths:
+        return {
+            "response": f"{path}: No such file or directory",
+            "status": "EDFS400"
+        }, 200
+    df, status = readPartitionContent(paths[0], 1)
     if status != 200:
-        return data, status
-    csvStringIO = StringIO(data)
-    df = pd.read_csv(csvStringIO, sep=",")
+        return df, status
     try:
         if not np.issubdtype(df[col].dtypes, np.number):
             return {
-                "response": f"Cannot calculate min on column {col}: Data not numeric",
+                "response": f"Cannot calculate {description} on column {col}: Data not numeric",
                 "status": "EDFS400"
             }, 200
     except KeyError:
@@ -676,57 +3653,123 @@ def getMin() -> tuple[str, int]:
             "response": f"Column {col} doesn't exist",
             "status": "EDFS400"
         }, 200
-    partitions, status = getPartitionIds(path, hash)
-    resultPromises = []
-    if status == 200:
-        with Pool(processes=max(len(partitions["Replica 1"]), len(partitions["Replica 2"]))) as pool:
-            if partitions["Replica 1"]:
-                resultPromises = [pool.apply_async(mapPartition, args=(path, partition, calcMin, col, debug)) for partition, _ in partitions["Replica 1"].items()]
-            elif partitions["Replica 2"]:
-                resultPromises = [pool.apply_async(mapPartition, args=(path, partition, calcMin, col, debug)) for partition, _ in partitions["Replica 2"].items()]
-            results = [promise.get() for promise in resultPromises]
-        pool.join()
-        response, red_status = reduce(results, cumulativeMin, debug)
+    tasks = []
+    widest = 0
+    for file_path in paths:
+        blocks = partition_blocks(file_path, hash, low, high)
+        if blocks is None:
+            return {
+                "response": f"{file_path}: No such file or directory",
+                "status": "EDFS400"
+            }, 200
+        tasks.extend((file_path, block) for block in blocks)
+        widest = max(widest, len(blocks))
+    if not tasks:
         return {
-            "response": response,
-            "status": "EDFS"+str(red_status)
+            "response": f"No partitions found for {path}",
+            "status": "EDFS200"
         }, 200
+    if PARTITION_CACHE_BYTES > 0 and all(partition_cache.contains(block.blk_id, partition_columns(block, col, debug, hash, low, high)[0]) for _, block in tasks):
+        # Nothing to read or parse, forking the mappers would cost more than the aggregation
+        results = [mapPartition(file_path, block, calc, col, debug, hash, low, high) for file_path, block in tasks]
+    else:
+        with Pool(processes=min(len(tasks), max(MAX_THREADS, widest))) as pool:
+            resultPromises = [pool.apply_async(mapPartition, args=(file_path, block, calc, col, debug, hash, low, high)) for file_path, block in tasks]
+            results = [promise.get() for promise in resultPromises]
+        pool.join()
+    for _, _, decoded in results:
+        if decoded is not None and PARTITION_CACHE_BYTES > 0:
+            partition_cache.put(*decoded)
+    response, red_status = reduce([(output, status) for output, status, _ in results], combine, debug)
     return {
-        "response": partitions,
-        "status": "EDFS"+str(status)
+        "response": response,
+        "status": "EDFS"+str(red_status)
     }, 200
 
-def mapPartition(path: str, partition: str, callback: Callable[[str, str], tuple[dict, int]], column: str, debug: bool = False) -> tuple[dict, int]:
+@app.route('/getAvg', methods = ['GET'])
+def getAvg() -> tuple[str, int]:
     '''
-    This function takes partition identified by partitionId and transforms the data in it according to the callback function
+    This function calculates the average of a column over the partitions of a file, or of every file matched by a pattern
+    Arguments:
+        path: Path of the file in the EDFS, or a glob pattern such as /data/*/part*.csv
+        col: Column to aggregate
+        Optional:
+            hash: Only read the partitions with this hash value
+            low, high: Only read the rows with a value of the range column between low and high, for files put with
+                partitioning=range (or hash), reading only the partitions whose range overlaps them
+            regex: true to match path as a regular expression on the full path instead of a glob
+            debug: True to explain the result of each partition
+    '''
+    return aggregate(request.args.to_dict(), calcAvg, combineAverages, "average")
+
+@app.route('/getMax', methods=['GET'])
+def getMax() -> tuple[str, int]:
+    '''
+    This function calculates the maximum of a column over the partitions of a file, or of every file matched by a pattern.
+    Takes the same arguments as getAvg
+    '''
+    return aggregate(request.args.to_dict(), calcMax, cumulativeMax, "max")
+
+@app.route('/getMin', methods=['GET'])
+def getMin() -> tuple[str, int]:
+    '''
+    This function calculates the minimum of a column over the partitions of a file, or of every file matched by a pattern.
+    Takes the same arguments as getAvg
+    '''
+    return aggregate(request.args.to_dict(), calcMin, cumulativeMin, "min")
+
+def partition_columns(block: BlockInfo, column: str, debug: bool = False, hash: str = None, low: str = None, high: str = None) -> tuple[Union[list, None], Union[str, None]]:
+    '''
+    Helper function returning the columns mapPartition decodes from block, which are also its key in the partition cache
+    Returns:
+        columns - column, plus the range or hash column when the rows are filtered on it, or None for all of them with debug
+        function - Bucket function of the block if its rows are filtered on hash, low or high, else None
+    '''
+    columns = None if debug else [column]
+    function = block.bucket_function if hash or low or high else None
+    if function is not None:
+        key_column = BUCKET_FUNCTION.match(function).group(4)
+        if columns is not None and key_column != column:
+            columns.append(key_column)
+    return columns, function
+
+def mapPartition(path: str, block: BlockInfo, callback: Callable[[pd.DataFrame, str], tuple[dict, int]], column: str, debug: bool = False, hash: str = None, low: str = None, high: str = None) -> tuple[dict, int, Union[tuple, None]]:
+    '''
+    This function takes the partition stored in block and transforms the data in it according to the callback function
     Arguments:
         path - The path of the file in the EDFS
-        partition - Partition number of the partition
+        block - BlockInfo of the partition
         callback - The callback function used to transform the data in the partition
+        hash - Hash value the partition was picked for, its other rows are left out if the file is hash or range partitioned
+        low, high - Range the partition was picked for, its rows outside of it are left out
     Returns:
         res - The data after transforming the content from the partition
+        status - Status of the transformation
+        decoded - (blk_id, columns, df) to be cached by the server if a PMR worker had to read the partition, else None
     '''
-    res, status = readPartitionContent(path, partition)
-    if status == 200:
+    columns, function = partition_columns(block, column, debug, hash, low, high)
+    res, miss = read_partition_block(block, columns)
+    decoded = (block.blk_id, columns, res) if miss and res is not None and parent_process() is not None else None
+    if res is not None and function is not None:
+        res = res[key_rows(res, function, hash, low, high)]
+    if res is not None:
         output, s = callback(res, column)
         if s == 200 and debug:
             output["explanation"] = {
-                "Partition": partition,
-                "Input": res,
+                "Partition": str(block.offset + 1),
+                "Input": res.to_csv(index=False),
                 "Output": output["data"]
             }
-        return output, s
+        return output, s, decoded
     return {
-        "message": res,
+        "message": f"No content found for partition {block.offset + 1} of file {path}",
         "data": {}
-    }, status
+    }, 400, None
 
 def reduce(results: list, callback: Callable[[list, bool], tuple[str, int]], debug: bool = False) -> tuple[str, int]:
     return callback(results, debug)
 
-def calcAvg(data: str, col: str) -> tuple[dict, int]:
-    csvStringIO = StringIO(data)
-    df = pd.read_csv(csvStringIO, sep=",")
+def calcAvg(df: pd.DataFrame, col: str) -> tuple[dict, int]:
     return {
         "message": "Successfully calculated average",
         "data": {
@@ -735,9 +3778,7 @@ def calcAvg(data: str, col: str) -> tuple[dict, int]:
         }
     }, 200
 
-def calcMax(data: str, col: str) -> tuple[dict, int]:
-    csvStringIO = StringIO(data)
-    df = pd.read_csv(csvStringIO, sep=",")
+def calcMax(df: pd.DataFrame, col: str) -> tuple[dict, int]:
     df = df.fillna(0)
     return {
         "message": "Successfully calculated maximum",
@@ -747,9 +3788,7 @@ def calcMax(data: str, col: str) -> tuple[dict, int]:
         }
     }, 200
 
-def calcMin(data: str, col: str) -> tuple[dict, int]:
-    csvStringIO = StringIO(data)
-    df = pd.read_csv(csvStringIO, sep=",")
+def calcMin(df: pd.DataFrame, col: str) -> tuple[dict, int]:
     df = df.fillna(inf)
     return {
         "message": "Successfully calculated minimum",
@@ -1108,9 +4147,9 @@ def firebase_cat() -> tuple[object, int]:
             "status": "EDFS204"
         }, 200
     
-    d_urls = [FIREBASE_URL + DATANODE + str(block['datanode_id']) + '/' + str(block_id) + JSON for block_id, block in blocks.items()]
+    d_urls = [(FIREBASE_URL + DATANODE + str(block['datanode_id']) + '/' + str(block_id) + JSON, block) for block_id, block in blocks.items()]
     with Pool(processes=min(len(d_urls), MAX_THREADS)) as pool:
-        resultPromises = [pool.apply_async(getURLContents, args=(d_url,)) for d_url in d_urls]
+        resultPromises = [pool.apply_async(getURLContents, args=(d_url, block)) for d_url, block in d_urls]
         results = [promise.get() for promise in resultPromises]
     pool.join()
     df = pd.concat(results)
@@ -1123,25 +4162,68 @@ def firebase_cat() -> tuple[object, int]:
         "status": "EDFS200"
     }, 200
 
-def getURLContents(d_url: str):
+def firebase_block_content(data: str, block: dict) -> str:
+    '''
+    Helper function returning the CSV text of a block read from a Firebase datanode
+    Arguments:
+        data - The stored content of the block
+        block - The metadata of the block in its inode
+    '''
+    compression = block.get('compression', 'none')
+    if compression == 'none':
+        return data
+    if compression not in COMPRESSION_CODECS:
+        raise ValueError(f"Block is compressed with {compression}, which is not installed")
+    return COMPRESSION_CODECS[compression].decompress(b64decode(data), block.get('raw_bytes')).decode()
+
+def getURLContents(d_url: str, block: dict):
     r = requests.get(d_url)
-    csvStringIO = StringIO(r.json())
+    csvStringIO = StringIO(firebase_block_content(r.json(), block))
     part_df = pd.read_csv(csvStringIO, sep=",")
     return part_df
 
+def firebase_upload_batch(session: requests.Session, datanode_id: str, batch: dict) -> None:
+    '''
+    Helper function for firebase_put sending a batch of replicas to a datanode with one PATCH, raises if Firebase
+    doesn't acknowledge it
+    '''
+    r = session.patch(FIREBASE_URL + DATANODE + datanode_id + JSON, data=json.dumps(batch))
+    r.raise_for_status()
+
+def firebase_add_count(session: requests.Session, datanode_id: str, added: int) -> None:
+    '''
+    Helper function for firebase_put adding the replicas it stored on a datanode to the count in its metadata
+    '''
+    url = FIREBASE_URL + DATANODE + METADATA + datanode_id + JSON
+    r = session.get(url)
+    r.raise_for_status()
+    r = session.patch(url, data=json.dumps({"count": r.json()['count'] + added}))
+    r.raise_for_status()
+
 @app.route('/firebase_put', methods=['GET'])
 def firebase_put() -> tuple[object, int]:
     '''
-    This function puts the file specified into the EDFS. Returns error if the path is invalid or file is invalid
+    This function puts the file specified into the EDFS. Returns error if the path is invalid or file is invalid.
+    The blocks are uploaded to all datanodes concurrently in batches (see UploadLanes), and the inode is only written
+    once every replica is acknowledged
     Arguments:
         source: Path of the file in the local file system
         destination: Path of the file in the EDFS
         Optional:
             partitions: Number of partitions of the file to be stored
             hash: The column on which the file is to be hashed
+            compression: Compression of the stored blocks, none, zlib, lzma, zstd or lz4 (default BLOCK_COMPRESSION)
+            partitioning: value for a partition per distinct value of hash (default), or hash for exactly partitions
+                buckets of hash, picked by a stable hash of the value (see bucket_ids)
     '''
     args = request.args.to_dict()
     source = args['source']
+    compression = args.get('compression', BLOCK_COMPRESSION)
+    if compression not in COMPRESSION_CODECS:
+        return {
+            "response": f"put: Unsupported compression: {compression}",
+            "status": "EDFS400"
+        }, 200
     if not os.path.exists(source):
         return {
             "response": f"put: File does not exist: {source}",
@@ -1169,6 +4251,14 @@ def firebase_put() -> tuple[object, int]:
     hash_attr = 0
     if 'hash' in args:
         hash_attr = args['hash']
+    partitioning = args.get('partitioning', 'value')
+    # Firebase blocks have no range bounds, so range partitioning is left to put
+    if partitioning not in ("value", "hash") or (partitioning == 'hash' and 'hash' not in args):
+        return {
+            "response": f"put: Unsupported partitioning: {partitioning}" if partitioning not in ("value", "hash") else \
+                "put: partitioning=hash needs a hash column",
+            "status": "EDFS400"
+        }, 200
 
     # 4 Steps:
     ## update in datanode
@@ -1199,78 +4289,135 @@ def firebase_put() -> tuple[object, int]:
     df = pd.read_csv(source)
     df = df.reset_index()
 
-    try:
-        # If hash_attr is given, we hash and partition on that value
-        # Since we are hashing on an attribute, the number of partitions is decided by number of unique values of that attribute
-        # if file can be stored in number of partitions lesser than mentioned by user, then we pick the lesser value
-        # we are not implementing bucketing so even if a block is storing a partition of a file that is very small and there is memory wastage, we do not care
-        # write-once-read-many so we do not need think about what if file is modified
-
-        if np.issubdtype(df[hash_attr].dtypes, np.number):
-            df[hash_attr].fillna(0, inplace=True)
-        else:
-            df[hash_attr].fillna("NULL", inplace=True)
-        grouped_df = df.groupby(by=hash_attr)
-        number_of_groups = len(grouped_df)
-        if number_of_groups > partitions:
-            partitions = number_of_groups
+    function = None
+    if partitioning == 'hash':
+        # Exactly partitions buckets, a bucket only takes several blocks if it outgrows FIREBASE_MAX_PARTITION_SIZE
+        if hash_attr not in df.columns:
+            return {
+                "response": f"put: Hash column {hash_attr} not found in {source}",
+                "status": "EDFS400"
+            }, 200
+        function = bucket_function(df[hash_attr].dtype, partitions, hash_attr)
+        grouped_df = df.groupby(bucket_ids(df[hash_attr], partitions))
+        partitions = ceil(file_size/FIREBASE_MAX_PARTITION_SIZE)
+    else:
+        try:
+            # If hash_attr is given, we hash and partition on that value
+            # Since we are hashing on an attribute, the number of partitions is decided by number of unique values of that attribute
+            # if file can be stored in number of partitions lesser than mentioned by user, then we pick the lesser value
+            # we are not implementing bucketing so even if a block is storing a partition of a file that is very small and there is memory wastage, we do not care
+            # write-once-read-many so we do not need think about what if file is modified
 
-    except KeyError:
-        # In case of a keyerror, i.e.,  no hash attribute given or hash attribute is incorrect, we
-        # will partition based on indices. Here, we will decide the number of partitions based on whether
-        # max_partition_size allows the file to be stored in the given number of partitions, or does is need more
+            if np.issubdtype(df[hash_attr].dtypes, np.number):
+                df[hash_attr] = df[hash_attr].fillna(0)
+            else:
+                df[hash_attr] = df[hash_attr].fillna("NULL")
+            grouped_df = df.groupby(by=hash_attr)
+            number_of_groups = len(grouped_df)
+            if number_of_groups > partitions:
+                partitions = number_of_groups
+
+        except KeyError:
+            # In case of a keyerror, i.e.,  no hash attribute given or hash attribute is incorrect, we
+            # will partition based on indices. Here, we will decide the number of partitions based on whether
+            # max_partition_size allows the file to be stored in the given number of partitions, or does is need more
 
-        if ceil(file_size/partitions) > FIREBASE_MAX_PARTITION_SIZE:
-            partitions = ceil(file_size/FIREBASE_MAX_PARTITION_SIZE)
-        df["hash"] = pd.cut(x=df[df.columns[0]], bins=partitions)
-        df["hash"] = df["hash"].astype(str)
-        grouped_df = df.groupby(by="hash")
-        del df["hash"]
+            if ceil(file_size/partitions) > FIREBASE_MAX_PARTITION_SIZE:
+                partitions = ceil(file_size/FIREBASE_MAX_PARTITION_SIZE)
+            df["hash"] = pd.cut(x=df[df.columns[0]], bins=partitions)
+            df["hash"] = df["hash"].astype(str)
+            grouped_df = df.groupby(by="hash")
+            del df["hash"]
 
-    partition_size = ceil(file_size/partitions)
-    rows_per_partition = ceil((df.shape[0]*partition_size)/file_size)
+    sizer = BlockSizer(ceil(file_size/partitions), 'csv')
 
-    ## generate blocks and datanodes
+    ## generate blocks and upload them to the datanodes
+    # Each datanode gets a lane with a session of its own, a batch is sent as soon as PUT_BATCH_BYTES are pending for it
     block_number_offset = 0
     blocks = {}
     actual_total_partitions = 0
-    additions_in_datanodes = {str(i): {} for i in range(1, NUMBER_OF_DATANODES+1)}
+    lanes = UploadLanes()
+    sessions = {str(i): requests.Session() for i in range(1, NUMBER_OF_DATANODES+1)}
+    pending = {datanode_id: {} for datanode_id in sessions}
+    pending_bytes = {datanode_id: 0 for datanode_id in sessions}
+    uploaded = {datanode_id: [] for datanode_id in sessions}
+
+    def submit(datanode_id: str) -> None:
+        batch = pending[datanode_id]
+        batch['empty'] = False
+        pending[datanode_id] = {}
+        pending_bytes[datanode_id] = 0
+        lanes.submit(datanode_id, firebase_upload_batch, sessions[datanode_id], datanode_id, batch)
+
     hash_count = -1
-    for hash_val, hash_df in grouped_df:
-        hash_count += 1
-        if isinstance(hash_val, str) and hash_val[0] == '(' and hash_val[-1] == ']':
-            hash_val = 'index_' + str(hash_count)
-        hash_num_partitions = ceil(hash_df.shape[0]/rows_per_partition)
-        actual_total_partitions += hash_num_partitions        
-        for order, chunk_df in enumerate(np.array_split(hash_df, hash_num_partitions)):
-            chunk_str = chunk_df.to_csv(index=False)
-            chunk_size = len(chunk_str) + 1
-            datanode_nums = sample(range(1, NUMBER_OF_DATANODES+1), REPLICATION_FACTOR)
-            for rep_i in range(REPLICATION_FACTOR):
-                block = {}
-                block_id = "".join(choices(string.ascii_letters, k=32))
-                block['block_num'] = block_number_offset
-                block['datanode_id'] = datanode_nums[rep_i]
-                block['hash_attr_val'] = hash_val
-                block['num_bytes'] = chunk_size
-                block['order'] = order
-                block['replica_num'] = rep_i+1
-                blocks[block_id] = block
-
-                datanode_id = str(datanode_nums[rep_i])
-                additions_in_datanodes[datanode_id]['empty'] = False
-                additions_in_datanodes[datanode_id][block_id] = chunk_str
-            block_number_offset += 1
-
-    ## update in datanode and datanode_metadata
-    for datanode_id, datanode in additions_in_datanodes.items():
-        datanode_url = FIREBASE_URL + DATANODE + datanode_id + JSON
-        r = requests.patch(datanode_url, data=json.dumps(datanode))
-        datanode_metadata_url = FIREBASE_URL + DATANODE + METADATA + datanode_id  + JSON
-        r = requests.get(datanode_metadata_url)
-        datanode_metadata_count = {"count" : r.json()['count'] + len(datanode)-1}
-        r = requests.patch(datanode_metadata_url, data=json.dumps(datanode_metadata_count))
+    try:
+        for hash_val, hash_df in grouped_df:
+            hash_count += 1
+            if function is not None:
+                hash_val = int(hash_val)
+            if isinstance(hash_val, str) and hash_val[0] == '(' and hash_val[-1] == ']':
+                hash_val = 'index_' + str(hash_count)
+            cut = sizer.cut(hash_df)
+            actual_total_partitions += len(cut)
+            for order, (chunk_df, raw) in enumerate(cut):
+                raw_bytes = len(raw)
+                if compression != 'none':
+                    # Firebase only stores JSON, so compressed blocks are kept as base64
+                    chunk_str = b64encode(COMPRESSION_CODECS[compression].compress(raw)).decode()
+                else:
+                    chunk_str = raw.decode()
+                chunk_size = len(chunk_str)
+                datanode_nums = sample(range(1, NUMBER_OF_DATANODES+1), REPLICATION_FACTOR)
+                for rep_i in range(REPLICATION_FACTOR):
+                    block = {}
+                    block_id = "".join(choices(string.ascii_letters, k=32))
+                    block['block_num'] = block_number_offset
+                    block['datanode_id'] = datanode_nums[rep_i]
+                    block['hash_attr_val'] = hash_val
+                    block['num_bytes'] = chunk_size
+                    block['order'] = order
+                    block['replica_num'] = rep_i+1
+                    block['compression'] = compression
+                    block['raw_bytes'] = raw_bytes
+                    if function is not None:
+                        block['bucket'] = hash_val
+                        block['bucket_function'] = function
+                    blocks[block_id] = block
 
+                    datanode_id = str(datanode_nums[rep_i])
+                    pending[datanode_id][block_id] = chunk_str
+                    pending_bytes[datanode_id] += chunk_size
+                    uploaded[datanode_id].append(block_id)
+                    if pending_bytes[datanode_id] >= PUT_BATCH_BYTES:
+                        submit(datanode_id)
+                block_number_offset += 1
+        for datanode_id in sessions:
+            if pending[datanode_id]:
+                submit(datanode_id)
+        lanes.wait()
+
+        ## update in datanode_metadata, once every replica is acknowledged
+        for datanode_id, block_ids in uploaded.items():
+            if block_ids:
+                lanes.submit(datanode_id, firebase_add_count, sessions[datanode_id], datanode_id, len(block_ids))
+        lanes.wait()
+    except requests.RequestException as e:
+        # Firebase has no transactions, so take back the replicas that made it before the inode points to them
+        lanes.close(cancel=True)
+        for datanode_id, block_ids in uploaded.items():
+            if block_ids:
+                try:
+                    sessions[datanode_id].patch(FIREBASE_URL + DATANODE + datanode_id + JSON, data=json.dumps(dict.fromkeys(block_ids)))
+                except requests.RequestException:
+                    pass
+        return {
+            "response": f"put: Upload to the datanodes failed: {e}",
+            "status": "EDFS400"
+        }, 200
+    finally:
+        lanes.close(cancel=True)
+        for session in sessions.values():
+            session.close()
 
     ## update in inode
     curr_inode['blocks'] = blocks
@@ -1325,7 +4472,15 @@ def firebase_getPartitionIds(path: str, inode_num: int, hash_attr_val: str = Non
         "Replica 2": dict()
     }
     blocks = curr_inode.get('blocks', {})
-    if hash_attr_val:
+    functions = [block['bucket_function'] for block in blocks.values() if block.get('bucket_function')]
+    if hash_attr_val and functions:
+        # Hash partitioned, only the bucket of the key can hold it
+        try:
+            bucket = key_bucket(lookup_key(hash_attr_val, functions[0])[0], functions[0])
+        except ValueError:
+            bucket = None
+        blocks = {block_id: block for block_id, block in blocks.items() if block.get('bucket') == bucket}
+    elif hash_attr_val:
         try:
             hash_attr_val = literal_eval(hash_attr_val)
         except ValueError:
@@ -1372,7 +4527,7 @@ def firebase_readPartition() -> tuple[object, int]:
         "status": "EDFS"+str(status)
     }, 200
 
-def firebase_readPartitionContent(path: str, inode_num: int, partition: int) -> tuple[str, int]:
+def firebase_readPartitionContent(path: str, inode_num: int, partition: int, hash: str = None) -> tuple[str, int]:
 
     inode_name = str(inode_num) + '_' + \
         list(filter(None, path.split("/")))[-1].replace('.', '_')
@@ -1393,7 +4548,12 @@ def firebase_readPartitionContent(path: str, inode_num: int, partition: int) ->
     if not data or len(data) == 0:
         return f"No content found for partition {partition} of file {path}", 400
 
-    return data, 200
+    content = firebase_block_content(data, block)
+    if hash and block.get('bucket_function'):
+        # The bucket of a hash partitioned file also holds other keys
+        df = pd.read_csv(StringIO(content))
+        content = df[key_rows(df, block['bucket_function'], hash)].to_csv(index=False)
+    return content, 200
 
 @app.route('/firebase_getAvg', methods=['GET'])
 def firebase_getAvg() -> tuple[str, int]:
@@ -1442,10 +4602,10 @@ def firebase_getAvg() -> tuple[str, int]:
         with Pool(processes=max(len(partitions["Replica 1"]), len(partitions["Replica 2"]))) as pool:
             if partitions["Replica 1"]:
                 resultPromises = [pool.apply_async(firebase_mapPartition, args=(
-                    path, inode_num, partition, firebase_calcAvg, col, debug)) for partition, _ in partitions["Replica 1"].items()]
+                    path, inode_num, partition, firebase_calcAvg, col, debug, hash)) for partition, _ in partitions["Replica 1"].items()]
             elif partitions["Replica 2"]:
                 resultPromises = [pool.apply_async(firebase_mapPartition, args=(
-                    path, inode_num, partition, firebase_calcAvg, col, debug)) for partition, _ in partitions["Replica 2"].items()]
+                    path, inode_num, partition, firebase_calcAvg, col, debug, hash)) for partition, _ in partitions["Replica 2"].items()]
             results = [promise.get() for promise in resultPromises]
         pool.join()
         response, red_status = firebase_reduce(results, firebase_combineAverages, debug)
@@ -1502,10 +4662,10 @@ def firebase_getMax() -> tuple[str, int]:
         with Pool(processes=max(len(partitions["Replica 1"]), len(partitions["Replica 2"]))) as pool:
             if partitions["Replica 1"]:
                 resultPromises = [pool.apply_async(firebase_mapPartition, args=(
-                    path, inode_num, partition, firebase_calcMax, col, debug)) for partition, _ in partitions["Replica 1"].items()]
+                    path, inode_num, partition, firebase_calcMax, col, debug, hash)) for partition, _ in partitions["Replica 1"].items()]
             elif partitions["Replica 2"]:
                 resultPromises = [pool.apply_async(firebase_mapPartition, args=(
-                    path, inode_num, partition, firebase_calcMax, col, debug)) for partition, _ in partitions["Replica 2"].items()]
+                    path, inode_num, partition, firebase_calcMax, col, debug, hash)) for partition, _ in partitions["Replica 2"].items()]
             results = [promise.get() for promise in resultPromises]
         pool.join()
         response, red_status = firebase_reduce(results, firebase_cummulativeMax, debug)
@@ -1562,10 +4722,10 @@ def firebase_getMin() -> tuple[str, int]:
         with Pool(processes=max(len(partitions["Replica 1"]), len(partitions["Replica 2"]))) as pool:
             if partitions["Replica 1"]:
                 resultPromises = [pool.apply_async(firebase_mapPartition, args=(
-                    path, inode_num, partition, firebase_calcMin, col, debug)) for partition, _ in partitions["Replica 1"].items()]
+                    path, inode_num, partition, firebase_calcMin, col, debug, hash)) for partition, _ in partitions["Replica 1"].items()]
             elif partitions["Replica 2"]:
                 resultPromises = [pool.apply_async(firebase_mapPartition, args=(
-                    path, inode_num, partition, firebase_calcMin, col, debug)) for partition, _ in partitions["Replica 2"].items()]
+                    path, inode_num, partition, firebase_calcMin, col, debug, hash)) for partition, _ in partitions["Replica 2"].items()]
             results = [promise.get() for promise in resultPromises]
         pool.join()
         response, red_status = firebase_reduce(results, firebase_cummulativeMin, debug)
@@ -1575,7 +4735,7 @@ def firebase_getMin() -> tuple[str, int]:
         }, 200
     return partitions, status
     
-def firebase_mapPartition(path: str, inode_num: int, partition: str, callback: Callable[[str], tuple[dict, int]], column: str, debug: bool = False) -> tuple[dict, int]:
+def firebase_mapPartition(path: str, inode_num: int, partition: str, callback: Callable[[str], tuple[dict, int]], column: str, debug: bool = False, hash: str = None) -> tuple[dict, int]:
     '''
     This function takes partition identified by partitionId and transforms the data in it according to the callback function
     Arguments:
@@ -1584,10 +4744,11 @@ def firebase_mapPartition(path: str, inode_num: int, partition: str, callback: C
         partition - Partition number of the partition
         column - name of the column whose average you want to find
         callback - The callback function used to transform the data in the partition
+        hash - Hash value the partition was picked for, its other rows are left out if the file is hash partitioned
     Returns:
         res - The data after transforming the content from the partition
     '''
-    res, status = firebase_readPartitionContent(path, inode_num, int(partition))
+    res, status = firebase_readPartitionContent(path, inode_num, int(partition), hash)
     if status == 200:
         output, s = callback(res, column)
         if s == 200 and debug:
@@ -12,10 +12,15 @@ CREATE TABLE IF NOT EXISTS Namenode
   atime TIMESTAMP,
   ctime TIMESTAMP NOT NULL,
   permission SMALLINT NOT NULL,
-  PRIMARY KEY (inode_num)
+  name_digest BINARY(16) AS (UNHEX(MD5(name))) STORED,
+  num_bytes BIGINT NOT NULL DEFAULT 0,
+  num_rows BIGINT NULL,
+  num_partitions INT NOT NULL DEFAULT 0,
+  PRIMARY KEY (inode_num),
+  UNIQUE INDEX namenode_name_digest (name_digest)
 );
 
-INSERT INTO Namenode VALUES (UUID(), 'd', '/', NULL, NULL, NULL, NOW(), 755);
+INSERT INTO Namenode (inode_num, node_type, name, replication, mtime, atime, ctime, permission) VALUES (UUID(), 'd', '/', NULL, NULL, NULL, NOW(), 755);
 
 CREATE TABLE IF NOT EXISTS Block_info_table
 (
@@ -28,61 +33,57 @@ CREATE TABLE IF NOT EXISTS Block_info_table
   replica1_datanode_num SMALLINT NOT NULL,
   replica2_data_blk_id VARCHAR(32) NOT NULL,
   replica2_datanode_num SMALLINT NOT NULL,
+  format VARCHAR(16) NOT NULL DEFAULT 'csv',
+  compression VARCHAR(16) NOT NULL DEFAULT 'none',
+  raw_bytes BIGINT NULL,
+  bucket INT NULL,
+  bucket_function VARCHAR(255) NULL,
+  range_low VARCHAR(255) NULL,
+  range_high VARCHAR(255) NULL,
   PRIMARY KEY (blk_id),
+  INDEX block_file_offset (file_inode, offset),
+  INDEX block_file_hash (file_inode, hash_attribute),
   FOREIGN KEY (file_inode) REFERENCES Namenode(inode_num) ON UPDATE CASCADE ON DELETE CASCADE
 );
 
 CREATE TABLE IF NOT EXISTS Datanode_1
 (
   data_block_id VARCHAR(32),
-  content TEXT,
+  content LONGBLOB,
   PRIMARY KEY (data_block_id)
 );
 
 CREATE TABLE IF NOT EXISTS Datanode_2
 (
   data_block_id VARCHAR(32),
-  content TEXT,
+  content LONGBLOB,
   PRIMARY KEY (data_block_id)
 );
 
 CREATE TABLE IF NOT EXISTS Datanode_3
 (
   data_block_id VARCHAR(32),
-  content TEXT,
+  content LONGBLOB,
   PRIMARY KEY (data_block_id)
 );
 
-DROP TRIGGER IF EXISTS data_blk_id_chk;
-DELIMITER &&
-CREATE TRIGGER data_blk_id_chk
-  BEFORE INSERT ON Block_info_table
-  FOR EACH ROW
-  BEGIN
-    DECLARE count INT;
-    IF new.replica1_datanode_num = 1 THEN
-    	SELECT COUNT(*) FROM Datanode_1 WHERE data_block_id=new.replica1_data_blk_id INTO count;
-    ELSEIF new.replica1_datanode_num = 2 THEN
-    	SELECT COUNT(*) FROM Datanode_2 WHERE data_block_id=new.replica1_data_blk_id INTO count;
-    ELSE
-    	SELECT COUNT(*) FROM Datanode_3 WHERE data_block_id=new.replica1_data_blk_id INTO count;
-    END IF;
-    IF count < 1 THEN
-    	SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'Foreign key constraint fails for Block_info_table!';
-    END IF;
-    IF new.replica2_datanode_num = 1 THEN
-    	SELECT COUNT(*) FROM Datanode_1 WHERE data_block_id=new.replica2_data_blk_id INTO count;
-    ELSEIF new.replica2_datanode_num = 2 THEN
-    	SELECT COUNT(*) FROM Datanode_2 WHERE data_block_id=new.replica2_data_blk_id INTO count;
-    ELSE
-    	SELECT COUNT(*) FROM Datanode_3 WHERE data_block_id=new.replica2_data_blk_id INTO count;
-    END IF;
-    IF count < 1 THEN
-    	SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'Foreign key constraint fails for Block_info_table!';
-    END IF;
-  END
-&&
-DELIMITER ;
+-- Datanodes are registered here instead of being hard-coded; host/port/database_name are NULL for datanode tables
+-- in this database. Active datanodes get new blocks, readonly ones are only read from.
+-- Datanodes with a directory keep one file per replica there and have no table
+CREATE TABLE IF NOT EXISTS Datanode_registry
+(
+  datanode_num SMALLINT,
+  table_name VARCHAR(64) NULL,
+  host VARCHAR(255) NULL,
+  port INT NULL,
+  database_name VARCHAR(64) NULL,
+  weight SMALLINT NOT NULL DEFAULT 1,
+  state VARCHAR(16) NOT NULL DEFAULT 'active',
+  directory VARCHAR(1000) NULL,
+  PRIMARY KEY (datanode_num)
+);
+
+INSERT INTO Datanode_registry (datanode_num, table_name) VALUES (1, 'Datanode_1'), (2, 'Datanode_2'), (3, 'Datanode_3');
 
 CREATE TABLE IF NOT EXISTS Parent_Child
 (
@@ -91,4 +92,37 @@ CREATE TABLE IF NOT EXISTS Parent_Child
   PRIMARY KEY (child_inode),
   FOREIGN KEY (parent_inode) REFERENCES Namenode(inode_num) ON UPDATE CASCADE ON DELETE CASCADE,
   FOREIGN KEY (child_inode) REFERENCES Namenode(inode_num) ON UPDATE CASCADE ON DELETE CASCADE
-);
\ No newline at end of file
+);
+
+CREATE TABLE IF NOT EXISTS Namespace_generation
+(
+  id TINYINT,
+  generation BIGINT NOT NULL,
+  PRIMARY KEY (id)
+);
+
+INSERT INTO Namespace_generation VALUES (1, 0);
+
+-- Every change to the namespace bumps the generation so that servers caching the namespace tree can detect it
+CREATE TRIGGER namenode_insert_generation AFTER INSERT ON Namenode
+  FOR EACH ROW UPDATE Namespace_generation SET generation = generation + 1 WHERE id = 1;
+CREATE TRIGGER namenode_update_generation AFTER UPDATE ON Namenode
+  FOR EACH ROW UPDATE Namespace_generation SET generation = generation + 1 WHERE id = 1;
+CREATE TRIGGER namenode_delete_generation AFTER DELETE ON Namenode
+  FOR EACH ROW UPDATE Namespace_generation SET generation = generation + 1 WHERE id = 1;
+CREATE TRIGGER parent_child_insert_generation AFTER INSERT ON Parent_Child
+  FOR EACH ROW UPDATE Namespace_generation SET generation = generation + 1 WHERE id = 1;
+CREATE TRIGGER parent_child_update_generation AFTER UPDATE ON Parent_Child
+  FOR EACH ROW UPDATE Namespace_generation SET generation = generation + 1 WHERE id = 1;
+CREATE TRIGGER parent_child_delete_generation AFTER DELETE ON Parent_Child
+  FOR EACH ROW UPDATE Namespace_generation SET generation = generation + 1 WHERE id = 1;
+
+-- Versions of the files in migrations/ that are already part of this schema
+CREATE TABLE IF NOT EXISTS Schema_version
+(
+  version INT,
+  applied_at TIMESTAMP NOT NULL,
+  PRIMARY KEY (version)
+);
+
+INSERT INTO Schema_version VALUES (1, NOW()), (2, NOW()), (3, NOW()), (4, NOW()), (5, NOW()), (6, NOW()), (7, NOW()), (8, NOW()), (9, NOW());
@@ -0,0 +1,80 @@
+import os
+import pymysql
+from dotenv import load_dotenv
+from pathlib import Path
+
+load_dotenv()
+
+HOST_NAME = os.environ.get('HOST')
+DB_USERNAME = os.environ.get('USERNAME')
+DB_PASSWORD = os.environ.get('PASSWORD')
+DATABASE = os.environ.get('DATABASE')
+MIGRATIONS_DIR = Path(__file__).parent / "migrations"
+
+def split_statements(script: str) -> list:
+    '''
+    Helper function to split a SQL script into statements the way the mysql client does
+    Arguments:
+        script - Content of the SQL file, may change the delimiter with DELIMITER lines
+    Returns:
+        statements - List of statements without their delimiter
+    '''
+    statements = []
+    delimiter = ";"
+    current = ""
+    for line in script.splitlines():
+        stripped = line.strip()
+        if stripped.upper().startswith("DELIMITER "):
+            delimiter = stripped.split()[1]
+            continue
+        if not current and (not stripped or stripped.startswith("--")):
+            continue
+        current += line + "\n"
+        if stripped.endswith(delimiter):
+            statements.append(current.rstrip()[:-len(delimiter)].strip())
+            current = ""
+    if current.strip():
+        statements.append(current.strip())
+    return statements
+
+def pending_migrations(applied: set) -> list:
+    '''
+    Helper function to list the migrations that have not been applied yet
+    Arguments:
+        applied - Set of versions found in Schema_version
+    Returns:
+        migrations - List of (version, file) in the order they have to be applied
+    '''
+    migrations = []
+    for file in sorted(MIGRATIONS_DIR.glob("*.sql")):
+        version = int(file.name.split("_")[0])
+        if version not in applied:
+            migrations.append((version, file))
+    return migrations
+
+def migrate() -> None:
+    '''
+    Applies every pending migration in migrations/ to the configured database and records it in Schema_version.
+    MySQL commits DDL implicitly, so a migration that fails halfway has to be fixed and re-run by hand
+    '''
+    conn = pymysql.connect(
+        host=HOST_NAME,
+        user=DB_USERNAME,
+        password = DB_PASSWORD,
+        database=DATABASE,
+        autocommit=True
+    )
+    cursor = conn.cursor()
+    cursor.execute("CREATE TABLE IF NOT EXISTS Schema_version (version INT, applied_at TIMESTAMP NOT NULL, PRIMARY KEY (version))")
+    cursor.execute("SELECT version FROM Schema_version")
+    applied = {row[0] for row in cursor.fetchall()}
+    for version, file in pending_migrations(applied):
+        print(f"Applying {file.name}")
+        for statement in split_statements(file.read_text()):
+            cursor.execute(statement)
+        cursor.execute("INSERT INTO Schema_version VALUES (%s, NOW())", (version,))
+    cursor.close()
+    conn.close()
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,29 @@
+-- Generation counter polled by servers that cache the namespace tree in memory
+CREATE TABLE IF NOT EXISTS Namespace_generation
+(
+  id TINYINT,
+  generation BIGINT NOT NULL,
+  PRIMARY KEY (id)
+);
+
+INSERT IGNORE INTO Namespace_generation VALUES (1, 0);
+
+DROP TRIGGER IF EXISTS namenode_insert_generation;
+DROP TRIGGER IF EXISTS namenode_update_generation;
+DROP TRIGGER IF EXISTS namenode_delete_generation;
+DROP TRIGGER IF EXISTS parent_child_insert_generation;
+DROP TRIGGER IF EXISTS parent_child_update_generation;
+DROP TRIGGER IF EXISTS parent_child_delete_generation;
+
+CREATE TRIGGER namenode_insert_generation AFTER INSERT ON Namenode
+  FOR EACH ROW UPDATE Namespace_generation SET generation = generation + 1 WHERE id = 1;
+CREATE TRIGGER namenode_update_generation AFTER UPDATE ON Namenode
+  FOR EACH ROW UPDATE Namespace_generation SET generation = generation + 1 WHERE id = 1;
+CREATE TRIGGER namenode_delete_generation AFTER DELETE ON Namenode
+  FOR EACH ROW UPDATE Namespace_generation SET generation = generation + 1 WHERE id = 1;
+CREATE TRIGGER parent_child_insert_generation AFTER INSERT ON Parent_Child
+  FOR EACH ROW UPDATE Namespace_generation SET generation = generation + 1 WHERE id = 1;
+CREATE TRIGGER parent_child_update_generation AFTER UPDATE ON Parent_Child
+  FOR EACH ROW UPDATE Namespace_generation SET generation = generation + 1 WHERE id = 1;
+CREATE TRIGGER parent_child_delete_generation AFTER DELETE ON Parent_Child
+  FOR EACH ROW UPDATE Namespace_generation SET generation = generation + 1 WHERE id = 1;
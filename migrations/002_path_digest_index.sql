@@ -0,0 +1,24 @@
+-- put used to accept a destination that already existed, so a path may name several inodes. A directory or else the
+-- oldest file keeps the path and the other files are renamed to <path>.duplicate-<inode_num>, which keeps their data
+-- reachable (ls, cat, rm) and lets the unique index below be built. mkdir always refused existing paths, so two
+-- directories can't share one; if they do the index fails and one of them has to be renamed by hand
+UPDATE Namenode nn
+  JOIN (
+    SELECT inode_num FROM (
+      SELECT inode_num, node_type,
+        ROW_NUMBER() OVER (PARTITION BY name ORDER BY node_type = 'd' DESC, ctime, inode_num) AS occurrence
+      FROM Namenode
+    ) ranked
+    WHERE occurrence > 1 AND node_type = '-'
+  ) duplicate ON duplicate.inode_num = nn.inode_num
+SET nn.name = CONCAT(nn.name, '.duplicate-', nn.inode_num);
+
+-- Namenode.name is VARCHAR(1000) and can't be indexed directly, so paths are looked up through an MD5 digest
+ALTER TABLE Namenode
+  ADD COLUMN name_digest BINARY(16) AS (UNHEX(MD5(name))) STORED,
+  ADD UNIQUE INDEX namenode_name_digest (name_digest);
+
+-- Partition reads filter on the file and its offset or hash attribute
+ALTER TABLE Block_info_table
+  ADD INDEX block_file_offset (file_inode, offset),
+  ADD INDEX block_file_hash (file_inode, hash_attribute);
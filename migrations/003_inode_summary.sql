@@ -0,0 +1,11 @@
+-- Per-inode summary kept up to date by put, so that stat and ls -l don't have to aggregate Block_info_table
+ALTER TABLE Namenode
+  ADD COLUMN num_bytes BIGINT NOT NULL DEFAULT 0,
+  ADD COLUMN num_rows BIGINT NULL,
+  ADD COLUMN num_partitions INT NOT NULL DEFAULT 0;
+
+-- Row counts of files written before this migration are unknown and stay NULL
+UPDATE Namenode nn
+  JOIN (SELECT file_inode, SUM(num_bytes) AS num_bytes, COUNT(*) AS num_partitions FROM Block_info_table GROUP BY file_inode) bi
+  ON bi.file_inode = nn.inode_num
+  SET nn.num_bytes = bi.num_bytes, nn.num_partitions = bi.num_partitions;
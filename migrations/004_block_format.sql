@@ -0,0 +1,8 @@
+-- Blocks are stored as bytes in the format named by Block_info_table.format (see BLOCK_CODECS)
+-- LONGBLOB also lifts the 64KB limit TEXT put on the size of a block
+ALTER TABLE Datanode_1 MODIFY content LONGBLOB;
+ALTER TABLE Datanode_2 MODIFY content LONGBLOB;
+ALTER TABLE Datanode_3 MODIFY content LONGBLOB;
+
+ALTER TABLE Block_info_table
+  ADD COLUMN format VARCHAR(16) NOT NULL DEFAULT 'csv';
@@ -0,0 +1,4 @@
+-- Compression of the stored block (see COMPRESSION_CODECS) and its size before compression, NULL if unknown
+ALTER TABLE Block_info_table
+  ADD COLUMN compression VARCHAR(16) NOT NULL DEFAULT 'none',
+  ADD COLUMN raw_bytes BIGINT NULL;
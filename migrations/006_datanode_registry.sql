@@ -0,0 +1,18 @@
+-- Datanodes are registered here instead of being hard-coded; host/port/database_name are NULL for datanode tables
+-- in this database. Active datanodes get new blocks, readonly ones are only read from
+CREATE TABLE IF NOT EXISTS Datanode_registry
+(
+  datanode_num SMALLINT,
+  table_name VARCHAR(64) NOT NULL,
+  host VARCHAR(255) NULL,
+  port INT NULL,
+  database_name VARCHAR(64) NULL,
+  weight SMALLINT NOT NULL DEFAULT 1,
+  state VARCHAR(16) NOT NULL DEFAULT 'active',
+  PRIMARY KEY (datanode_num)
+);
+
+INSERT INTO Datanode_registry (datanode_num, table_name) VALUES (1, 'Datanode_1'), (2, 'Datanode_2'), (3, 'Datanode_3');
+
+-- The trigger only knew Datanode_1..3 and cannot see datanodes on other MySQL instances
+DROP TRIGGER IF EXISTS data_blk_id_chk;
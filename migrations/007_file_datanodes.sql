@@ -0,0 +1,4 @@
+-- Datanodes with a directory keep one file per replica there and have no table
+ALTER TABLE Datanode_registry
+  MODIFY COLUMN table_name VARCHAR(64) NULL,
+  ADD COLUMN directory VARCHAR(1000) NULL;
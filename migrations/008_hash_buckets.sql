@@ -0,0 +1,4 @@
+-- Bucket of the blocks of files put with partitioning=hash and the function that maps a key to it, NULL otherwise
+ALTER TABLE Block_info_table
+  ADD COLUMN bucket INT NULL,
+  ADD COLUMN bucket_function VARCHAR(255) NULL;
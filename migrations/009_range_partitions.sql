@@ -0,0 +1,5 @@
+-- Range of the range column held by the blocks of files put with partitioning=range, JSON of the inclusive lower and
+-- exclusive upper split point, NULL if unbounded. The split points of a file are the bounds of its blocks
+ALTER TABLE Block_info_table
+  ADD COLUMN range_low VARCHAR(255) NULL,
+  ADD COLUMN range_high VARCHAR(255) NULL;